@@ -0,0 +1,7 @@
+# Load the Celery app with Django when Celery is installed, so shared_task uses it
+try:
+    from .celery import app as celery_app
+except ImportError:
+    celery_app = None
+
+__all__ = ['celery_app']
@@ -0,0 +1,10 @@
+# project/celery.py - Celery application, configured from the CELERY_* settings
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+app = Celery('project')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -48,17 +48,98 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # First, so its timings include the other middleware
+    'website.middleware.RequestMetricsMiddleware',
+    'website.middleware.RepeatedQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'website.middleware.PrimaryPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
 
+# Caches. The dashboard alias holds the versioned JSON responses of the
+# dashboard API (website/utils/dashboard_cache.py); the versions themselves are
+# in the database, so a save invalidates every worker. Local memory is per
+# process; set DASHBOARD_CACHE_DIR to share entries between workers through diskcache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+if os.environ.get('DASHBOARD_CACHE_DIR'):
+    CACHES['dashboard'] = {
+        'BACKEND': 'diskcache.DjangoCache',
+        'LOCATION': os.environ['DASHBOARD_CACHE_DIR'],
+        'TIMEOUT': 300,
+    }
+
+# Alert event stream (served under ASGI): saves wake the streams of their own
+# process; the poll interval (seconds) only bounds how late events written by
+# other processes arrive. Then seconds between heartbeat comments while idle,
+# and before the client must reconnect.
+ALERT_STREAM_POLL_INTERVAL = 3
+ALERT_STREAM_HEARTBEAT = 15
+ALERT_STREAM_MAX_SECONDS = 300
+
+# Background exports: 'worker' (manage.py run_export_jobs), 'celery' or
+# 'eager' (run in the requesting process, for tests and local development).
+# Finished files are deleted from MEDIA_ROOT after the retention period.
+EXPORT_JOB_BACKEND = os.environ.get('EXPORT_JOB_BACKEND', 'worker')
+EXPORT_JOB_RETENTION_HOURS = 24
+
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+
+# Request metrics (website/middleware.py), served at /metrics to staff users or
+# to scrapers sending "Authorization: Bearer <METRICS_TOKEN>". Requests slower
+# than SLOW_REQUEST_SECONDS are logged (a SLOW_REQUEST_SAMPLE_RATE fraction of
+# them) with their slowest queries; None turns the slow-request log off.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+SLOW_REQUEST_SECONDS = 1.0
+SLOW_REQUEST_SAMPLE_RATE = 1.0
+SLOW_REQUEST_TOP_QUERIES = 5
+
+# Repeated-query (N+1) detection (website/utils/query_inspection.py): with
+# DETECT_REPEATED_QUERIES=1 (staging), statements run more than
+# REPEATED_QUERY_THRESHOLD times in one request are logged to
+# website.repeated_queries with the code they came from. REPEATED_QUERY_RAISE
+# fails such requests instead, e.g. under the test runner.
+DETECT_REPEATED_QUERIES = os.environ.get('DETECT_REPEATED_QUERIES') == '1'
+REPEATED_QUERY_THRESHOLD = 5
+REPEATED_QUERY_RAISE = False
+
+# Incremental Parquet / Arrow snapshots written by manage.py export_clinical_snapshot.
+# Each run exports the changes older than CLINICAL_SNAPSHOT_LAG_SECONDS, longer
+# than any transaction takes to commit after stamping updated_at.
+CLINICAL_SNAPSHOT_DIR = os.environ.get('CLINICAL_SNAPSHOT_DIR', os.path.join(BASE_DIR, 'snapshots'))
+CLINICAL_SNAPSHOT_LAG_SECONDS = 60
+
+# Risk models (website/utils/risk_models.py). RISK_MODEL scores and persists the
+# forms; RISK_MODEL_DEFINITIONS declares extra models as data (name, version,
+# rules of field/op/threshold/points/label, levels of min_score/level/color/
+# description/recommendations), compiled at startup. Switching RISK_MODEL or
+# changing a model's version marks the stored scores stale for
+# manage.py backfill_risk_scores.
+RISK_MODEL = os.environ.get('RISK_MODEL', 'airway-basic')
+RISK_MODEL_DEFINITIONS = []
+
+# Per-process memo of AdvancedRiskCalculator results (website/utils/risk_memo.py),
+# keyed on the form's inputs, the calculator version and today's date: at most
+# RISK_MEMO_SIZE entries, each reused for RISK_MEMO_TTL seconds. 0 disables it.
+RISK_MEMO_SIZE = int(os.environ.get('RISK_MEMO_SIZE', '4096'))
+RISK_MEMO_TTL = 3600
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -80,14 +161,59 @@ WSGI_APPLICATION = 'project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# db.sqlite3 is a local file, ignored by git: create it with manage.py migrate.
+# The first connection switches it to WAL (see SQLITE_PRAGMAS below).
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections (and their pragmas) across requests, checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts: a deferred
+            # transaction that later needs to write fails with "database is
+            # locked" without waiting for busy_timeout
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Read replica for analytics (website/routers.py). When REPLICA_DATABASE_PATH
+# points at a copy of the database kept up to date outside Django (e.g. by
+# Litestream), the dashboard, statistics and export reads go to it; without
+# it they use the default database. A user who just saved something keeps
+# reading from the primary for REPLICA_PIN_SECONDS. The file is opened
+# read-only and keeps its own journal mode: only the replication tool writes it.
+REPLICA_DATABASE_PATH = os.environ.get('REPLICA_DATABASE_PATH')
+if REPLICA_DATABASE_PATH:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{REPLICA_DATABASE_PATH}?mode=ro',
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['website.routers.AnalyticsRouter']
+ANALYTICS_DATABASE = 'replica'
+REPLICA_PIN_SECONDS = 10
+
+# Pragmas applied to every new SQLite connection (website/utils/sqlite_tuning.py).
+# WAL lets the dashboards read while forms are being saved; it is stored in the
+# file, so it is only set on the default database. busy_timeout is how long a
+# writer waits for the lock (ms); mmap_size is in bytes and a negative
+# cache_size in KiB. SQLITE_TUNING=0 leaves connections at the SQLite defaults.
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '1') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -162,6 +288,12 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')  # Your email address
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')  # Your email password or app-specific password
 DEFAULT_FROM_EMAIL = os.environ.get('EMAIL_HOST_USER')
 CONTACT_EMAIL = os.environ.get('EMAIL_HOST_USER')  # Email where contact form submissions will be sent
+
+# Outbox delivered by manage.py send_outbox: failed emails are retried after
+# EMAIL_OUTBOX_RETRY_DELAY seconds, doubling each time, up to the attempt limit
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60
+
 PROTOCOL = 'http'
 
 # settings.py
@@ -187,18 +319,15 @@ LOGGING = {
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': os.environ.get('LOG_LEVEL', 'INFO'),
     },
     'loggers': {
+        # Both propagate to the root handler, so each record is printed once
         'django': {
-            'handlers': ['console'],
             'level': 'INFO',
-            'propagate': True,
         },
-        'your_app_name': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+        'website': {
+            'level': os.environ.get('LOG_LEVEL', 'INFO'),
         },
     }
 }
\ No newline at end of file
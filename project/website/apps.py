@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class WebsiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'website'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        from .utils.risk_models import load_risk_models
+        load_risk_models()
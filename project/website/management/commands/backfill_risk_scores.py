@@ -0,0 +1,33 @@
+# website/management/commands/backfill_risk_scores.py
+from django.core.management.base import BaseCommand
+
+from website.models import PreSurgeryForm
+from website.utils.risk_models import get_risk_model
+
+
+class Command(BaseCommand):
+    help = 'Recompute persisted risk scores for forms scored by an older calculator version'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every form, not only those with a stale risk version'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of forms updated per query (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        forms = PreSurgeryForm.objects.all()
+        if not options['all']:
+            forms = forms.stale_risk()
+
+        model = get_risk_model()
+        self.stdout.write(f'Scoring forms with risk model {model.name} (version {model.version})...')
+        updated = forms.refresh_risk_scores(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Updated risk scores for {updated} forms'))
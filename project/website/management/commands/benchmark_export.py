@@ -0,0 +1,97 @@
+# website/management/commands/benchmark_export.py
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from website.models import MedicoUser, PreSurgeryForm
+from website.utils.excel_export import CHUNK_SIZE, write_dashboard_workbook
+
+from .benchmark_risk import build_synthetic_forms
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the write-only Excel export on a synthetic cohort (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cases',
+            type=int,
+            default=200000,
+            help='Number of synthetic cases to export (default: 200000)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows fetched per database round trip (default: {CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic cohort (default: 42)'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            doctor = MedicoUser.objects.create_user(
+                username='benchmark-export', email='benchmark-export@alpha-project.com',
+                nombre='Benchmark', apellidos='Export', telefono='0000000000'
+            )
+            self.create_cases(doctor, options['cases'], options['seed'])
+
+            with tempfile.TemporaryFile() as output:
+                rss_before = current_rss_mb()
+                start = time.perf_counter()
+                write_dashboard_workbook(doctor, output, include_cases=True, chunk_size=options['chunk_size'])
+                seconds = time.perf_counter() - start
+                size = output.seek(0, os.SEEK_END)
+
+            before = f'{rss_before:.1f} MB' if rss_before is not None else 'n/a'
+            self.stdout.write(
+                f"{options['cases']:>8} cases | {seconds:8.2f}s ({options['cases'] / seconds:>8,.0f} rows/s) | "
+                f"file {size / 1024 ** 2:6.1f} MB | RSS before export {before} | peak RSS {peak_rss_mb():.1f} MB"
+            )
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Synthetic cases rolled back'))
+
+    def create_cases(self, doctor, count, seed):
+        """Insert the synthetic cohort in batches, skipping the per-save signals"""
+        today = timezone.localdate()
+        batch_size = 5000
+        for offset in range(0, count, batch_size):
+            forms = build_synthetic_forms(min(batch_size, count - offset), seed + offset, today)
+            for index, form in enumerate(forms, start=offset):
+                form.folio_hospitalizacion = f'PRE-EXPORT-{index:07d}'
+                form.nombres, form.apellidos = 'Paciente', f'Sintético {index}'
+                form.medico = form.medico_tratante = doctor.get_full_name()
+                form.medico_user = doctor
+                form.codigo_barras = 'codigos_barra/benchmark.png'
+                form.diagnostico_preoperatorio = 'Colecistitis crónica litiásica'
+                form.evaluacion_preoperatoria = 'Sin hallazgos'
+                form.peso, form.talla = 80, 170
+                form.ta, form.spo2_oxigeno, form.macocha, form.stop_bang = '120/80', 99, 1, 2
+            PreSurgeryForm.objects.bulk_create(forms)
+
+
+def current_rss_mb():
+    """Current resident set size, where /proc is available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is in KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
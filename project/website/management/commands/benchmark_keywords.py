@@ -0,0 +1,99 @@
+# website/management/commands/benchmark_keywords.py
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from website.utils.keyword_matcher import KeywordMatcher, normalize_text
+from website.utils.risk_assessment import AdvancedRiskCalculator
+
+
+FILLER_WORDS = (
+    'paciente', 'con', 'antecedente', 'de', 'cirugía', 'previa', 'sin', 'complicaciones', 'refiere',
+    'dolor', 'abdominal', 'controlado', 'analgésicos', 'tolerando', 'vía', 'oral', 'signos', 'vitales',
+    'estables', 'se', 'mantiene', 'en', 'vigilancia', 'evolución', 'favorable', 'según', 'indicación',
+)
+
+MENTIONS = (
+    'Hipertensión arterial', 'hipertension', 'Diabetes mellitus tipo 2', 'ASMA', 'EPOC', 'apnea del sueño',
+    'neumonía', 'Artritis reumatoide', 'warfarina 5 mg', 'prednisona', 'alergia a penicilina', 'látex',
+    'Intubación difícil', 'intubacion dificil', 'broncoaspiración', 'hipoxemia', 'laringoespasmo',
+    'traumatismo dental', 'neumotórax',
+)
+
+
+def build_notes(count, length, seed):
+    """Clinical-looking notes of about ``length`` characters, each with a few keyword mentions"""
+    rng = random.Random(seed)
+    notes = []
+    for _ in range(count):
+        words = []
+        size = 0
+        while size < length:
+            word = rng.choice(MENTIONS) if rng.random() < 0.02 else rng.choice(FILLER_WORDS)
+            words.append(word)
+            size += len(word) + 1
+        notes.append(' '.join(words))
+    return notes
+
+
+def legacy_categories(groups, text):
+    """The per-category lowercase substring loops the matcher replaced (no accent folding)"""
+    lowered = text.lower()
+    return [label for label, keywords, _points in groups if any(keyword in lowered for keyword in keywords)]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark accent-insensitive keyword matching of comorbidity, medication and allergy text (us per text)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lengths',
+            type=int,
+            nargs='+',
+            default=[60, 1000, 8000],
+            help='Note lengths in characters (default: 60 1000 8000)'
+        )
+        parser.add_argument(
+            '--notes',
+            type=int,
+            default=2000,
+            help='Texts per scenario (default: 2000)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic notes (default: 42)'
+        )
+
+    def handle(self, *args, **options):
+        groups = (*AdvancedRiskCalculator.COMORBIDITY_GROUPS, *AdvancedRiskCalculator.MEDICATION_GROUPS,
+                  AdvancedRiskCalculator.ALLERGY_GROUP)
+        # Structured fields repeat across forms: a few distinct values, many times
+        fields = build_notes(50, 40, options['seed'])
+        scenarios = [('50 distinct fields', [fields[i % len(fields)] for i in range(options['notes'])])]
+        scenarios += [
+            (f'{length} char notes', build_notes(options['notes'], length, options['seed']))
+            for length in options['lengths']
+        ]
+
+        for label, notes in scenarios:
+            # A fresh matcher per scenario, so its cache starts empty
+            matcher = KeywordMatcher((group_label, keywords) for group_label, keywords, _points in groups)
+            legacy = self.time_per_note(notes, lambda note: legacy_categories(groups, note))
+            normalize = self.time_per_note(notes, normalize_text)
+            matched = self.time_per_note(notes, matcher.categories)
+            accent_only = sum(
+                len(matcher.categories(note)) - len(legacy_categories(groups, note)) for note in notes
+            )
+            self.stdout.write(
+                f"{label:>20} | legacy {legacy:8.1f} us | matcher {matched:8.1f} us "
+                f"(normalizing {normalize:7.1f} us) | {accent_only} matches only found with accent folding"
+            )
+
+    def time_per_note(self, notes, scan):
+        start = time.perf_counter()
+        for note in notes:
+            scan(note)
+        return (time.perf_counter() - start) / len(notes) * 1e6
@@ -0,0 +1,102 @@
+# website/management/commands/benchmark_risk.py
+import random
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from website.models import PreSurgeryForm
+from website.utils.batch_risk import RISK_FIELDS, calculate_batch_risk
+from website.utils.risk_assessment import AdvancedRiskCalculator
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-form vs vectorized AdvancedRiskCalculator scoring on synthetic cohorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10000, 100000],
+            help='Cohort sizes to benchmark (default: 10000 100000)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic cohort (default: 42)'
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+
+        for size in options['sizes']:
+            forms = build_synthetic_forms(size, options['seed'], today)
+            rows = [{field: getattr(form, field) for field in RISK_FIELDS} for form in forms]
+
+            # The unmemoized calculation: every synthetic form is scored from scratch
+            start = time.perf_counter()
+            per_form = np.array([
+                AdvancedRiskCalculator._calculate_comprehensive_risk(form)[0] for form in forms
+            ])
+            per_form_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            batch = calculate_batch_risk(rows, reference_date=today)
+            batch_seconds = time.perf_counter() - start
+
+            mismatches = int(np.count_nonzero(per_form != batch.total_score))
+            if mismatches:
+                raise CommandError(f'{mismatches} of {size} forms differ between per-form and batch scoring')
+
+            self.stdout.write(
+                f'{size:>8} forms | per-form {per_form_seconds:8.3f}s '
+                f'({size / per_form_seconds:>10,.0f} forms/s) | '
+                f'batch {batch_seconds:8.3f}s ({size / batch_seconds:>10,.0f} forms/s) | '
+                f'speedup {per_form_seconds / batch_seconds:6.1f}x'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Batch results match the per-form path'))
+
+
+def build_synthetic_forms(count, seed, today):
+    """Build unsaved PreSurgeryForm instances covering every scoring branch"""
+    rng = random.Random(seed)
+    comorbidities = ['', 'Ninguna', 'Asma leve', 'Hipertension arterial', 'Hipertensión arterial',
+                     'Diabetes mellitus tipo 2', 'Artritis reumatoide', 'EPOC, arritmia', 'Neumonía', 'Hipotiroidismo']
+    medications = ['', 'Ninguno', 'Warfarina 5mg', 'Prednisona 20mg', 'Losartán 50mg', 'Heparina']
+    allergies = ['', 'Ninguna conocida', 'Penicilina', 'Latex', 'Látex', 'AINE']
+
+    forms = []
+    for index in range(count):
+        forms.append(PreSurgeryForm(
+            folio_hospitalizacion=f'PRE-BENCH-{index:07d}',
+            fecha_nacimiento=today - timedelta(days=rng.randint(0, 95 * 365)),
+            fecha_reporte=today - timedelta(days=rng.randint(0, 3)),
+            imc=round(rng.uniform(15, 50), 2),
+            estado_fisico_asa=rng.randint(1, 6),
+            comorbilidades=rng.choice(comorbidities),
+            medicamentos=rng.choice(medications),
+            alergias=rng.choice(allergies),
+            ayuno_hrs=rng.randint(0, 16),
+            uso_glp1=rng.random() < 0.1,
+            tabaquismo=rng.random() < 0.2,
+            antecedentes_dificultad=rng.random() < 0.15,
+            uso_usg_gastrico=rng.random() < 0.3,
+            usg_gastrico_ml=rng.choice([None, rng.randint(0, 200)]),
+            fc=rng.randint(40, 140),
+            spo2_aire=rng.randint(85, 100),
+            glasgow=rng.randint(3, 15),
+            mallampati=rng.randint(1, 4),
+            patil_aldrete=rng.randint(1, 4),
+            distancia_inter_incisiva=round(rng.uniform(2.0, 5.5), 1),
+            distancia_tiro_mentoniana=round(rng.uniform(4.0, 8.0), 1),
+            protrusion_mandibular=rng.randint(1, 4),
+            desviacion_traquea=rng.randint(0, 2),
+            problemas_deglucion=rng.random() < 0.05,
+            estridor_laringeo=rng.random() < 0.03,
+        ))
+    return forms
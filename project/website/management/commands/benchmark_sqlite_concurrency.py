@@ -0,0 +1,179 @@
+# website/management/commands/benchmark_sqlite_concurrency.py
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from website.utils.sqlite_tuning import apply_pragmas
+
+
+# SQLite and Django defaults (rollback journal, deferred transactions) against
+# the connection setup of settings.py
+MODES = ('default', 'tuned')
+
+
+def mode_setup(mode):
+    """Pragmas and BEGIN statement of a mode"""
+    if mode == 'tuned':
+        return dict(settings.SQLITE_PRAGMAS), 'BEGIN IMMEDIATE'
+    return {'journal_mode': 'DELETE'}, 'BEGIN'
+
+
+def create_database(path, rows, seed):
+    """A table shaped like the pre-surgery forms: one row per case, grouped by doctor"""
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            'CREATE TABLE forms (id INTEGER PRIMARY KEY, medico INTEGER, risk INTEGER, payload TEXT, updated_at REAL)'
+        )
+        connection.execute('CREATE INDEX forms_medico ON forms (medico)')
+        connection.execute('CREATE TABLE stats (medico INTEGER PRIMARY KEY, cases INTEGER, risk_total INTEGER)')
+        connection.executemany(
+            'INSERT INTO forms (medico, risk, payload, updated_at) VALUES (?, ?, ?, ?)',
+            ((rng.randrange(20), rng.randrange(100), 'x' * 200, time.time()) for _ in range(rows))
+        )
+        connection.execute(
+            'INSERT INTO stats SELECT medico, COUNT(*), SUM(risk) FROM forms GROUP BY medico'
+        )
+    connection.close()
+
+
+def run_worker(role, path, pragmas, begin, duration, seed, results):
+    """
+    Run reads (a dashboard-like aggregate) or writes (a form save: read the
+    row, update it and the doctor's totals in one transaction) until the time
+    is up, counting "database is locked" failures
+    """
+    rng = random.Random(seed)
+    # Python's default timeout, as used by Django, unless busy_timeout overrides it
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    apply_pragmas(connection, {name: value for name, value in pragmas.items() if name != 'journal_mode'})
+    ops, errors, latencies = 0, 0, []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        medico = rng.randrange(20)
+        start = time.perf_counter()
+        try:
+            if role == 'reader':
+                connection.execute(
+                    'SELECT COUNT(*), AVG(risk), SUM(risk >= 70) FROM forms WHERE medico = ?', (medico,)
+                ).fetchone()
+            else:
+                connection.execute(begin)
+                try:
+                    row = connection.execute(
+                        'SELECT id, risk FROM forms WHERE medico = ? ORDER BY updated_at LIMIT 1', (medico,)
+                    ).fetchone()
+                    risk = rng.randrange(100)
+                    connection.execute(
+                        'UPDATE forms SET risk = ?, updated_at = ? WHERE id = ?', (risk, time.time(), row[0])
+                    )
+                    connection.execute(
+                        'UPDATE stats SET risk_total = risk_total + ? WHERE medico = ?', (risk - row[1], medico)
+                    )
+                    connection.execute('COMMIT')
+                except BaseException:
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    raise
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        ops += 1
+    connection.close()
+    results.put((role, ops, errors, latencies))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100)[int(fraction * 100) - 1]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent SQLite readers and writers with the default and the tuned connection setup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Reader processes (default: 4)')
+        parser.add_argument('--writers', type=int, default=4, help='Writer processes (default: 4)')
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5.0,
+            help='Seconds each mode runs for (default: 5)'
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=50000,
+            help='Rows in the benchmark table (default: 50000)'
+        )
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='Modes to run')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--json', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='sqlite-concurrency-')
+        try:
+            results = [self.run_mode(mode, directory, options) for mode in options['modes']]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        if options['json']:
+            with open(options['json'], 'w') as json_file:
+                json.dump({'results': results}, json_file, indent=2)
+
+    def run_mode(self, mode, directory, options):
+        # A fresh database per mode: journal_mode is stored in the file
+        path = os.path.join(directory, f'{mode}.sqlite3')
+        create_database(path, options['rows'], options['seed'])
+        pragmas, begin = mode_setup(mode)
+        connection = sqlite3.connect(path)
+        applied = apply_pragmas(connection, {'journal_mode': pragmas['journal_mode']})
+        connection.close()
+
+        queue = multiprocessing.Queue()
+        roles = ['reader'] * options['readers'] + ['writer'] * options['writers']
+        workers = [
+            multiprocessing.Process(
+                target=run_worker,
+                args=(role, path, pragmas, begin, options['duration'], options['seed'] + i, queue)
+            )
+            for i, role in enumerate(roles)
+        ]
+        for worker in workers:
+            worker.start()
+        # Drain before joining: a worker only exits once its result is read
+        outcomes = [queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        result = {'mode': mode, 'journal_mode': applied['journal_mode'], 'begin': begin}
+        for role in ('reader', 'writer'):
+            ops = sum(outcome[1] for outcome in outcomes if outcome[0] == role)
+            latencies = [latency for outcome in outcomes if outcome[0] == role for latency in outcome[3]]
+            result[f'{role}_ops_per_s'] = round(ops / options['duration'], 1)
+            result[f'{role}_locked'] = sum(outcome[2] for outcome in outcomes if outcome[0] == role)
+            result[f'{role}_p95_ms'] = round(percentile(latencies, 0.95), 2)
+
+        self.stdout.write(
+            f"{mode:>8} ({result['journal_mode']}, {begin}) | "
+            f"reads {result['reader_ops_per_s']:>9,.0f}/s p95 {result['reader_p95_ms']:7.2f} ms | "
+            f"writes {result['writer_ops_per_s']:>8,.0f}/s p95 {result['writer_p95_ms']:7.2f} ms | "
+            f"locked: {result['reader_locked']} reads, {result['writer_locked']} writes"
+        )
+        return result
@@ -0,0 +1,277 @@
+# website/management/commands/benchmark_views.py
+import csv
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from website.models import MedicoUser, Patient
+from website.utils.dashboard_cache import bump_data_version
+
+
+RESULT_FIELDS = ('view', 'size', 'wall_ms', 'min_ms', 'queries', 'peak_kb')
+
+
+def view_urls(patient):
+    """URL of every benchmarked view, keyed by URL name"""
+    return {
+        'dashboard': reverse('dashboard'),
+        'dashboard-stats': reverse('dashboard-stats'),
+        'patient-alerts': reverse('patient-alerts'),
+        'patient-list': reverse('patient-list'),
+        'patient-detail': reverse('patient-detail', args=[patient.pk]),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the dashboard, alert and patient views on synthetic cohorts in a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Cohort sizes, in pre-surgery forms (default: 1000 10000 100000)'
+        )
+        parser.add_argument(
+            '--views',
+            nargs='+',
+            help='Only benchmark these views (URL names, default: all)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Timed requests per view; the median is reported (default: 5)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic cohorts (default: 42)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes generating the cohorts (default: 1)'
+        )
+        parser.add_argument(
+            '--in-place',
+            action='store_true',
+            help='Seed the configured database inside a transaction that is rolled back, instead of a '
+                 'throwaway database (only for databases that are disposable themselves, e.g. in tests)'
+        )
+        parser.add_argument('--json', help='Write the results to this JSON file (usable as a baseline)')
+        parser.add_argument('--csv', help='Write the results to this CSV file')
+        parser.add_argument(
+            '--baseline',
+            help='JSON results of an earlier run; regressions against it make the command fail'
+        )
+        parser.add_argument(
+            '--time-threshold',
+            type=float,
+            default=0.25,
+            help='Allowed relative increase in median wall time (default: 0.25)'
+        )
+        parser.add_argument(
+            '--min-delta-ms',
+            type=float,
+            default=2.0,
+            help='Wall time increases below this many ms are treated as noise (default: 2)'
+        )
+        parser.add_argument(
+            '--query-threshold',
+            type=int,
+            default=0,
+            help='Allowed number of extra queries per request (default: 0)'
+        )
+        parser.add_argument(
+            '--memory-threshold',
+            type=float,
+            default=0.25,
+            help='Allowed relative increase in peak allocated memory (default: 0.25)'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        results = []
+        # The test client's host must be allowed, as under the test runner. The
+        # replica does not have the synthetic cohorts, so every view reads the scratch database.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], ANALYTICS_DATABASE=None):
+            with self.scratch_database(options['in_place']):
+                for size in options['sizes']:
+                    results.extend(self.benchmark_cohort(size, options))
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'results': results,
+        }
+        if options['json']:
+            with open(options['json'], 'w') as json_file:
+                json.dump(report, json_file, indent=2)
+        if options['csv']:
+            with open(options['csv'], 'w', newline='') as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=RESULT_FIELDS)
+                writer.writeheader()
+                writer.writerows(results)
+
+        if baseline is not None:
+            regressions = compare_results(
+                results, baseline['results'], options['time_threshold'], options['min_delta_ms'],
+                options['query_threshold'], options['memory_threshold']
+            )
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    @contextmanager
+    def scratch_database(self, in_place):
+        """
+        Switch the default connection to a new database with the project's
+        schema, dropped afterwards: a temporary file on SQLite, so timings
+        include disk access, the backend's test database elsewhere. With
+        ``in_place`` the cohorts are written to the configured database
+        instead, inside a transaction that is rolled back.
+        """
+        if in_place:
+            with transaction.atomic():
+                yield
+                transaction.set_rollback(True)
+            self.stdout.write(self.style.SUCCESS('Synthetic cohorts rolled back'))
+            return
+
+        old_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict['TEST']
+        old_test_name = test_settings.get('NAME')
+        directory = tempfile.mkdtemp() if connection.vendor == 'sqlite' else None
+        if directory:
+            test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        try:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                yield
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            test_settings['NAME'] = old_test_name
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+        self.stdout.write(self.style.SUCCESS('Synthetic cohorts dropped with the scratch database'))
+
+    def benchmark_cohort(self, size, options):
+        call_command(
+            'generate_sample_data', '--patients', str(size), '--bulk', '--clear', '--no-media',
+            '--seed', str(options['seed']), '--workers', str(options['workers']), stdout=StringIO()
+        )
+        doctor = MedicoUser.objects.get(username='sample_doctor')
+        patient = Patient.objects.filter(medico=doctor).order_by('folio_hospitalizacion').first()
+        client = Client()
+        client.force_login(doctor)
+
+        urls = view_urls(patient)
+        unknown = set(options['views'] or []) - set(urls)
+        if unknown:
+            raise CommandError(f"Unknown views: {', '.join(sorted(unknown))}")
+
+        results = []
+        for name, url in urls.items():
+            if options['views'] and name not in options['views']:
+                continue
+            result = {'view': name, 'size': size, **measure(client, url, doctor.pk, options['repeat'])}
+            self.stdout.write(
+                f"{name:>16} | {size:>8} forms | {result['wall_ms']:9.1f} ms (min {result['min_ms']:9.1f}) | "
+                f"{result['queries']:>4} queries | peak {result['peak_kb']:>10,.0f} KB"
+            )
+            results.append(result)
+        return results
+
+
+def measure(client, url, medico_id, repeat):
+    """
+    Median and minimum wall time, query count and peak Python allocations of a
+    GET. The dashboard cache is invalidated before every request, so each one
+    does the full work.
+    """
+    timings = []
+    # The first request warms up imports and templates and is not timed
+    for _ in range(repeat + 1):
+        bump_data_version(medico_id)
+        # A full query log (9000 entries, e.g. after seeding) would count as no queries
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        # Read now: the captured queries are sliced from a log the next request clears
+        query_count = len(queries)
+        if response.status_code != 200:
+            raise CommandError(f'GET {url} returned {response.status_code}')
+    timings = timings[1:]
+
+    # Traced separately: tracemalloc slows the request down
+    bump_data_version(medico_id)
+    tracemalloc.start()
+    try:
+        client.get(url)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_ms': round(statistics.median(timings), 2),
+        'min_ms': round(min(timings), 2),
+        'queries': query_count,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare_results(results, baseline, time_threshold=0.25, min_delta_ms=2.0, query_threshold=0,
+                    memory_threshold=0.25):
+    """Descriptions of the results that regressed against the matching baseline results"""
+    expected = {(result['view'], result['size']): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = expected.get((result['view'], result['size']))
+        if base is None:
+            continue
+        label = f"{result['view']} @ {result['size']}"
+        if (result['wall_ms'] > base['wall_ms'] * (1 + time_threshold)
+                and result['wall_ms'] - base['wall_ms'] > min_delta_ms):
+            regressions.append(f"{label}: wall time {base['wall_ms']} ms -> {result['wall_ms']} ms")
+        if result['queries'] > base['queries'] + query_threshold:
+            regressions.append(f"{label}: queries {base['queries']} -> {result['queries']}")
+        if result['peak_kb'] > base['peak_kb'] * (1 + memory_threshold):
+            regressions.append(f"{label}: peak memory {base['peak_kb']} KB -> {result['peak_kb']} KB")
+    return regressions
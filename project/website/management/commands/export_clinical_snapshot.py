@@ -0,0 +1,47 @@
+# website/management/commands/export_clinical_snapshot.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from website.utils.clinical_snapshot import CHUNK_SIZE, FORMAT_EXTENSIONS, update_snapshot_directory
+
+
+class Command(BaseCommand):
+    help = 'Append the clinical rows changed since the last run to a Parquet / Arrow snapshot directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=settings.CLINICAL_SNAPSHOT_DIR,
+            help='Snapshot directory (default: settings.CLINICAL_SNAPSHOT_DIR)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(FORMAT_EXTENSIONS),
+            default='parquet',
+            help='File format of the part files (default: parquet)'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Discard the existing parts and export every row again'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows fetched per database round trip and per record batch (default: {CHUNK_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        run = update_snapshot_directory(
+            options['output'], options['format'], full=options['full'], chunk_size=options['chunk_size']
+        )
+        if run.rebuilt:
+            self.stdout.write('Started a new snapshot')
+        if run.part is None:
+            self.stdout.write('No rows changed since the last run')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Wrote {run.rows} rows and {run.deleted} deletions to {run.part} '
+                f'(high-water mark {run.high_water_mark.isoformat()})'
+            ))
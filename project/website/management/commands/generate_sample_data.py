@@ -1,16 +1,70 @@
 # website/management/commands/generate_sample_data.py
+import io
+import multiprocessing
 import random
+import time
 import uuid
-from datetime import datetime, timedelta
-from django.core.management.base import BaseCommand
+from collections import deque
+from datetime import date, timedelta
+from itertools import islice
+
+import django
+import numpy as np
+from PIL import Image
 from django.contrib.auth import get_user_model
-from website.models import Patient, PreSurgeryForm, PostDuringSurgeryForm
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-import io
-from PIL import Image
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.utils import timezone
+
+from website.models import Patient, PreSurgeryForm, PostDuringSurgeryForm
+from website.utils.doctor_stats import rebuild_doctor_stats
+from website.utils.patient_search import PREFIX_FIELDS, normalize_search_text, rebuild_search_table
 
 User = get_user_model()
 
+# Barcode shared by every patient of a --bulk run
+PLACEHOLDER_BARCODE = 'codigos_barra/sample_placeholder.png'
+
+NOMBRES = [
+    'Juan Carlos', 'María Elena', 'José Luis', 'Ana Sofía', 'Miguel Ángel',
+    'Carmen Rosa', 'Ricardo', 'Patricia', 'Fernando', 'Gabriela',
+    'Alberto', 'Claudia', 'Roberto', 'Mónica', 'Eduardo',
+    'Alejandra', 'Francisco', 'Beatriz', 'Sergio', 'Verónica'
+]
+
+APELLIDOS = [
+    'García López', 'Rodríguez Martín', 'González Pérez', 'Fernández Silva',
+    'López Hernández', 'Martínez Torres', 'Sánchez Ruiz', 'Pérez Morales',
+    'Gómez Castro', 'Martín Ortega', 'Jiménez Ramos', 'Ruiz Delgado',
+    'Hernández Vega', 'Díaz Romero', 'Moreno Iglesias', 'Álvarez Núñez',
+    'Romero Garrido', 'Alonso Guerrero', 'Gutiérrez Cano', 'Navarro León'
+]
+
+DIAGNOSTICOS = [
+    "Colecistitis crónica litiásica",
+    "Hernia inguinal derecha",
+    "Apendicitis aguda",
+    "Colelitiasis sintomática",
+    "Hernia umbilical",
+    "Masa abdominal por estudiar",
+    "Obstrucción intestinal",
+    "Tumor de colon",
+    "Hernia ventral",
+    "Patología benigna de tiroides"
+]
+
+ESPECIALIDADES = {
+    'ANE': 'anestesiologia',
+    'ANP': 'anestesiologia_pediatrica',
+    'MEC': 'medicina_critica',
+    'MED': 'medicina_del_dolor',
+    'OTR': 'otra'
+}
+
+
 class Command(BaseCommand):
     help = 'Generate sample data for testing ALPHA Project'
 
@@ -26,40 +80,189 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing sample data before creating new'
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Insert in batches with executemany, for load-test datasets (skips the per-save signals)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Patients generated and inserted per batch (default: 5000)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Random seed; the same seed produces the same data for any number of workers'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes generating batches while the main process inserts them (default: 1)'
+        )
+        parser.add_argument(
+            '--no-media',
+            action='store_true',
+            help='Do not write barcode images (rows reference the placeholder path)'
+        )
 
     def handle(self, *args, **options):
         if options['clear']:
             self.stdout.write('Clearing existing sample data...')
-            # Only delete patients created by sample data (with specific pattern)
-            Patient.objects.filter(folio_hospitalizacion__startswith='SAMPLE-').delete()
-            PreSurgeryForm.objects.filter(folio_hospitalizacion__startswith='PRE-SAMPLE-').delete()
-            
+            self.clear_sample_data(options['bulk'])
+
         num_patients = options['patients']
-        self.stdout.write(f'Creating {num_patients} sample patients...')
-        
+        batch_size = max(options['batch_size'], 1)
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        self.stdout.write(f'Creating {num_patients} sample patients (seed {seed})...')
+
         # Get or create a sample doctor
         doctor = self.get_or_create_sample_doctor()
-        
-        for i in range(num_patients):
+        if options['bulk'] and Patient.objects.filter(folio_hospitalizacion__startswith='SAMPLE-').exists():
+            raise CommandError('Sample patients already exist; use --clear with --bulk')
+
+        if options['no_media']:
+            barcodes = None
+        elif options['bulk']:
+            barcodes = 'shared'
+            self.save_placeholder_barcode()
+        else:
+            barcodes = 'unique'
+
+        chunks = [
+            (seed, start, min(batch_size, num_patients - start), doctor.get_full_name(), doctor.pk,
+             ESPECIALIDADES.get(doctor.especialidad, 'anestesiologia'), timezone.localdate(),
+             options['bulk'], barcodes)
+            for start in range(0, num_patients, batch_size)
+        ]
+        timings = {phase: [0, 0.0] for phase in ('generate', 'patients', 'presurgery', 'postsurgery')}
+        started = time.perf_counter()
+
+        for patients, presurgeries, postsurgeries in self.generated_chunks(chunks, options['workers'], timings):
+            if options['bulk']:
+                self.insert_chunk(patients, presurgeries, postsurgeries, timings)
+            else:
+                self.create_chunk(patients, presurgeries, postsurgeries, timings)
+            self.stdout.write(f"Created {timings['patients'][0]} patients...")
+
+        if options['bulk']:
+            # Bulk inserts skip the signals that maintain the derived tables
+            phase_start = time.perf_counter()
+            rebuild_search_table(connection)
+            timings['search index'] = [timings['patients'][0], time.perf_counter() - phase_start]
+            phase_start = time.perf_counter()
+            rebuild_doctor_stats([doctor.pk])
+            timings['doctor stats'] = [timings['presurgery'][0], time.perf_counter() - phase_start]
+
+        for phase, (rows, seconds) in timings.items():
+            self.report(phase, rows, seconds)
+        self.report('total', num_patients, time.perf_counter() - started)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Successfully created {timings['patients'][0]} sample patients!")
+        )
+
+    def report(self, phase, rows, seconds):
+        rate = rows / seconds if seconds else float('inf')
+        self.stdout.write(f'{phase:>12}: {rows:>9} rows in {seconds:8.2f}s ({rate:>10,.0f} rows/s)')
+
+    def generated_chunks(self, chunks, workers, timings):
+        """Yield generated chunks in order, from a process pool when workers > 1"""
+        if workers <= 1:
+            for chunk in chunks:
+                phase_start = time.perf_counter()
+                generated = generate_chunk(chunk)
+                timings['generate'][0] += chunk[2]
+                timings['generate'][1] += time.perf_counter() - phase_start
+                yield generated
+            return
+
+        # Workers set up Django themselves when processes are spawned rather than forked
+        with multiprocessing.Pool(workers, initializer=django.setup) as pool:
+            queued = iter(chunks)
+            # A few batches ahead of the inserts, so memory stays bounded
+            pending = deque(
+                (chunk[2], pool.apply_async(generate_chunk, (chunk,))) for chunk in islice(queued, workers * 2)
+            )
+            while pending:
+                rows, result = pending.popleft()
+                phase_start = time.perf_counter()
+                generated = result.get()
+                # Time spent waiting on the workers, not their total CPU time
+                timings['generate'][0] += rows
+                timings['generate'][1] += time.perf_counter() - phase_start
+                chunk = next(queued, None)
+                if chunk is not None:
+                    pending.append((chunk[2], pool.apply_async(generate_chunk, (chunk,))))
+                yield generated
+
+    def insert_chunk(self, patients, presurgeries, postsurgeries, timings):
+        for phase, model, rows in (
+            ('patients', Patient, patients),
+            ('presurgery', PreSurgeryForm, presurgeries),
+            ('postsurgery', PostDuringSurgeryForm, postsurgeries),
+        ):
+            phase_start = time.perf_counter()
+            insert_rows(model, rows)
+            timings[phase][0] += len(rows)
+            timings[phase][1] += time.perf_counter() - phase_start
+
+    def create_chunk(self, patients, presurgeries, postsurgeries, timings):
+        """One row at a time through save(), so the signals maintain the derived tables"""
+        postsurgeries = {values['folio_hospitalizacion_id']: values for values in postsurgeries}
+        for patient_values, presurgery_values in zip(patients, presurgeries):
             try:
-                patient = self.create_sample_patient(doctor, i)
-                presurgery = self.create_sample_presurgery(patient)
-                
-                # Create post-surgery form for 80% of patients
-                if random.random() < 0.8:
-                    self.create_sample_postsurgery(presurgery)
-                
-                if (i + 1) % 10 == 0:
-                    self.stdout.write(f'Created {i + 1} patients...')
-                    
+                phase_start = time.perf_counter()
+                barcode = patient_values['codigo_barras']
+                if isinstance(barcode, bytes):
+                    patient_values['codigo_barras'] = SimpleUploadedFile(
+                        name=f'barcode_{uuid.uuid4().hex[:8]}.png', content=barcode, content_type='image/png'
+                    )
+                patient = Patient.objects.create(**patient_values)
+                timings['patients'][0] += 1
+                timings['patients'][1] += time.perf_counter() - phase_start
+
+                phase_start = time.perf_counter()
+                presurgery = PreSurgeryForm.objects.create(**presurgery_values)
+                timings['presurgery'][0] += 1
+                timings['presurgery'][1] += time.perf_counter() - phase_start
+
+                if presurgery.pk in postsurgeries:
+                    phase_start = time.perf_counter()
+                    PostDuringSurgeryForm.objects.create(**postsurgeries[presurgery.pk])
+                    timings['postsurgery'][0] += 1
+                    timings['postsurgery'][1] += time.perf_counter() - phase_start
             except Exception as e:
                 self.stdout.write(
-                    self.style.ERROR(f'Error creating patient {i + 1}: {str(e)}')
+                    self.style.ERROR(f"Error creating patient {patient_values['folio_hospitalizacion']}: {str(e)}")
                 )
-        
-        self.stdout.write(
-            self.style.SUCCESS(f'Successfully created {num_patients} sample patients!')
-        )
+
+    def clear_sample_data(self, bulk):
+        # Only delete patients created by sample data (with specific pattern)
+        patients = Patient.objects.filter(folio_hospitalizacion__startswith='SAMPLE-')
+        presurgeries = PreSurgeryForm.objects.filter(folio_hospitalizacion__startswith='PRE-SAMPLE-')
+        if not bulk:
+            # Forms first: they protect their patient
+            presurgeries.delete()
+            patients.delete()
+            return
+
+        # Plain SQL deletes: the ORM would load every row to send the delete signals
+        medico_ids = set(patients.values_list('medico_id', flat=True).distinct())
+        with transaction.atomic():
+            PostDuringSurgeryForm.objects.filter(
+                folio_hospitalizacion__in=presurgeries.values('pk')
+            )._raw_delete(connection.alias)
+            presurgeries._raw_delete(connection.alias)
+            patients._raw_delete(connection.alias)
+        rebuild_search_table(connection)
+        rebuild_doctor_stats(medico_ids)
+
+    def save_placeholder_barcode(self):
+        if not default_storage.exists(PLACEHOLDER_BARCODE):
+            default_storage.save(PLACEHOLDER_BARCODE, ContentFile(barcode_png(random.Random(0))))
 
     def get_or_create_sample_doctor(self):
         """Get or create a sample doctor for testing"""
@@ -79,402 +282,386 @@ class Command(BaseCommand):
             self.stdout.write('Created sample doctor account')
         return doctor
 
-    def create_sample_patient(self, doctor, index):
-        """Create a sample patient"""
-        # Sample names
-        nombres = [
-            'Juan Carlos', 'María Elena', 'José Luis', 'Ana Sofía', 'Miguel Ángel',
-            'Carmen Rosa', 'Ricardo', 'Patricia', 'Fernando', 'Gabriela',
-            'Alberto', 'Claudia', 'Roberto', 'Mónica', 'Eduardo',
-            'Alejandra', 'Francisco', 'Beatriz', 'Sergio', 'Verónica'
-        ]
-        
-        apellidos = [
-            'García López', 'Rodríguez Martín', 'González Pérez', 'Fernández Silva',
-            'López Hernández', 'Martínez Torres', 'Sánchez Ruiz', 'Pérez Morales',
-            'Gómez Castro', 'Martín Ortega', 'Jiménez Ramos', 'Ruiz Delgado',
-            'Hernández Vega', 'Díaz Romero', 'Moreno Iglesias', 'Álvarez Núñez',
-            'Romero Garrido', 'Alonso Guerrero', 'Gutiérrez Cano', 'Navarro León'
-        ]
-        
-        # Generate realistic patient data
-        nombre = random.choice(nombres)
-        apellido = random.choice(apellidos)
-        
-        # Birth date (20-80 years old)
-        birth_year = datetime.now().year - random.randint(20, 80)
-        birth_month = random.randint(1, 12)
-        birth_day = random.randint(1, 28)
-        fecha_nacimiento = datetime(birth_year, birth_month, birth_day).date()
-        
-        # Create a simple barcode image
-        barcode_image = self.create_sample_barcode()
-        
-        patient = Patient.objects.create(
-            folio_hospitalizacion=f'SAMPLE-{index+1:03d}',
-            nombres=nombre,
-            apellidos=apellido,
-            fecha_nacimiento=fecha_nacimiento,
-            medico=doctor,
-            codigo_barras=barcode_image
-        )
-        
-        return patient
-
-    def create_sample_barcode(self):
-        """Create a simple sample barcode image"""
-        # Create a simple black and white barcode-like image
-        img = Image.new('RGB', (200, 50), color='white')
-        pixels = img.load()
-        
-        # Create vertical lines to simulate barcode
-        for x in range(0, 200, 4):
-            width = random.choice([1, 2, 3])
-            for y in range(50):
-                for w in range(width):
-                    if x + w < 200:
-                        pixels[x + w, y] = (0, 0, 0)
-        
-        # Save to bytes
-        img_io = io.BytesIO()
-        img.save(img_io, format='PNG')
-        img_io.seek(0)
-        
-        return SimpleUploadedFile(
-            name=f'barcode_{uuid.uuid4().hex[:8]}.png',
-            content=img_io.getvalue(),
-            content_type='image/png'
-        )
 
-    def create_sample_presurgery(self, patient):
-        """Create a sample pre-surgery form"""
-        # Calculate age
-        today = datetime.now().date()
-        age = today.year - patient.fecha_nacimiento.year
-        
-        # Generate realistic medical data based on age and risk factors
-        peso = random.uniform(50, 120)  # kg
-        talla = random.uniform(150, 190)  # cm
-        imc = peso / ((talla/100) ** 2)
-        
-        # ASA based on age and other factors
-        if age < 30:
-            asa = random.choices([1, 2, 3], weights=[60, 35, 5])[0]
-        elif age < 60:
-            asa = random.choices([1, 2, 3, 4], weights=[20, 50, 25, 5])[0]
-        else:
-            asa = random.choices([2, 3, 4, 5], weights=[30, 40, 25, 5])[0]
-        
-        # Mallampati based on BMI and age
-        if imc > 30:
-            mallampati = random.choices([1, 2, 3, 4], weights=[10, 30, 40, 20])[0]
-        else:
-            mallampati = random.choices([1, 2, 3, 4], weights=[40, 35, 20, 5])[0]
-        
-        # Generate other realistic values
-        fc = random.randint(60, 100)
-        ta_systolic = random.randint(110, 160)
-        ta_diastolic = random.randint(70, 100)
-        ta = f"{ta_systolic}/{ta_diastolic}"
-        
-        spo2_aire = random.randint(94, 99)
-        spo2_oxigeno = random.randint(97, 100)
-        glasgow = random.choices([15, 14, 13], weights=[85, 10, 5])[0]
-        
+def generate_chunk(chunk):
+    """
+    Field values for one batch of patients and their forms. Runs in the worker
+    processes; the random state depends only on the seed and the batch start.
+    """
+    seed, start, count, doctor_name, doctor_id, especialidad, today, bulk, barcodes = chunk
+    rng = random.Random(f'{seed}-{start}')
+
+    patients, presurgeries, postsurgeries = [], [], []
+    for index in range(start, start + count):
+        patient = sample_patient(rng, seed, index, doctor_id, today, barcodes)
+        presurgery = sample_presurgery(rng, patient, doctor_name, doctor_id, today)
+        patients.append(patient)
+        presurgeries.append(presurgery)
+
+        # Create post-surgery form for 80% of patients
+        if rng.random() < 0.8:
+            postsurgeries.append(sample_postsurgery(rng, presurgery, especialidad))
+
+    if not bulk:
+        return patients, presurgeries, postsurgeries
+
+    forms = [PreSurgeryForm(**values) for values in presurgeries]
+    for form in forms:
+        # Bulk inserts skip the signal that stores the risk columns
+        for field, value in form.compute_risk().items():
+            setattr(form, field, value)
+    return (
+        db_rows([Patient(**values) for values in patients]),
+        db_rows(forms),
+        db_rows([PostDuringSurgeryForm(**values) for values in postsurgeries]),
+    )
+
+
+def db_rows(objs):
+    """
+    Database values of every concrete field, as bulk_create would send them. Done
+    in the workers: preparing values is most of bulk_create's cost on SQLite,
+    where it also inserts fewer than 20 rows per statement.
+    """
+    if not objs:
+        return []
+    fields = objs[0]._meta.concrete_fields
+    # The proxy looks the connection up again on every access
+    db = connections[DEFAULT_DB_ALIAS]
+    return [tuple(field.get_db_prep_save(field.pre_save(obj, True), db) for field in fields) for obj in objs]
+
+
+def insert_rows(model, rows):
+    """Insert rows from db_rows() with a single executemany"""
+    fields = model._meta.concrete_fields
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def barcode_png(rng):
+    """A barcode-like PNG: black bars of random width every 4 pixels"""
+    widths = np.array([rng.choice([1, 2, 3]) for _ in range(0, 200, 4)])
+    offsets = np.arange(200) % 4
+    bars = offsets < np.repeat(widths, 4)[:200]
+    pixels = np.where(bars, 0, 255).astype(np.uint8)
+    img = Image.fromarray(np.broadcast_to(pixels, (50, 200)).copy(), mode='L')
+
+    img_io = io.BytesIO()
+    img.save(img_io, format='PNG')
+    return img_io.getvalue()
+
+
+def sample_patient(rng, seed, index, doctor_id, today, barcodes):
+    """
+    Field values of a sample patient. The barcode image has its own random
+    state, so the other values do not depend on whether images are written.
+    """
+    # Birth date (20-80 years old)
+    birth_year = today.year - rng.randint(20, 80)
+    fecha_nacimiento = date(birth_year, rng.randint(1, 12), rng.randint(1, 28))
+
+    values = {
+        'id_paciente': uuid.UUID(int=rng.getrandbits(128), version=4),
+        'folio_hospitalizacion': f'SAMPLE-{index+1:03d}',
+        'nombres': rng.choice(NOMBRES),
+        'apellidos': rng.choice(APELLIDOS),
+        'fecha_nacimiento': fecha_nacimiento,
+        'medico_id': doctor_id,
+        'codigo_barras': (
+            barcode_png(random.Random(f'{seed}-barcode-{index}')) if barcodes == 'unique' else PLACEHOLDER_BARCODE
+        ),
+    }
+    # save() fills these, bulk inserts do not
+    values.update({field: normalize_search_text(values[source]) for field, source in PREFIX_FIELDS.items()})
+    return values
+
+
+def sample_presurgery(rng, patient, doctor_name, doctor_id, today):
+    """Field values of a sample pre-surgery form"""
+    # Calculate age
+    age = today.year - patient['fecha_nacimiento'].year
+
+    # Generate realistic medical data based on age and risk factors
+    peso = rng.uniform(50, 120)  # kg
+    talla = rng.uniform(150, 190)  # cm
+    imc = peso / ((talla/100) ** 2)
+
+    # ASA based on age and other factors
+    if age < 30:
+        asa = rng.choices([1, 2, 3], weights=[60, 35, 5])[0]
+    elif age < 60:
+        asa = rng.choices([1, 2, 3, 4], weights=[20, 50, 25, 5])[0]
+    else:
+        asa = rng.choices([2, 3, 4, 5], weights=[30, 40, 25, 5])[0]
+
+    # Mallampati based on BMI and age
+    if imc > 30:
+        mallampati = rng.choices([1, 2, 3, 4], weights=[10, 30, 40, 20])[0]
+    else:
+        mallampati = rng.choices([1, 2, 3, 4], weights=[40, 35, 20, 5])[0]
+
+    # Medical history based on age
+    comorbilidades_list = []
+    if age > 50:
+        if rng.random() < 0.3:
+            comorbilidades_list.append("Hipertensión arterial")
+        if rng.random() < 0.2:
+            comorbilidades_list.append("Diabetes mellitus tipo 2")
+        if rng.random() < 0.15:
+            comorbilidades_list.append("Enfermedad coronaria")
+
+    if imc > 30:
+        comorbilidades_list.append("Obesidad")
+
+    comorbilidades = ", ".join(comorbilidades_list) if comorbilidades_list else "Ninguna"
+
+    # Medications
+    medicamentos_list = []
+    if "Hipertensión" in comorbilidades:
+        medicamentos_list.append("Losartán 50mg c/24h")
+    if "Diabetes" in comorbilidades:
+        medicamentos_list.append("Metformina 850mg c/12h")
+
+    medicamentos = ", ".join(medicamentos_list) if medicamentos_list else "Ninguno"
+
+    return {
+        'folio_hospitalizacion': f"PRE-{patient['folio_hospitalizacion']}",
+        'patient_id': patient['id_paciente'],
+        'medico_user_id': doctor_id,
+        'nombres': patient['nombres'],
+        'apellidos': patient['apellidos'],
+        'fecha_nacimiento': patient['fecha_nacimiento'],
+        'medico': doctor_name,
+        'fecha_reporte': today - timedelta(days=rng.randint(0, 30)),
+        'medico_tratante': doctor_name,
+        'diagnostico_preoperatorio': rng.choice(DIAGNOSTICOS),
+
+        # Physical measurements
+        'peso': round(peso, 1),
+        'talla': round(talla, 1),
+        'imc': round(imc, 2),
+        'estado_fisico_asa': asa,
+
+        # Medical history
+        'comorbilidades': comorbilidades,
+        'medicamentos': medicamentos,
+        'alergias': rng.choice(["AINE", "Penicilina", "Latex", "Ninguna conocida"]),
+        'ayuno_hrs': rng.randint(8, 16),
+        'uso_glp1': rng.random() < 0.1,  # 10% use GLP1
+        'dosis_glp1': "1mg semanal" if rng.random() < 0.1 else "",
+        'tabaquismo': rng.random() < 0.2,  # 20% smokers
+
+        # Difficulty history
+        'antecedentes_dificultad': rng.random() < 0.1,  # 10% have previous difficulty
+        'descripcion_dificultad': (
+            "Intubación difícil previa, requirió videolaringoscopio" if rng.random() < 0.1 else ""
+        ),
+
+        # Evaluation
+        'evaluacion_preoperatoria': (
+            f"Paciente de {age} años, ASA {asa}, programado para cirugía electiva. Evaluación completa realizada."
+        ),
+
+        # USG
+        'uso_usg_gastrico': rng.random() < 0.3,  # 30% use USG
+        'usg_gastrico_ml': rng.randint(50, 200) if rng.random() < 0.3 else None,
+
+        # Vital signs
+        'fc': rng.randint(60, 100),
+        'ta': f"{rng.randint(110, 160)}/{rng.randint(70, 100)}",
+        'spo2_aire': rng.randint(94, 99),
+        'spo2_oxigeno': rng.randint(97, 100),
+        'glasgow': rng.choices([15, 14, 13], weights=[85, 10, 5])[0],
+
         # Airway assessment
-        patil_aldrete = random.choices([1, 2, 3, 4], weights=[40, 35, 20, 5])[0]
-        distancia_inter_incisiva = random.uniform(2.5, 5.5)
-        distancia_tiro_mentoniana = random.uniform(5.0, 8.0)
-        protrusion_mandibular = random.choices([1, 2, 3, 4], weights=[60, 25, 10, 5])[0]
-        
+        'mallampati': mallampati,
+        'patil_aldrete': rng.choices([1, 2, 3, 4], weights=[40, 35, 20, 5])[0],
+        'distancia_inter_incisiva': round(rng.uniform(2.5, 5.5), 1),
+        'distancia_tiro_mentoniana': round(rng.uniform(5.0, 8.0), 1),
+        'protrusion_mandibular': rng.choices([1, 2, 3, 4], weights=[60, 25, 10, 5])[0],
+
         # Risk scores
-        macocha = random.randint(0, 12)
-        stop_bang = random.randint(0, 8)
-        desviacion_traquea = random.uniform(0, 2.0)
-        
-        # Medical history based on age
-        comorbilidades_list = []
-        if age > 50:
-            if random.random() < 0.3:
-                comorbilidades_list.append("Hipertensión arterial")
-            if random.random() < 0.2:
-                comorbilidades_list.append("Diabetes mellitus tipo 2")
-            if random.random() < 0.15:
-                comorbilidades_list.append("Enfermedad coronaria")
-        
-        if imc > 30:
-            comorbilidades_list.append("Obesidad")
-        
-        comorbilidades = ", ".join(comorbilidades_list) if comorbilidades_list else "Ninguna"
-        
-        # Medications
-        medicamentos_list = []
-        if "Hipertensión" in comorbilidades:
-            medicamentos_list.append("Losartán 50mg c/24h")
-        if "Diabetes" in comorbilidades:
-            medicamentos_list.append("Metformina 850mg c/12h")
-        
-        medicamentos = ", ".join(medicamentos_list) if medicamentos_list else "Ninguno"
-        
-        # Allergies
-        alergias_options = ["AINE", "Penicilina", "Latex", "Ninguna conocida"]
-        alergias = random.choice(alergias_options)
-        
-        # Surgery details
-        diagnosticos = [
-            "Colecistitis crónica litiásica",
-            "Hernia inguinal derecha",
-            "Apendicitis aguda",
-            "Colelitiasis sintomática",
-            "Hernia umbilical",
-            "Masa abdominal por estudiar",
-            "Obstrucción intestinal",
-            "Tumor de colon",
-            "Hernia ventral",
-            "Patología benigna de tiroides"
+        'macocha': rng.randint(0, 12),
+        'stop_bang': rng.randint(0, 8),
+        'desviacion_traquea': round(rng.uniform(0, 2.0), 1),
+        'problemas_deglucion': rng.random() < 0.05,  # 5%
+        'estridor_laringeo': rng.random() < 0.02,  # 2%
+        'observaciones': "Paciente evaluado completamente, apto para cirugía programada.",
+    }
+
+
+def sample_postsurgery(rng, presurgery, especialidad):
+    """Field values of a sample post-surgery form"""
+    # Determine difficulty based on pre-surgery risk factors
+    is_difficult = (
+        presurgery['mallampati'] >= 3 or
+        presurgery['estado_fisico_asa'] >= 4 or
+        presurgery['imc'] >= 35 or
+        presurgery['antecedentes_dificultad']
+    )
+
+    # Locations
+    lugares = [
+        "Quirófano 1", "Quirófano 2", "Quirófano 3",
+        "Urgencias", "Sala de Procedimientos", "UCI"
+    ]
+
+    # Techniques based on difficulty
+    if is_difficult:
+        tecnicas = [
+            "Videolaringoscopía", "Intubación con fibrobroncoscopio",
+            "Intubación retrógrada", "Máscara laríngea como rescate"
         ]
-        
-        presurgery = PreSurgeryForm.objects.create(
-            folio_hospitalizacion=f'PRE-{patient.folio_hospitalizacion}',
-            nombres=patient.nombres,
-            apellidos=patient.apellidos,
-            fecha_nacimiento=patient.fecha_nacimiento,
-            medico=patient.medico.get_full_name(),
-            fecha_reporte=datetime.now().date() - timedelta(days=random.randint(0, 30)),
-            medico_tratante=patient.medico.get_full_name(),
-            diagnostico_preoperatorio=random.choice(diagnosticos),
-            
-            # Physical measurements
-            peso=round(peso, 1),
-            talla=round(talla, 1),
-            imc=round(imc, 2),
-            estado_fisico_asa=asa,
-            
-            # Medical history
-            comorbilidades=comorbilidades,
-            medicamentos=medicamentos,
-            alergias=alergias,
-            ayuno_hrs=random.randint(8, 16),
-            uso_glp1=random.random() < 0.1,  # 10% use GLP1
-            dosis_glp1="1mg semanal" if random.random() < 0.1 else "",
-            tabaquismo=random.random() < 0.2,  # 20% smokers
-            
-            # Difficulty history
-            antecedentes_dificultad=random.random() < 0.1,  # 10% have previous difficulty
-            descripcion_dificultad="Intubación difícil previa, requirió videolaringoscopio" if random.random() < 0.1 else "",
-            
-            # Evaluation
-            evaluacion_preoperatoria=f"Paciente de {age} años, ASA {asa}, programado para cirugía electiva. Evaluación completa realizada.",
-            
-            # USG
-            uso_usg_gastrico=random.random() < 0.3,  # 30% use USG
-            usg_gastrico_ml=random.randint(50, 200) if random.random() < 0.3 else None,
-            
-            # Vital signs
-            fc=fc,
-            ta=ta,
-            spo2_aire=spo2_aire,
-            spo2_oxigeno=spo2_oxigeno,
-            glasgow=glasgow,
-            
-            # Airway assessment
-            mallampati=mallampati,
-            patil_aldrete=patil_aldrete,
-            distancia_inter_incisiva=round(distancia_inter_incisiva, 1),
-            distancia_tiro_mentoniana=round(distancia_tiro_mentoniana, 1),
-            protrusion_mandibular=protrusion_mandibular,
-            
-            # Risk scores
-            macocha=macocha,
-            stop_bang=stop_bang,
-            desviacion_traquea=round(desviacion_traquea, 1),
-            problemas_deglucion=random.random() < 0.05,  # 5%
-            estridor_laringeo=random.random() < 0.02,  # 2%
-            observaciones="Paciente evaluado completamente, apto para cirugía programada."
-        )
-        
-        return presurgery
-
-    def create_sample_postsurgery(self, presurgery):
-        """Create a sample post-surgery form"""
-        # Get patient for context
-        patient_folio = presurgery.folio_hospitalizacion.replace('PRE-', '')
-        
-        # Determine difficulty based on pre-surgery risk factors
-        is_difficult = (
-            presurgery.mallampati >= 3 or 
-            presurgery.estado_fisico_asa >= 4 or 
-            presurgery.imc >= 35 or
-            presurgery.antecedentes_dificultad
-        )
-        
-        # Locations
-        lugares = [
-            "Quirófano 1", "Quirófano 2", "Quirófano 3",
-            "Urgencias", "Sala de Procedimientos", "UCI"
+    else:
+        tecnicas = [
+            "Laringoscopía directa", "Videolaringoscopía",
+            "Intubación orotraqueal estándar"
         ]
-        
-        # Techniques based on difficulty
-        if is_difficult:
-            tecnicas = [
-                "Videolaringoscopía", "Intubación con fibrobroncoscopio",
-                "Intubación retrógrada", "Máscara laríngea como rescate"
-            ]
-        else:
-            tecnicas = [
-                "Laringoscopía directa", "Videolaringoscopía",
-                "Intubación orotraqueal estándar"
-            ]
-        
-        # Number of attempts based on difficulty
-        if is_difficult:
-            numero_intentos = random.choices([1, 2, 3, 4], weights=[40, 35, 20, 5])[0]
-        else:
-            numero_intentos = random.choices([1, 2, 3], weights=[80, 15, 5])[0]
-        
-        # Cormack based on Mallampati and difficulty
-        if presurgery.mallampati >= 3:
-            cormack = random.choices([1, 2, 3, 4], weights=[10, 30, 40, 20])[0]
-        else:
-            cormack = random.choices([1, 2, 3, 4], weights=[50, 35, 12, 3])[0]
-        
-        # POGO based on Cormack
-        if cormack == 1:
-            pogo = random.randint(80, 100)
-        elif cormack == 2:
-            pogo = random.randint(50, 79)
-        elif cormack == 3:
-            pogo = random.randint(20, 49)
-        else:
-            pogo = random.randint(0, 19)
-        
-        # HAN classification based on difficulty
-        if numero_intentos == 1 and cormack <= 2:
-            han = 0  # No difficulty
-        elif numero_intentos <= 2 and cormack <= 3:
-            han = 1  # Slight difficulty
-        elif numero_intentos <= 3 or cormack == 4:
-            han = 2  # Moderate difficulty
-        else:
-            han = random.choice([3, 4])  # Severe difficulty
-        
-        # Complications based on difficulty and attempts
-        has_complications = (numero_intentos > 2 or han >= 3 or random.random() < 0.05)
-        
-        complicaciones_list = []
-        if has_complications:
-            possible_complications = [
-                "Hipoxemia transitoria",
-                "Bradicardia durante la inducción",
-                "Hipotensión post-inducción",
-                "Lesión dental menor",
-                "Laringoespasmo",
-                "Broncoespasmo"
-            ]
-            complicaciones_list = random.sample(possible_complications, random.randint(1, 2))
-        
-        # Anesthesia types
-        tipos_anestesia = [
-            "Anestesia general balanceada",
-            "Anestesia general endovenosa",
-            "Anestesia general inhalatoria",
-            "Anestesia combinada"
+
+    # Number of attempts based on difficulty
+    if is_difficult:
+        numero_intentos = rng.choices([1, 2, 3, 4], weights=[40, 35, 20, 5])[0]
+    else:
+        numero_intentos = rng.choices([1, 2, 3], weights=[80, 15, 5])[0]
+
+    # Cormack based on Mallampati and difficulty
+    if presurgery['mallampati'] >= 3:
+        cormack = rng.choices([1, 2, 3, 4], weights=[10, 30, 40, 20])[0]
+    else:
+        cormack = rng.choices([1, 2, 3, 4], weights=[50, 35, 12, 3])[0]
+
+    # POGO based on Cormack
+    if cormack == 1:
+        pogo = rng.randint(80, 100)
+    elif cormack == 2:
+        pogo = rng.randint(50, 79)
+    elif cormack == 3:
+        pogo = rng.randint(20, 49)
+    else:
+        pogo = rng.randint(0, 19)
+
+    # HAN classification based on difficulty
+    if numero_intentos == 1 and cormack <= 2:
+        han = 0  # No difficulty
+    elif numero_intentos <= 2 and cormack <= 3:
+        han = 1  # Slight difficulty
+    elif numero_intentos <= 3 or cormack == 4:
+        han = 2  # Moderate difficulty
+    else:
+        han = rng.choice([3, 4])  # Severe difficulty
+
+    # Complications based on difficulty and attempts
+    has_complications = (numero_intentos > 2 or han >= 3 or rng.random() < 0.05)
+
+    complicaciones_list = []
+    if has_complications:
+        possible_complications = [
+            "Hipoxemia transitoria",
+            "Bradicardia durante la inducción",
+            "Hipotensión post-inducción",
+            "Lesión dental menor",
+            "Laringoespasmo",
+            "Broncoespasmo"
         ]
-        
-        # Results based on complications
-        if has_complications:
-            resultados = [
-                "Intubación exitosa con complicaciones menores",
-                "Procedimiento completado satisfactoriamente con incidencias",
-                "Manejo exitoso de vía aérea con dificultades"
-            ]
-        else:
-            resultados = [
-                "Procedimiento sin complicaciones",
-                "Intubación exitosa al primer intento",
-                "Manejo de vía aérea sin incidencias"
-            ]
-        
-        # Specialty mapping
-        especialidades_map = {
-            'ANE': 'anestesiologia',
-            'ANP': 'anestesiologia_pediatrica',
-            'MEC': 'medicina_critica',
-            'MED': 'medicina_del_dolor',
-            'OTR': 'otra'
-        }
-        
-        # Get doctor's specialty or default
-        doctor_specialty = getattr(presurgery.medico, 'especialidad', 'ANE')
-        especialidad = especialidades_map.get(doctor_specialty, 'anestesiologia')
-        
-        postsurgery = PostDuringSurgeryForm.objects.create(
-            folio_hospitalizacion=presurgery,
-            
-            # Location and personnel
-            lugar_problema=random.choice(lugares),
-            presencia_anestesiologo=True,
-            
-            # Equipment and techniques
-            tecnica_utilizada=random.choice(tecnicas),
-            carro_via_aerea=random.random() < 0.8,  # 80% have difficult airway cart
-            tipo_video_laringoscopia="C-MAC" if "Video" in random.choice(tecnicas) else "",
-            
-            # Classifications
-            clasificacion_han=han,
-            aditamento_via_aerea=random.choice([
-                "Guía de Eschmann", "Estilete", "Ninguno", "Bougie"
-            ]),
-            tiempo_preoxigenacion=random.randint(3, 8),
-            
-            # Supraglottic device
-            uso_supraglotico=random.random() < 0.2,  # 20% use supraglottic
-            tipo_supraglotico="LMA Supreme #4" if random.random() < 0.2 else "",
-            problemas_supragloticos="Fuga aérea mínima" if random.random() < 0.1 else "",
-            
-            # Intubation details
-            tipo_intubacion=random.choice([
-                "Orotraqueal", "Nasotraqueal", "Traqueostomía"
-            ]),
-            numero_intentos=numero_intentos,
-            laringoscopia_directa=f"Cormack {cormack}, visualización {'buena' if cormack <= 2 else 'limitada'}",
-            cormack=cormack,
-            pogo=pogo,
-            
-            # Additional procedures
-            intubacion_tecnica_mixta="Videolaringoscopía + guía" if numero_intentos > 1 else "",
-            intubacion_despierto=random.random() < 0.05,  # 5% awake intubation
-            descripcion_intubacion_despierto="Sedación consciente con propofol y fentanilo" if random.random() < 0.05 else "",
-            
-            # Anesthesia details
-            tipo_anestesia=random.choice(tipos_anestesia),
-            sedacion=random.choice([
-                "Propofol + Fentanilo", "Midazolam + Fentanilo", "Dexmedetomidina"
-            ]),
-            cooperacion_paciente=random.choice([
-                "Excelente", "Buena", "Regular", "Limitada"
-            ]),
-            
-            # Emergency procedures
-            algoritmo_no_intubacion=numero_intentos >= 4,
-            crico_tiroidotomia=random.random() < 0.01,  # 1% need cricothyrotomy
-            traqueostomia_percutanea=random.random() < 0.02,  # 2% need tracheostomy
-            
-            # Outcomes
-            complicaciones=", ".join(complicaciones_list) if complicaciones_list else "",
-            resultado_final=random.choice(resultados),
-            
-            # Morbidity and mortality
-            morbilidad=has_complications and random.random() < 0.3,
-            descripcion_morbilidad="Hipoxemia transitoria sin secuelas" if has_complications and random.random() < 0.3 else "",
-            mortalidad=False,  # No mortality in sample data
-            descripcion_mortalidad="",
-            
-            # Medical personnel
-            nombre_anestesiologo=presurgery.medico,
-            cedula_profesional=f"{random.randint(1000000, 9999999)}",
-            especialidad=especialidad,
-            nombre_residente=f"Dr. Residente {random.randint(1, 20)}" if random.random() < 0.4 else ""
-        )
-        
-        return postsurgery
\ No newline at end of file
+        complicaciones_list = rng.sample(possible_complications, rng.randint(1, 2))
+
+    # Anesthesia types
+    tipos_anestesia = [
+        "Anestesia general balanceada",
+        "Anestesia general endovenosa",
+        "Anestesia general inhalatoria",
+        "Anestesia combinada"
+    ]
+
+    # Results based on complications
+    if has_complications:
+        resultados = [
+            "Intubación exitosa con complicaciones menores",
+            "Procedimiento completado satisfactoriamente con incidencias",
+            "Manejo exitoso de vía aérea con dificultades"
+        ]
+    else:
+        resultados = [
+            "Procedimiento sin complicaciones",
+            "Intubación exitosa al primer intento",
+            "Manejo de vía aérea sin incidencias"
+        ]
+
+    return {
+        'folio_hospitalizacion_id': presurgery['folio_hospitalizacion'],
+
+        # Location and personnel
+        'lugar_problema': rng.choice(lugares),
+        'presencia_anestesiologo': True,
+
+        # Equipment and techniques
+        'tecnica_utilizada': rng.choice(tecnicas),
+        'carro_via_aerea': rng.random() < 0.8,  # 80% have difficult airway cart
+        'tipo_video_laringoscopia': "C-MAC" if "Video" in rng.choice(tecnicas) else "",
+
+        # Classifications
+        'clasificacion_han': han,
+        'aditamento_via_aerea': rng.choice([
+            "Guía de Eschmann", "Estilete", "Ninguno", "Bougie"
+        ]),
+        'tiempo_preoxigenacion': rng.randint(3, 8),
+
+        # Supraglottic device
+        'uso_supraglotico': rng.random() < 0.2,  # 20% use supraglottic
+        'tipo_supraglotico': "LMA Supreme #4" if rng.random() < 0.2 else "",
+        'problemas_supragloticos': "Fuga aérea mínima" if rng.random() < 0.1 else "",
+
+        # Intubation details
+        'tipo_intubacion': rng.choice([
+            "Orotraqueal", "Nasotraqueal", "Traqueostomía"
+        ]),
+        'numero_intentos': numero_intentos,
+        'laringoscopia_directa': f"Cormack {cormack}, visualización {'buena' if cormack <= 2 else 'limitada'}",
+        'cormack': cormack,
+        'pogo': pogo,
+
+        # Additional procedures
+        'intubacion_tecnica_mixta': "Videolaringoscopía + guía" if numero_intentos > 1 else "",
+        'intubacion_despierto': rng.random() < 0.05,  # 5% awake intubation
+        'descripcion_intubacion_despierto': (
+            "Sedación consciente con propofol y fentanilo" if rng.random() < 0.05 else ""
+        ),
+
+        # Anesthesia details
+        'tipo_anestesia': rng.choice(tipos_anestesia),
+        'sedacion': rng.choice([
+            "Propofol + Fentanilo", "Midazolam + Fentanilo", "Dexmedetomidina"
+        ]),
+        'cooperacion_paciente': rng.choice([
+            "Excelente", "Buena", "Regular", "Limitada"
+        ]),
+
+        # Emergency procedures
+        'algoritmo_no_intubacion': numero_intentos >= 4,
+        'crico_tiroidotomia': rng.random() < 0.01,  # 1% need cricothyrotomy
+        'traqueostomia_percutanea': rng.random() < 0.02,  # 2% need tracheostomy
+
+        # Outcomes
+        'complicaciones': ", ".join(complicaciones_list) if complicaciones_list else "",
+        'resultado_final': rng.choice(resultados),
+
+        # Morbidity and mortality
+        'morbilidad': has_complications and rng.random() < 0.3,
+        'descripcion_morbilidad': (
+            "Hipoxemia transitoria sin secuelas" if has_complications and rng.random() < 0.3 else ""
+        ),
+        'mortalidad': False,  # No mortality in sample data
+        'descripcion_mortalidad': "",
+
+        # Medical personnel
+        'nombre_anestesiologo': presurgery['medico'],
+        'cedula_profesional': f"{rng.randint(1000000, 9999999)}",
+        'especialidad': especialidad,
+        'nombre_residente': f"Dr. Residente {rng.randint(1, 20)}" if rng.random() < 0.4 else ""
+    }
@@ -0,0 +1,47 @@
+# website/management/commands/rebuild_patient_search.py
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from website.models import Patient
+from website.utils.patient_search import (
+    PREFIX_FIELDS, fts_enabled, normalize_search_text, rebuild_search_table
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient search index after bulk writes that bypass the signals'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Patients updated per query when refreshing the prefix columns'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch, refreshed = [], 0
+
+        with transaction.atomic():
+            for patient in Patient.objects.only('pk', *PREFIX_FIELDS, *PREFIX_FIELDS.values()).iterator(batch_size):
+                values = {field: normalize_search_text(getattr(patient, source))
+                          for field, source in PREFIX_FIELDS.items()}
+                if all(getattr(patient, field) == value for field, value in values.items()):
+                    continue
+                for field, value in values.items():
+                    setattr(patient, field, value)
+                batch.append(patient)
+                if len(batch) >= batch_size:
+                    refreshed += len(batch)
+                    Patient.objects.bulk_update(batch, list(PREFIX_FIELDS))
+                    batch = []
+            if batch:
+                refreshed += len(batch)
+                Patient.objects.bulk_update(batch, list(PREFIX_FIELDS))
+
+            rebuild_search_table(connection)
+
+        self.stdout.write(self.style.SUCCESS(f'Refreshed search prefixes of {refreshed} patients'))
+        if fts_enabled(connection):
+            self.stdout.write(self.style.SUCCESS('Rebuilt the FTS5 search index'))
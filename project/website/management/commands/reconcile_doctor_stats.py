@@ -0,0 +1,58 @@
+# website/management/commands/reconcile_doctor_stats.py
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website.models import DoctorStats, MedicoUser
+from website.utils.doctor_stats import expected_doctor_stats, rebuild_doctor_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DoctorStats rollup from source tables and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--doctor',
+            help='Only reconcile the doctor with this username'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without rewriting the rollup'
+        )
+
+    def handle(self, *args, **options):
+        medico_ids = None
+        stored = DoctorStats.objects.all()
+        if options['doctor']:
+            try:
+                doctor = MedicoUser.objects.get(username=options['doctor'])
+            except MedicoUser.DoesNotExist:
+                raise CommandError(f"Doctor '{options['doctor']}' does not exist")
+            medico_ids = [doctor.pk]
+            stored = stored.filter(medico_id=doctor.pk)
+
+        fields = DoctorStats.counter_fields()
+        expected = expected_doctor_stats(medico_ids)
+        actual = {(row['medico_id'], row['day']): row for row in stored.values('medico_id', 'day', *fields)}
+
+        drift = 0
+        for key in sorted(set(expected) | set(actual), key=lambda key: (key[0], key[1])):
+            counters = expected.get(key, {})
+            row = actual.get(key, {})
+            for field in fields:
+                want, have = counters.get(field, 0), row.get(field, 0)
+                if not math.isclose(want, have, abs_tol=1e-6):
+                    drift += 1
+                    self.stdout.write(f'Doctor {key[0]} {key[1]} {field}: stored {have}, expected {want}')
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('DoctorStats matches the source tables'))
+            return
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{drift} drifted counters found (dry run, nothing changed)'))
+            return
+
+        rebuild_doctor_stats(medico_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt DoctorStats, fixing {drift} drifted counters'))
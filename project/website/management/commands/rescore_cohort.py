@@ -0,0 +1,208 @@
+# website/management/commands/rescore_cohort.py
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from website.models import PreSurgeryForm
+from website.utils.batch_risk import RISK_FIELDS, alert_levels, calculate_batch_risk
+from website.utils.risk_assessment import AdvancedRiskCalculator
+
+
+ADVANCED_FIELDS = ['advanced_risk_score', 'advanced_alert_level', 'advanced_risk_version', 'advanced_risk_date']
+
+# Columns read per form: the stored tier (for dry runs) ahead of the calculator inputs
+ROW_FIELDS = ('patient_id', 'advanced_alert_level', *RISK_FIELDS)
+INPUTS = slice(2, None)
+
+
+def score_chunk(rows, reference_date):
+    """Scores and alert levels of values_list(*RISK_FIELDS) rows; runs in a worker process"""
+    result = calculate_batch_risk(rows, reference_date=reference_date)
+    return result.total_score.tolist(), alert_levels(result.total_score).tolist()
+
+
+def read_chunks(after, chunk_size):
+    """ROW_FIELDS rows in primary key order, ``chunk_size`` at a time, starting after the ``after`` pk"""
+    forms = PreSurgeryForm.objects.order_by('pk')
+    while True:
+        page = forms.filter(pk__gt=after) if after is not None else forms
+        rows = list(page.values_list(*ROW_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][2]
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path, checkpoint):
+    with open(f'{path}.tmp', 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-score every pre-surgery form with AdvancedRiskCalculator across worker processes, '
+        'storing the comprehensive score and alert level'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Scoring processes; 1 scores in this process (default: one per CPU)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Forms read, scored and updated per chunk (default: 5000)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='JSON file recording the last updated form, for --resume'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue after the form recorded in --checkpoint, with its reference date'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many forms and patients would change alert level'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be at least 1')
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume needs --checkpoint')
+
+        after, processed = None, 0
+        reference_date = timezone.now().date()
+        if options['resume']:
+            checkpoint = read_checkpoint(options['checkpoint'])
+            if checkpoint is None:
+                raise CommandError(f"No checkpoint at {options['checkpoint']}")
+            if checkpoint['version'] != AdvancedRiskCalculator.VERSION:
+                raise CommandError(
+                    f"The checkpoint was written by calculator version {checkpoint['version']}, "
+                    f"not {AdvancedRiskCalculator.VERSION}; start a new run"
+                )
+            after, processed = checkpoint['last_pk'], checkpoint['processed']
+            # The whole run scores as of the same day, even across midnight
+            reference_date = date.fromisoformat(checkpoint['reference_date'])
+
+        remaining = PreSurgeryForm.objects.filter(pk__gt=after) if after is not None else PreSurgeryForm.objects
+        total = processed + remaining.count()
+        self.stdout.write(
+            f'Scoring {total - processed:,} of {total:,} forms with calculator version '
+            f'{AdvancedRiskCalculator.VERSION} as of {reference_date} ({options["workers"]} workers)'
+            f'{" - dry run" if options["dry_run"] else ""}...'
+        )
+
+        self.transitions = Counter()
+        self.changed_patients = set()
+        started, start_count = time.perf_counter(), processed
+        for rows, (scores, levels) in self.score(read_chunks(after, options['chunk_size']), reference_date, options):
+            if options['dry_run']:
+                self.count_transitions(rows, levels)
+            else:
+                self.store(rows, scores, levels, reference_date)
+            processed += len(rows)
+            if options['checkpoint'] and not options['dry_run']:
+                write_checkpoint(options['checkpoint'], {
+                    'last_pk': rows[-1][2],
+                    'processed': processed,
+                    'reference_date': reference_date.isoformat(),
+                    'version': AdvancedRiskCalculator.VERSION,
+                })
+            self.report_progress(processed, total, processed - start_count, time.perf_counter() - started)
+
+        if options['checkpoint'] and not options['dry_run'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+
+        elapsed = time.perf_counter() - started
+        rate = (processed - start_count) / elapsed if elapsed else 0
+        if options['dry_run']:
+            changed = sum(count for (old, new), count in self.transitions.items() if old and old != new)
+            self.stdout.write(self.style.SUCCESS(
+                f'{changed:,} forms ({len(self.changed_patients):,} patients) would change alert level'
+            ))
+            for (old, new), count in sorted(self.transitions.items()):
+                if old and old != new:
+                    self.stdout.write(f'  {old:>8} -> {new:<8} {count:,}')
+            unscored = sum(count for (old, _new), count in self.transitions.items() if not old)
+            if unscored:
+                self.stdout.write(f'{unscored:,} forms have no stored alert level yet')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Updated {processed - start_count:,} forms in {elapsed:.1f}s ({rate:,.0f} rows/s)'
+            ))
+
+    def score(self, chunks, reference_date, options):
+        """
+        Yield ``(rows, (scores, levels))`` per chunk, in primary key order. With
+        several workers, up to two chunks per worker are scored while the
+        results of earlier ones are written.
+        """
+        if options['workers'] == 1:
+            for rows in chunks:
+                yield rows, score_chunk([row[INPUTS] for row in rows], reference_date)
+            return
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            pending = deque()
+            for rows in chunks:
+                pending.append((rows, executor.submit(score_chunk, [row[INPUTS] for row in rows], reference_date)))
+                if len(pending) >= 2 * options['workers']:
+                    rows, future = pending.popleft()
+                    yield rows, future.result()
+            while pending:
+                rows, future = pending.popleft()
+                yield rows, future.result()
+
+    def store(self, rows, scores, levels, reference_date):
+        now = timezone.now()
+        forms = [
+            PreSurgeryForm(
+                pk=row[2],
+                advanced_risk_score=score,
+                advanced_alert_level=level,
+                advanced_risk_version=AdvancedRiskCalculator.VERSION,
+                advanced_risk_date=reference_date,
+                # bulk_update does not apply auto_now; incremental snapshots follow updated_at
+                updated_at=now,
+            )
+            for row, score, level in zip(rows, scores, levels)
+        ]
+        with transaction.atomic():
+            PreSurgeryForm.objects.bulk_update(forms, [*ADVANCED_FIELDS, 'updated_at'], batch_size=500)
+
+    def count_transitions(self, rows, levels):
+        for row, level in zip(rows, levels):
+            patient_id, old_level, folio = row[0], row[1], row[2]
+            self.transitions[(old_level, level)] += 1
+            if old_level and old_level != level:
+                self.changed_patients.add(patient_id or folio)
+
+    def report_progress(self, processed, total, done, elapsed):
+        rate = done / elapsed if elapsed else 0
+        eta = timedelta(seconds=round((total - processed) / rate)) if rate else '?'
+        self.stdout.write(f'  {processed:>10,} / {total:,} forms | {rate:>9,.0f} rows/s | ETA {eta}')
@@ -0,0 +1,53 @@
+# website/management/commands/run_export_jobs.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from website.models import ExportJob
+from website.utils.export_jobs import (
+    next_pending_job, purge_expired_exports, reclaim_abandoned_jobs, run_export_job
+)
+
+
+class Command(BaseCommand):
+    help = 'Run queued export jobs and delete expired export files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling for new jobs'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds between queue checks while idle (default: 2)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            purged = purge_expired_exports()
+            if purged:
+                self.stdout.write(f'Deleted {purged} expired exports')
+            reclaimed = reclaim_abandoned_jobs()
+            if reclaimed:
+                self.stdout.write(self.style.WARNING(f'Reclaimed {reclaimed} abandoned exports'))
+
+            job_id = next_pending_job()
+            if job_id is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            job = run_export_job(job_id)
+            if job is None:
+                # Claimed by another worker
+                continue
+            if job.status == ExportJob.STATUS_DONE:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Export {job.pk} ({job.format}) done: {job.processed_rows} rows, {job.file.name}'
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f'Export {job.pk} ({job.format}) failed: {job.error}'))
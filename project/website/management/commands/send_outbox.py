@@ -0,0 +1,39 @@
+# website/management/commands/send_outbox.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from website.utils.email_outbox import BATCH_SIZE, send_pending_emails
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox emails in batches over one SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no email is due instead of polling for new ones'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds between outbox checks while idle (default: 5)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'Emails sent per connection (default: {BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            run = send_pending_emails(options['batch_size'])
+            if run.sent or run.retrying or run.failed:
+                self.stdout.write(f'Sent {run.sent}, retrying {run.retrying}, failed {run.failed}')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
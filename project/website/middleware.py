@@ -0,0 +1,170 @@
+# website/middleware.py
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .routers import pin_to_primary
+from .utils.query_inspection import QueryRecorder, RepeatedQueryDetector, RepeatedQueryError, recording
+from .utils.request_metrics import request_metrics
+
+
+# Method labels of the request metrics; anything else is counted as 'other'
+KNOWN_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'})
+
+slow_request_logger = logging.getLogger('website.slow_requests')
+repeated_query_logger = logging.getLogger('website.repeated_queries')
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the latency, database queries and response size of every request by
+    view (see website/utils/request_metrics.py, served at /metrics). Requests
+    slower than settings.SLOW_REQUEST_SECONDS are logged, a sampled fraction of
+    them (SLOW_REQUEST_SAMPLE_RATE), with their SLOW_REQUEST_TOP_QUERIES slowest
+    queries.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = new_recorder()
+        start = time.perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        finish_request(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = new_recorder()
+        start = time.perf_counter()
+        with recording(recorder):
+            response = await self.get_response(request)
+        finish_request(request, response, time.perf_counter() - start, recorder)
+        return response
+
+
+def new_recorder():
+    slow = getattr(settings, 'SLOW_REQUEST_SECONDS', None) is not None
+    return QueryRecorder(getattr(settings, 'SLOW_REQUEST_TOP_QUERIES', 5) if slow else 0)
+
+
+def finish_request(request, response, elapsed, recorder):
+    view = view_label(request)
+    request_metrics.observe(
+        view, method_label(request), response.status_code, elapsed, recorder.count, recorder.seconds,
+        response_size(response)
+    )
+
+    slow_seconds = getattr(settings, 'SLOW_REQUEST_SECONDS', None)
+    if slow_seconds is not None and elapsed >= slow_seconds \
+            and random.random() < getattr(settings, 'SLOW_REQUEST_SAMPLE_RATE', 1.0):
+        log_slow_request(request, view, response, elapsed, recorder)
+
+
+def view_label(request):
+    match = request.resolver_match
+    return (match.view_name or match._func_path) if match else 'unresolved'
+
+
+def method_label(request):
+    # Clients choose the method, so it is bounded like the view name
+    return request.method if request.method in KNOWN_METHODS else 'other'
+
+
+def response_size(response):
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    if not response.streaming:
+        return len(response.content)
+    return None
+
+
+def log_slow_request(request, view, response, elapsed, recorder):
+    queries = ''.join(
+        f'\n  {seconds * 1000:8.1f} ms [{alias}] {sql[:500]}'
+        for seconds, _order, alias, sql in sorted(recorder.slowest, reverse=True)
+    )
+    slow_request_logger.warning(
+        "Slow request %s %s (%s) -> %s in %.0f ms, %s queries in %.0f ms%s",
+        request.method, request.path, view, response.status_code, elapsed * 1000,
+        recorder.count, recorder.seconds * 1000, queries
+    )
+
+
+class RepeatedQueryMiddleware:
+    """
+    Flag statements run more than settings.REPEATED_QUERY_THRESHOLD times in
+    one request (usually an N+1 loop), with the project stack they came from.
+    Only active with settings.DETECT_REPEATED_QUERIES; logs the statements, or
+    fails the request with settings.REPEATED_QUERY_RAISE (for tests).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DETECT_REPEATED_QUERIES', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        detector = RepeatedQueryDetector()
+        with recording(detector):
+            response = self.get_response(request)
+        report_repeated_queries(request, detector)
+        return response
+
+    async def __acall__(self, request):
+        detector = RepeatedQueryDetector()
+        with recording(detector):
+            response = await self.get_response(request)
+        report_repeated_queries(request, detector)
+        return response
+
+
+def report_repeated_queries(request, detector):
+    report = detector.report()
+    if not report:
+        return
+    message = f'{request.method} {request.path} ({view_label(request)}): {report}'
+    if getattr(settings, 'REPEATED_QUERY_RAISE', False):
+        raise RepeatedQueryError(message)
+    repeated_query_logger.warning(message)
+
+
+class PrimaryPinningMiddleware:
+    """
+    After a successful write request (POST, PUT, PATCH, DELETE), pin the user's
+    analytics reads to the primary database for settings.REPLICA_PIN_SECONDS,
+    so their dashboards include what they just saved (see routers.py)
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in self.SAFE_METHODS and response.status_code < 400 \
+                and request.user.is_authenticated:
+            pin_to_primary(request)
+        return response
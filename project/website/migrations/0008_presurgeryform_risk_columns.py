@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0007_alter_postduringsurgeryform_nombre_residente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='risk_factors',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Factores de Riesgo'),
+        ),
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='risk_level',
+            field=models.CharField(blank=True, editable=False, max_length=20, verbose_name='Nivel de Riesgo'),
+        ),
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='risk_score',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Puntaje de Riesgo'),
+        ),
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='risk_version',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='Versión del Cálculo de Riesgo'),
+        ),
+    ]
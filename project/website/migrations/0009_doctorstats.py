@@ -0,0 +1,74 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0008_presurgeryform_risk_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Día')),
+                ('patients', models.IntegerField(default=0)),
+                ('surgeries', models.IntegerField(default=0)),
+                ('risk_count', models.IntegerField(default=0)),
+                ('risk_total', models.IntegerField(default=0)),
+                ('risk_low', models.IntegerField(default=0)),
+                ('risk_moderate', models.IntegerField(default=0)),
+                ('risk_high', models.IntegerField(default=0)),
+                ('risk_critical', models.IntegerField(default=0)),
+                ('high_mallampati', models.IntegerField(default=0)),
+                ('high_asa', models.IntegerField(default=0)),
+                ('asa_1', models.IntegerField(default=0)),
+                ('asa_2', models.IntegerField(default=0)),
+                ('asa_3', models.IntegerField(default=0)),
+                ('asa_4', models.IntegerField(default=0)),
+                ('asa_5', models.IntegerField(default=0)),
+                ('asa_6', models.IntegerField(default=0)),
+                ('mallampati_1', models.IntegerField(default=0)),
+                ('mallampati_2', models.IntegerField(default=0)),
+                ('mallampati_3', models.IntegerField(default=0)),
+                ('mallampati_4', models.IntegerField(default=0)),
+                ('bmi_count', models.IntegerField(default=0)),
+                ('bmi_total', models.FloatField(default=0)),
+                ('bmi_high', models.IntegerField(default=0)),
+                ('bmi_underweight', models.IntegerField(default=0)),
+                ('bmi_normal', models.IntegerField(default=0)),
+                ('bmi_overweight', models.IntegerField(default=0)),
+                ('bmi_obese_class_1', models.IntegerField(default=0)),
+                ('bmi_obese_class_2', models.IntegerField(default=0)),
+                ('bmi_obese_class_3', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('with_complications', models.IntegerField(default=0)),
+                ('with_morbidity', models.IntegerField(default=0)),
+                ('with_mortality', models.IntegerField(default=0)),
+                ('successful', models.IntegerField(default=0)),
+                ('first_attempt', models.IntegerField(default=0)),
+                ('multiple_attempts', models.IntegerField(default=0)),
+                ('difficult', models.IntegerField(default=0)),
+                ('attempts_count', models.IntegerField(default=0)),
+                ('attempts_total', models.IntegerField(default=0)),
+                ('complication_intubacion_dificil', models.IntegerField(default=0)),
+                ('complication_broncoaspiracion', models.IntegerField(default=0)),
+                ('complication_hipoxemia', models.IntegerField(default=0)),
+                ('complication_laringoespasmo', models.IntegerField(default=0)),
+                ('complication_traumatismo_dental', models.IntegerField(default=0)),
+                ('complication_esofagica', models.IntegerField(default=0)),
+                ('complication_neumotorax', models.IntegerField(default=0)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL, verbose_name='Médico')),
+            ],
+            options={
+                'verbose_name': 'Estadística por Médico',
+                'verbose_name_plural': 'Estadísticas por Médico',
+                'constraints': [models.UniqueConstraint(fields=('medico', 'day'), name='unique_doctor_stats_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0009_doctorstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('folio_hospitalizacion', models.CharField(max_length=50, verbose_name='Folio Hospitalización')),
+                ('action', models.CharField(choices=[('add', 'Alerta nueva'), ('update', 'Alerta actualizada'), ('remove', 'Alerta retirada')], max_length=10)),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_events', to=settings.AUTH_USER_MODEL, verbose_name='Médico')),
+            ],
+            options={
+                'verbose_name': 'Evento de Alerta',
+                'verbose_name_plural': 'Eventos de Alerta',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['medico', 'id'], name='website_ale_medico__d380ab_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_relations(apps, schema_editor):
+    """Link existing forms through the PRE-<patient folio> key and the doctor's name"""
+    PreSurgeryForm = apps.get_model('website', 'PreSurgeryForm')
+    Patient = apps.get_model('website', 'Patient')
+    MedicoUser = apps.get_model('website', 'MedicoUser')
+
+    patients = {
+        folio: (pk, medico_id)
+        for pk, folio, medico_id in Patient.objects.values_list('pk', 'folio_hospitalizacion', 'medico_id')
+    }
+    doctors_by_name = {}
+    for pk, nombre, apellidos in MedicoUser.objects.values_list('pk', 'nombre', 'apellidos'):
+        doctors_by_name.setdefault(f"{nombre} {apellidos}", pk)
+
+    forms = []
+    for form in PreSurgeryForm.objects.filter(patient__isnull=True).only('pk', 'medico'):
+        patient_id, medico_id = patients.get(form.pk.removeprefix('PRE-'), (None, None))
+        form.patient_id = patient_id
+        form.medico_user_id = medico_id or doctors_by_name.get(form.medico)
+        forms.append(form)
+    PreSurgeryForm.objects.bulk_update(forms, ['patient', 'medico_user'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0010_alertevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='medico_user',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='presurgery_forms', to=settings.AUTH_USER_MODEL, verbose_name='Médico Responsable'),
+        ),
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='patient',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='website.patient', verbose_name='Paciente'),
+        ),
+        migrations.RunPython(backfill_relations, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='presurgeryform',
+            index=models.Index(fields=['medico_user', 'fecha_reporte'], name='website_pre_medico__fba210_idx'),
+        ),
+    ]
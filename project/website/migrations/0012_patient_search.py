@@ -0,0 +1,83 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:58
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Frozen copies of website/utils/patient_search.py as of this migration
+
+PREFIX_FIELDS = {
+    'search_folio': 'folio_hospitalizacion',
+    'search_nombres': 'nombres',
+    'search_apellidos': 'apellidos',
+}
+
+
+def normalize_search_text(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower().strip()
+
+
+def fts_enabled(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def backfill_prefixes(apps, schema_editor):
+    Patient = apps.get_model('website', 'Patient')
+    patients = list(Patient.objects.only('pk', *PREFIX_FIELDS.values()))
+    for patient in patients:
+        for search_field, source_field in PREFIX_FIELDS.items():
+            setattr(patient, search_field, normalize_search_text(getattr(patient, source_field)))
+    Patient.objects.bulk_update(patients, list(PREFIX_FIELDS), batch_size=500)
+
+
+def create_fts_table(apps, schema_editor):
+    if not fts_enabled(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS website_patient_search USING fts5("
+            "folio, nombres, apellidos, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            'INSERT INTO website_patient_search (rowid, folio, nombres, apellidos) '
+            'SELECT rowid, folio_hospitalizacion, nombres, apellidos FROM website_patient'
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS website_patient_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0011_presurgery_patient_medico_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='search_apellidos',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_folio',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search_nombres',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_prefixes, migrations.RunPython.noop),
+        # SQLite only; other backends search the prefix columns
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0013_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postduringsurgeryform',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última Actualización'),
+        ),
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última Actualización'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0015_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='advanced_alert_level',
+            field=models.CharField(blank=True, editable=False, max_length=10, verbose_name='Nivel de Alerta Integral'),
+        ),
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='advanced_risk_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Fecha del Riesgo Integral'),
+        ),
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='advanced_risk_score',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Puntaje de Riesgo Integral'),
+        ),
+        migrations.AddField(
+            model_name='presurgeryform',
+            name='advanced_risk_version',
+            field=models.CharField(blank=True, editable=False, max_length=20, verbose_name='Versión del Riesgo Integral'),
+        ),
+    ]
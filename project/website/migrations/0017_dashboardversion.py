@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0016_presurgeryform_advanced_risk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardVersion',
+            fields=[
+                ('medico', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_version', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Médico')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Versión del Dashboard',
+                'verbose_name_plural': 'Versiones del Dashboard',
+            },
+        ),
+    ]
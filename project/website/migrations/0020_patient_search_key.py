@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:52
+
+from django.db import migrations
+
+
+def fts_enabled(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def create_table(connection, key_column):
+    """The search table keyed by ``key_column``: 'id_paciente' (stored) or 'rowid'"""
+    key = 'id_paciente UNINDEXED, ' if key_column == 'id_paciente' else ''
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS website_patient_search')
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE website_patient_search USING fts5("
+            f"{key}folio, nombres, apellidos, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f'INSERT INTO website_patient_search ({key_column}, folio, nombres, apellidos) '
+            f'SELECT {key_column}, folio_hospitalizacion, nombres, apellidos FROM website_patient'
+        )
+
+
+def key_by_patient(apps, schema_editor):
+    if fts_enabled(schema_editor.connection):
+        create_table(schema_editor.connection, 'id_paciente')
+
+
+def key_by_rowid(apps, schema_editor):
+    if fts_enabled(schema_editor.connection):
+        create_table(schema_editor.connection, 'rowid')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0019_outboxemail_active_dedupe'),
+    ]
+
+    operations = [
+        # SQLite only; other backends search the prefix columns
+        migrations.RunPython(key_by_patient, key_by_rowid),
+    ]
@@ -0,0 +1,180 @@
+# Generated by Django 5.1.2 on 2026-10-18 06:05
+
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.db import migrations
+from django.utils import timezone
+
+
+# Frozen copies, as of this migration, of the airway-basic model in
+# website/utils/risk_models.py and the rollup in website/utils/doctor_stats.py
+
+RISK_VERSION = 'basic-1'
+
+# (field, test, points, label)
+RISK_RULES = (
+    ('mallampati', lambda value: value >= 3, 25, 'Mallampati Clase {value}'),
+    ('estado_fisico_asa', lambda value: value >= 4, 30, 'ASA {value}'),
+    ('imc', lambda value: value >= 35, 15, 'IMC {value} (Obesidad)'),
+    ('antecedentes_dificultad', bool, 40, 'Antecedentes de dificultad'),
+    ('patil_aldrete', lambda value: value >= 3, 20, 'Patil-Aldrete {value}'),
+    ('distancia_inter_incisiva', lambda value: value < 3, 10, 'Distancia inter-incisiva < 3cm'),
+)
+
+RISK_LEVELS = ((70, 'ALTO'), (40, 'MODERADO'), (0, 'BAJO'))
+
+COMPLICATION_FIELDS = {
+    'intubacion dificil': 'complication_intubacion_dificil',
+    'broncoaspiracion': 'complication_broncoaspiracion',
+    'hipoxemia': 'complication_hipoxemia',
+    'laringoespasmo': 'complication_laringoespasmo',
+    'traumatismo dental': 'complication_traumatismo_dental',
+    'esofagica': 'complication_esofagica',
+    'neumotorax': 'complication_neumotorax',
+}
+
+
+def normalize_text(text):
+    text = (text or '').casefold()
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+
+
+def risk_columns(form):
+    score, factors = 0, []
+    for field, test, points, label in RISK_RULES:
+        value = getattr(form, field)
+        if value is not None and test(value):
+            score += points
+            factors.append(label.format(value=value))
+    score = min(score, 100)
+    level = next(level for min_score, level in RISK_LEVELS if score >= min_score)
+    return score, level, factors
+
+
+def presurgery_counters(form):
+    counters = Counter(surgeries=1)
+    if form.risk_score is not None:
+        counters['risk_count'] += 1
+        counters['risk_total'] += form.risk_score
+        if form.risk_score < 40:
+            counters['risk_low'] += 1
+        elif form.risk_score < 60:
+            counters['risk_moderate'] += 1
+        elif form.risk_score < 80:
+            counters['risk_high'] += 1
+        else:
+            counters['risk_critical'] += 1
+
+    if form.mallampati is not None:
+        counters[f'mallampati_{form.mallampati}'] += 1
+        if form.mallampati >= 3:
+            counters['high_mallampati'] += 1
+    if form.estado_fisico_asa is not None:
+        counters[f'asa_{form.estado_fisico_asa}'] += 1
+        if form.estado_fisico_asa >= 4:
+            counters['high_asa'] += 1
+
+    imc = form.imc
+    if imc is not None:
+        counters['bmi_count'] += 1
+        counters['bmi_total'] += imc
+        if imc >= 35:
+            counters['bmi_high'] += 1
+        if imc < 18.5:
+            counters['bmi_underweight'] += 1
+        elif 18.5 <= imc <= 24.9:
+            counters['bmi_normal'] += 1
+        elif 25 <= imc <= 29.9:
+            counters['bmi_overweight'] += 1
+        elif 30 <= imc <= 34.9:
+            counters['bmi_obese_class_1'] += 1
+        elif 35 <= imc <= 39.9:
+            counters['bmi_obese_class_2'] += 1
+        elif imc >= 40:
+            counters['bmi_obese_class_3'] += 1
+    return counters
+
+
+def postsurgery_counters(form):
+    counters = Counter(completed=1)
+    has_complications = bool(form.complicaciones)
+    if has_complications:
+        counters['with_complications'] += 1
+        complications = normalize_text(form.complicaciones)
+        for keyword, field in COMPLICATION_FIELDS.items():
+            if keyword in complications:
+                counters[field] += 1
+    if form.morbilidad:
+        counters['with_morbidity'] += 1
+    if form.mortalidad:
+        counters['with_mortality'] += 1
+    if not has_complications and not form.morbilidad and not form.mortalidad:
+        counters['successful'] += 1
+
+    attempts = form.numero_intentos
+    if attempts is not None:
+        counters['attempts_count'] += 1
+        counters['attempts_total'] += attempts
+        if attempts == 1:
+            counters['first_attempt'] += 1
+        if attempts > 1:
+            counters['multiple_attempts'] += 1
+        if attempts >= 3:
+            counters['difficult'] += 1
+    return counters
+
+
+def backfill_risk_columns(apps, schema_editor):
+    """Score the forms saved before the risk columns existed"""
+    PreSurgeryForm = apps.get_model('website', 'PreSurgeryForm')
+    now = timezone.now()
+    forms = []
+    for form in PreSurgeryForm.objects.filter(risk_version='').iterator():
+        form.risk_score, form.risk_level, form.risk_factors = risk_columns(form)
+        form.risk_version = RISK_VERSION
+        # bulk_update does not apply auto_now; incremental snapshots follow updated_at
+        form.updated_at = now
+        forms.append(form)
+    PreSurgeryForm.objects.bulk_update(
+        forms, ['risk_score', 'risk_level', 'risk_factors', 'risk_version', 'updated_at'], batch_size=500
+    )
+
+
+def rebuild_doctor_stats(apps, schema_editor):
+    """Rebuild the whole rollup from the patients and forms, as reconcile_doctor_stats --fix does"""
+    DoctorStats = apps.get_model('website', 'DoctorStats')
+    Patient = apps.get_model('website', 'Patient')
+    PreSurgeryForm = apps.get_model('website', 'PreSurgeryForm')
+    PostDuringSurgeryForm = apps.get_model('website', 'PostDuringSurgeryForm')
+
+    expected = defaultdict(Counter)
+    for patient in Patient.objects.filter(activo=True).iterator():
+        if patient.fecha_registro:
+            expected[(patient.medico_id, timezone.localdate(patient.fecha_registro))]['patients'] += 1
+
+    postsurgery = {form.pk: form for form in PostDuringSurgeryForm.objects.iterator()}
+    for form in PreSurgeryForm.objects.filter(medico_user__isnull=False).iterator():
+        counters = presurgery_counters(form)
+        if form.pk in postsurgery:
+            counters.update(postsurgery_counters(postsurgery[form.pk]))
+        expected[(form.medico_user_id, form.fecha_reporte)].update(counters)
+
+    DoctorStats.objects.all().delete()
+    DoctorStats.objects.bulk_create([
+        DoctorStats(medico_id=medico_id, day=day, **counters)
+        for (medico_id, day), counters in expected.items()
+        if day is not None
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0020_patient_search_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_risk_columns, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_doctor_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0021_backfill_doctor_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('folio_hospitalizacion', models.CharField(max_length=50, verbose_name='Folio Hospitalización')),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Formulario Eliminado',
+                'verbose_name_plural': 'Formularios Eliminados',
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+    ]
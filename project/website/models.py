@@ -11,6 +11,27 @@ from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 import uuid
 from django.urls import reverse
+from django.utils import timezone
+
+from .utils.patient_search import PREFIX_FIELDS, normalize_search_text
+from .utils.risk_models import get_risk_model
+
+
+class PatientQuerySet(models.QuerySet):
+    """QuerySet helpers for patient listings"""
+
+    def with_form_status(self):
+        """
+        Annotate each patient with ``has_presurgery``, ``has_postsurgery`` and
+        ``presurgery_folio`` (the key used by both form detail URLs) in the same query
+        """
+        presurgery = PreSurgeryForm.objects.filter(patient=models.OuterRef('pk'))
+        postsurgery = PostDuringSurgeryForm.objects.filter(folio_hospitalizacion__patient=models.OuterRef('pk'))
+        return self.annotate(
+            has_presurgery=models.Exists(presurgery),
+            has_postsurgery=models.Exists(postsurgery),
+            presurgery_folio=models.Subquery(presurgery.values('folio_hospitalizacion')[:1]),
+        )
 
 
 class Patient(models.Model):
@@ -70,6 +91,13 @@ class Patient(models.Model):
         verbose_name=_("Activo")
     )
 
+    # Normalized search prefixes, for databases without SQLite FTS5 (see utils.patient_search)
+    search_folio = models.CharField(max_length=50, blank=True, default='', editable=False, db_index=True)
+    search_nombres = models.CharField(max_length=100, blank=True, default='', editable=False, db_index=True)
+    search_apellidos = models.CharField(max_length=100, blank=True, default='', editable=False, db_index=True)
+
+    objects = PatientQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Paciente")
         verbose_name_plural = _("Pacientes")
@@ -84,6 +112,14 @@ class Patient(models.Model):
 
     def get_absolute_url(self):
         return reverse('patient-detail', args=[str(self.id_paciente)])
+
+    def save(self, *args, **kwargs):
+        for search_field, source_field in PREFIX_FIELDS.items():
+            setattr(self, search_field, normalize_search_text(getattr(self, source_field)))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *PREFIX_FIELDS}
+        super().save(*args, **kwargs)
     
     # Add to Patient model for better folio validation
     def clean(self):
@@ -206,10 +242,52 @@ class MedicoUser(AbstractUser):
         }
         return specialty_dict.get(self.especialidad, self.especialidad)
 
+class PreSurgeryFormQuerySet(models.QuerySet):
+    """QuerySet helpers for the persisted airway risk columns"""
+
+    def stale_risk(self):
+        """Forms whose stored risk was computed by a different version than the active risk model"""
+        return self.exclude(risk_version=get_risk_model().version)
+
+    def with_risk_score(self, model=None):
+        """
+        Annotate ``current_risk_score`` and ``current_risk_level``, the score of
+        the risk model (default: the active one) computed by the database, so
+        forms can be filtered, ordered and paginated on it even when their
+        stored columns are stale
+        """
+        risk_model = get_risk_model(model)
+        return self.annotate(current_risk_score=risk_model.score_expression(self.model)).annotate(
+            current_risk_level=risk_model.level_expression('current_risk_score')
+        )
+
+    def refresh_risk_scores(self, batch_size=500):
+        """Recompute and store the risk columns for every form in the queryset"""
+        pks = list(self.values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            forms = list(self.model.objects.filter(pk__in=pks[start:start + batch_size]))
+            now = timezone.now()
+            for form in forms:
+                for field, value in form.compute_risk().items():
+                    setattr(form, field, value)
+                # bulk_update does not apply auto_now
+                form.updated_at = now
+            self.model.objects.bulk_update(forms, [*self.model.RISK_FIELDS, 'updated_at'])
+
+        if pks:
+            # bulk_update skips the signals that maintain DoctorStats
+            from .utils.doctor_stats import doctors_for_presurgery, rebuild_doctor_stats
+            rebuild_doctor_stats(doctors_for_presurgery(pks))
+        return len(pks)
+
+
 class PreSurgeryForm(models.Model):
     """
     Model for pre-surgery evaluation form containing patient information and initial assessments.
     """
+    # Columns derived from the active risk model and kept in sync on save
+    RISK_FIELDS = ['risk_score', 'risk_level', 'risk_factors', 'risk_version']
+
     ASA_CHOICES = [
         (1, 'I'),
         (2, 'II'),
@@ -239,6 +317,25 @@ class PreSurgeryForm(models.Model):
         upload_to='codigos_barra/',
         verbose_name="Código de Barras"
     )
+
+    # Owning patient and doctor; save() fills them from the folio when missing
+    patient = models.ForeignKey(
+        Patient,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_("Paciente")
+    )
+    medico_user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='presurgery_forms',
+        verbose_name=_("Médico Responsable")
+    )
     
     # Medical Information
     fecha_reporte = models.DateField(verbose_name="Fecha de Reporte")
@@ -373,6 +470,66 @@ class PreSurgeryForm(models.Model):
         blank=True,
         verbose_name="Observaciones"
     )
+    
+    # Persisted risk assessment of the active risk model (see utils/risk_models.py)
+    risk_score = models.IntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="Puntaje de Riesgo"
+    )
+    risk_level = models.CharField(
+        max_length=20,
+        blank=True,
+        editable=False,
+        verbose_name="Nivel de Riesgo"
+    )
+    risk_factors = models.JSONField(
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name="Factores de Riesgo"
+    )
+    risk_version = models.CharField(
+        max_length=20,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="Versión del Cálculo de Riesgo"
+    )
+
+    # Comprehensive AdvancedRiskCalculator score as of advanced_risk_date,
+    # written in bulk by manage.py rescore_cohort
+    advanced_risk_score = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Puntaje de Riesgo Integral"
+    )
+    advanced_alert_level = models.CharField(
+        max_length=10,
+        blank=True,
+        editable=False,
+        verbose_name="Nivel de Alerta Integral"
+    )
+    advanced_risk_version = models.CharField(
+        max_length=20,
+        blank=True,
+        editable=False,
+        verbose_name="Versión del Riesgo Integral"
+    )
+    advanced_risk_date = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Fecha del Riesgo Integral"
+    )
+
+    # Change tracking for incremental snapshots (see utils.clinical_snapshot)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Última Actualización")
+
+    objects = PreSurgeryFormQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.folio_hospitalizacion} - {self.nombres} {self.apellidos}"
@@ -380,6 +537,33 @@ class PreSurgeryForm(models.Model):
     class Meta:
         verbose_name = _("Pre-Surgery Form")
         verbose_name_plural = _("Pre-Surgery Forms")
+        indexes = [
+            models.Index(fields=['medico_user', 'fecha_reporte']),
+        ]
+
+    @property
+    def patient_folio(self):
+        """Folio of the owning patient (forms are stored as PRE-<patient folio>)"""
+        return self.folio_hospitalizacion.removeprefix('PRE-')
+
+    def save(self, *args, **kwargs):
+        # Forms created outside the views (admin, scripts) are linked by folio
+        if self.patient_id is None:
+            self.patient = Patient.objects.filter(folio_hospitalizacion=self.patient_folio).first()
+        if self.medico_user_id is None and self.patient is not None:
+            self.medico_user_id = self.patient.medico_id
+        return super().save(*args, **kwargs)
+
+    def compute_risk(self):
+        """Return the risk column values for the active risk model"""
+        model = get_risk_model()
+        risk_score, risk_factors = model.evaluate(self)
+        return {
+            'risk_score': risk_score,
+            'risk_level': model.level(risk_score)['level'],
+            'risk_factors': risk_factors,
+            'risk_version': model.version,
+        }
 
 
 class PostDuringSurgeryForm(models.Model):
@@ -568,6 +752,8 @@ class PostDuringSurgeryForm(models.Model):
         verbose_name='Nombre del Residente'
     )
 
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Última Actualización")
+
     def __str__(self):
         return f"Post-Surgery Form - {self.folio_hospitalizacion}"
 
@@ -578,12 +764,7 @@ class PostDuringSurgeryForm(models.Model):
     @property
     def patient(self):
         """Get the related patient safely"""
-        try:
-            return Patient.objects.get(
-                folio_hospitalizacion=self.folio_hospitalizacion.folio_hospitalizacion.replace('PRE-', '')
-            )
-        except Patient.DoesNotExist:
-            return None
+        return self.folio_hospitalizacion.patient if self.folio_hospitalizacion_id else None
 
     def clean(self):
         """Enhanced validation - FIXED VERSION"""
@@ -611,3 +792,290 @@ class PostDuringSurgeryForm(models.Model):
         """Override save to ensure validation"""
         self.full_clean()
         return super().save(*args, **kwargs)
+
+
+class DoctorStats(models.Model):
+    """
+    Per-physician dashboard counters, one row per doctor and day.
+    Kept up to date by the signals in website/signals.py; rebuild with
+    ``manage.py reconcile_doctor_stats``.
+    """
+    medico = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+        verbose_name=_("Médico")
+    )
+    # Registration day for patients, report day for pre/post-surgery cases
+    day = models.DateField(verbose_name=_("Día"))
+
+    # Patients
+    patients = models.IntegerField(default=0)
+
+    # Pre-surgery forms
+    surgeries = models.IntegerField(default=0)
+    risk_count = models.IntegerField(default=0)
+    risk_total = models.IntegerField(default=0)
+    risk_low = models.IntegerField(default=0)
+    risk_moderate = models.IntegerField(default=0)
+    risk_high = models.IntegerField(default=0)
+    risk_critical = models.IntegerField(default=0)
+    high_mallampati = models.IntegerField(default=0)
+    high_asa = models.IntegerField(default=0)
+    asa_1 = models.IntegerField(default=0)
+    asa_2 = models.IntegerField(default=0)
+    asa_3 = models.IntegerField(default=0)
+    asa_4 = models.IntegerField(default=0)
+    asa_5 = models.IntegerField(default=0)
+    asa_6 = models.IntegerField(default=0)
+    mallampati_1 = models.IntegerField(default=0)
+    mallampati_2 = models.IntegerField(default=0)
+    mallampati_3 = models.IntegerField(default=0)
+    mallampati_4 = models.IntegerField(default=0)
+    bmi_count = models.IntegerField(default=0)
+    bmi_total = models.FloatField(default=0)
+    bmi_high = models.IntegerField(default=0)
+    bmi_underweight = models.IntegerField(default=0)
+    bmi_normal = models.IntegerField(default=0)
+    bmi_overweight = models.IntegerField(default=0)
+    bmi_obese_class_1 = models.IntegerField(default=0)
+    bmi_obese_class_2 = models.IntegerField(default=0)
+    bmi_obese_class_3 = models.IntegerField(default=0)
+
+    # Post-surgery forms
+    completed = models.IntegerField(default=0)
+    with_complications = models.IntegerField(default=0)
+    with_morbidity = models.IntegerField(default=0)
+    with_mortality = models.IntegerField(default=0)
+    successful = models.IntegerField(default=0)
+    first_attempt = models.IntegerField(default=0)
+    multiple_attempts = models.IntegerField(default=0)
+    difficult = models.IntegerField(default=0)
+    attempts_count = models.IntegerField(default=0)
+    attempts_total = models.IntegerField(default=0)
+    complication_intubacion_dificil = models.IntegerField(default=0)
+    complication_broncoaspiracion = models.IntegerField(default=0)
+    complication_hipoxemia = models.IntegerField(default=0)
+    complication_laringoespasmo = models.IntegerField(default=0)
+    complication_traumatismo_dental = models.IntegerField(default=0)
+    complication_esofagica = models.IntegerField(default=0)
+    complication_neumotorax = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("Estadística por Médico")
+        verbose_name_plural = _("Estadísticas por Médico")
+        constraints = [
+            models.UniqueConstraint(fields=['medico', 'day'], name='unique_doctor_stats_day')
+        ]
+
+    def __str__(self):
+        return f"{self.medico} - {self.day}"
+
+    @classmethod
+    def counter_fields(cls):
+        """Names of every additive counter column"""
+        return [field.name for field in cls._meta.concrete_fields
+                if field.name not in ('id', 'medico', 'day')]
+
+
+class DashboardVersion(models.Model):
+    """
+    Data version of a doctor's dashboard, part of the cache keys and ETags of
+    the dashboard API (website/utils/dashboard_cache.py). Stored in the
+    database so every worker sees a bump as soon as the change that caused it
+    commits.
+    """
+    medico = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='dashboard_version',
+        verbose_name=_("Médico")
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("Versión del Dashboard")
+        verbose_name_plural = _("Versiones del Dashboard")
+
+    def __str__(self):
+        return f"{self.medico} - v{self.version}"
+
+
+class AlertEvent(models.Model):
+    """
+    Change in a patient's airway alert, streamed to the doctor's dashboard
+    by the alert event stream (see website/utils/alert_events.py)
+    """
+    ACTION_CHOICES = [
+        ('add', 'Alerta nueva'),
+        ('update', 'Alerta actualizada'),
+        ('remove', 'Alerta retirada'),
+    ]
+
+    medico = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='alert_events',
+        verbose_name=_("Médico")
+    )
+    folio_hospitalizacion = models.CharField(max_length=50, verbose_name="Folio Hospitalización")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # Alert as returned by the alerts API (only the id for removals)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = _("Evento de Alerta")
+        verbose_name_plural = _("Eventos de Alerta")
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['medico', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.folio_hospitalizacion}"
+
+
+class SnapshotTombstone(models.Model):
+    """
+    Deleted pre-surgery form, written as a tombstone row by the next incremental
+    clinical snapshot (see website/utils/clinical_snapshot.py)
+    """
+    folio_hospitalizacion = models.CharField(max_length=50, verbose_name="Folio Hospitalización")
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = _("Formulario Eliminado")
+        verbose_name_plural = _("Formularios Eliminados")
+        ordering = ['deleted_at', 'id']
+
+    def __str__(self):
+        return f"{self.folio_hospitalizacion} ({self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class ExportJob(models.Model):
+    """
+    Dashboard or cohort export generated in the background and polled for
+    progress (see website/utils/export_jobs.py). Finished files are kept
+    under MEDIA_ROOT until ``expires_at``.
+    """
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel'),
+        ('csv', 'CSV'),
+        ('parquet', 'Parquet'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En espera'),
+        (STATUS_RUNNING, 'En proceso'),
+        (STATUS_DONE, 'Terminado'),
+        (STATUS_FAILED, 'Fallido'),
+        (STATUS_EXPIRED, 'Expirado'),
+    ]
+    ACTIVE_STATUSES = [STATUS_PENDING, STATUS_RUNNING]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    medico = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='export_jobs',
+        verbose_name=_("Médico")
+    )
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    # Per-case rows; CSV and Parquet exports always contain them
+    include_cases = models.BooleanField(default=False)
+    # Identical requests share a key, and only one job per key may be active
+    dedupe_key = models.CharField(max_length=64)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)
+    total_rows = models.IntegerField(default=0)
+    processed_rows = models.IntegerField(default=0)
+    file = models.FileField(upload_to='exports/%Y/%m/', blank=True)
+    error = models.TextField(blank=True)
+
+    # Claims so far; a running job is reclaimed when its heartbeat goes quiet
+    attempts = models.PositiveSmallIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = _("Exportación")
+        verbose_name_plural = _("Exportaciones")
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_active_export_job'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.get_format_display()} {self.status} ({self.medico})"
+
+
+class OutboxEmail(models.Model):
+    """
+    Outgoing email queued by a request and delivered by ``manage.py send_outbox``
+    (see website/utils/email_outbox.py), so views never wait on SMTP
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En espera'),
+        (STATUS_SENDING, 'Enviando'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Fallido'),
+    ]
+    ACTIVE_STATUSES = [STATUS_PENDING, STATUS_SENDING]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list, blank=True)
+    # Hash of the message; the same message is only queued once while it is being delivered
+    dedupe_key = models.CharField(max_length=64)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Earliest next delivery attempt; while sending, when the claim lapses
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Correo en Cola")
+        verbose_name_plural = _("Correos en Cola")
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status__in=['pending', 'sending']),
+                name='unique_active_outbox_email'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
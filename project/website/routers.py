@@ -0,0 +1,90 @@
+# website/routers.py - Send analytics reads to a read replica
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Session key holding the time until which the user reads from the primary
+PIN_SESSION_KEY = '_primary_db_until'
+
+# Alias the reads of the current context go to, when routed
+_read_alias = ContextVar('analytics_read_alias', default=None)
+
+
+def analytics_database():
+    """settings.ANALYTICS_DATABASE when it is a configured database, otherwise None"""
+    alias = getattr(settings, 'ANALYTICS_DATABASE', None)
+    return alias if alias and alias in connections.settings else None
+
+
+@contextmanager
+def reading_from_analytics():
+    """Route the reads of this context to the analytics database, if there is one"""
+    token = _read_alias.set(analytics_database())
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def on_primary():
+    """Send the reads and writes of this context to the default database, even inside an analytics view"""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def pin_to_primary(request, seconds=None):
+    """Keep the user's analytics reads on the primary while the replica catches up on their writes"""
+    if seconds is None:
+        seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+    request.session[PIN_SESSION_KEY] = time.time() + seconds
+
+
+def pinned_to_primary(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def analytics_view(view):
+    """Serve a read-only view from the analytics database unless the user just wrote"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if pinned_to_primary(request):
+            return view(request, *args, **kwargs)
+        with reading_from_analytics():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class AnalyticsRouter:
+    """
+    Reads inside reading_from_analytics() (analytics views, export jobs) go to
+    settings.ANALYTICS_DATABASE; everything else, and every write, uses the
+    default database. Writing while reads are routed is an error.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is not None:
+            # A write derived from lagging replica reads would overwrite newer primary rows
+            raise RuntimeError(
+                f"{model._meta.label} written while reads go to the {alias!r} database; "
+                f"analytics code must not write, or must do it inside on_primary()"
+            )
+        # Explicit: Django would otherwise save an object read from the replica back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
@@ -0,0 +1,156 @@
+# website/signals.py - Model signal handlers for derived data
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Patient, PostDuringSurgeryForm, PreSurgeryForm, SnapshotTombstone
+from .utils.alert_events import record_alert_change
+from .utils.dashboard_cache import invalidate_doctors
+from .utils.doctor_stats import apply_contributions, case_contributions, patient_contributions
+from .utils.patient_search import index_patient, unindex_patient
+from .utils.query_inspection import record_query
+from .utils.sqlite_tuning import apply_pragmas, sqlite_pragmas
+
+
+@receiver(post_save, sender=PreSurgeryForm)
+def update_presurgery_risk(sender, instance, raw=False, **kwargs):
+    """Keep the persisted risk columns in sync with the form's inputs"""
+    if raw:
+        # Fixture loading: leave the stored values untouched
+        return
+
+    values = instance.compute_risk()
+    if all(getattr(instance, field) == value for field, value in values.items()):
+        return
+
+    # Queryset update does not re-send post_save
+    sender.objects.filter(pk=instance.pk).update(**values)
+    for field, value in values.items():
+        setattr(instance, field, value)
+
+
+# DoctorStats rollup. Each pre_save handler records what the stored row
+# contributes to the rollup, and the matching post_save/post_delete handler
+# applies the difference and invalidates the doctors' cached dashboard data.
+# The presurgery handlers are registered after update_presurgery_risk so they
+# see the refreshed risk columns.
+
+def _apply(before, after):
+    apply_contributions(before, after)
+    # Every doctor whose rollup the row touched gets a fresh dashboard cache version
+    invalidate_doctors(*{medico_id for (medico_id, _day), _counters in before + after})
+
+
+def _stored_presurgery(folio):
+    return PreSurgeryForm.objects.filter(pk=folio).first()
+
+
+def _stored_postsurgery(folio):
+    return PostDuringSurgeryForm.objects.filter(pk=folio).first()
+
+
+@receiver(pre_save, sender=Patient)
+def snapshot_patient_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._doctor_stats_before = patient_contributions(stored)
+
+
+@receiver(post_save, sender=Patient)
+def update_patient_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = instance.__dict__.pop('_doctor_stats_before', [])
+    _apply(before, patient_contributions(instance))
+
+
+@receiver(post_delete, sender=Patient)
+def remove_patient_stats(sender, instance, **kwargs):
+    _apply(patient_contributions(instance), [])
+
+
+@receiver(pre_save, sender=PreSurgeryForm)
+def snapshot_presurgery_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored = _stored_presurgery(instance.pk)
+    instance._stored_before_save = stored
+    instance._doctor_stats_before = case_contributions(stored, _stored_postsurgery(instance.pk))
+
+
+@receiver(post_save, sender=PreSurgeryForm)
+def update_presurgery_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = instance.__dict__.pop('_doctor_stats_before', [])
+    stored = instance.__dict__.pop('_stored_before_save', None)
+    postsurgery = _stored_postsurgery(instance.pk)
+    after = case_contributions(instance, postsurgery)
+    _apply(before, after)
+
+    # Alert tier changes are pushed to the doctor's event stream
+    record_alert_change(instance.medico_user_id, stored, instance, has_post_surgery=postsurgery is not None)
+
+
+@receiver(post_delete, sender=PreSurgeryForm)
+def remove_presurgery_stats(sender, instance, **kwargs):
+    # A cascaded post-surgery form has already been removed by its own handler
+    _apply(case_contributions(instance, _stored_postsurgery(instance.pk)), [])
+    record_alert_change(instance.medico_user_id, instance, None)
+
+
+@receiver(pre_save, sender=PostDuringSurgeryForm)
+def snapshot_postsurgery_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    presurgery = _stored_presurgery(instance.pk)
+    instance._doctor_stats_before = case_contributions(presurgery, _stored_postsurgery(instance.pk))
+
+
+@receiver(post_save, sender=PostDuringSurgeryForm)
+def update_postsurgery_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = instance.__dict__.pop('_doctor_stats_before', [])
+    _apply(before, case_contributions(_stored_presurgery(instance.pk), instance))
+
+
+@receiver(post_delete, sender=PostDuringSurgeryForm)
+def remove_postsurgery_stats(sender, instance, **kwargs):
+    presurgery = _stored_presurgery(instance.pk)
+    _apply(case_contributions(presurgery, instance), case_contributions(presurgery))
+
+
+# Deletions reach incremental clinical snapshots as tombstones
+
+@receiver(post_delete, sender=PreSurgeryForm)
+def record_snapshot_tombstone(sender, instance, using='default', **kwargs):
+    SnapshotTombstone.objects.using(using).create(folio_hospitalizacion=instance.pk)
+
+
+# Patient search index (FTS5 shadow table; a no-op on other backends)
+
+@receiver(post_save, sender=Patient)
+def index_patient_search(sender, instance, using='default', **kwargs):
+    index_patient(instance, using)
+
+
+@receiver(pre_delete, sender=Patient)
+def unindex_patient_search(sender, instance, using='default', **kwargs):
+    unindex_patient(instance, using)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """Let the request middleware (metrics, repeated queries) see the connection's queries"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    """Apply settings.SQLITE_PRAGMAS (WAL, busy timeout, cache) to new SQLite connections"""
+    pragmas = sqlite_pragmas(connection.alias)
+    if connection.vendor == 'sqlite' and pragmas:
+        apply_pragmas(connection.connection, pragmas)
@@ -8,19 +8,25 @@ document.addEventListener('DOMContentLoaded', function() {
         endpoints: {
             stats: '/api/dashboard/stats/',
             alerts: '/api/dashboard/alerts/',
+            alertStream: '/api/dashboard/alerts/stream/',
             dismissAlert: '/api/dashboard/alerts/dismiss/',
             export: '/api/dashboard/export/'
         },
         charts: {},
         alerts: {
             active: [],
-            dismissed: new Set()
+            dismissed: new Set(),
+            // Newest alert event reflected in the last alerts snapshot
+            lastEventId: null
         },
         timers: {
             refresh: null,
             alerts: null,
             lastUpdate: null
-        }
+        },
+        alertStream: null,
+        // ETag of the last payload received from each polled URL
+        validators: new Map()
     };
 
     // Theme configuration
@@ -61,6 +67,27 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Utility functions
     const Utils = {
+        // Conditional GET for the polled endpoints; resolves to null when the
+        // server answers 304 Not Modified (nothing to redraw)
+        fetchIfChanged: async (url) => {
+            const headers = {};
+            const etag = CONFIG.validators.get(url);
+            if (etag) headers['If-None-Match'] = etag;
+
+            // Validators are handled here, so bypass the browser HTTP cache
+            const response = await fetch(url, { headers, cache: 'no-store' });
+            if (response.status === 304) return null;
+
+            const data = await response.json();
+            const newEtag = response.headers.get('ETag');
+            if (response.ok && newEtag) {
+                CONFIG.validators.set(url, newEtag);
+            } else {
+                CONFIG.validators.delete(url);
+            }
+            return data;
+        },
+
         formatNumber: (number) => new Intl.NumberFormat('es-ES').format(number),
         
         formatDate: (dateString) => new Date(dateString).toLocaleDateString('es-ES', {
@@ -405,18 +432,72 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Alert system
     const AlertSystem = {
-        init: () => {
+        // The snapshot is loaded first and the stream resumes after its last
+        // event, so no event can be overwritten by an older snapshot
+        init: async () => {
+            await AlertSystem.checkAlerts();
+            if (document.hidden) return;
+            if (window.EventSource) {
+                AlertSystem.openStream();
+            } else {
+                AlertSystem.startPolling();
+            }
+        },
+
+        startPolling: () => {
+            if (CONFIG.timers.alerts) return;
             CONFIG.timers.alerts = setInterval(() => {
                 AlertSystem.checkAlerts();
             }, CONFIG.alertCheckInterval);
         },
 
+        // Server-Sent Events: the browser reconnects on its own and resumes with
+        // Last-Event-ID; a closed stream (e.g. 204 without ASGI) falls back to polling
+        openStream: () => {
+            if (CONFIG.alertStream) return;
+            const lastEventId = CONFIG.alerts.lastEventId;
+            const url = lastEventId != null
+                ? `${CONFIG.endpoints.alertStream}?last_event_id=${lastEventId}`
+                : CONFIG.endpoints.alertStream;
+            const source = new EventSource(url);
+            CONFIG.alertStream = source;
+
+            source.addEventListener('alert', (event) => {
+                AlertSystem.applyEvent(JSON.parse(event.data));
+            });
+
+            source.onerror = () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    CONFIG.alertStream = null;
+                    AlertSystem.startPolling();
+                }
+            };
+        },
+
+        applyEvent: (event) => {
+            const active = CONFIG.alerts.active.filter(alert => alert.id !== event.id);
+            if (event.action !== 'remove' && !CONFIG.alerts.dismissed.has(event.id)) {
+                active.push(event);
+                active.sort((a, b) => b.risk_score - a.risk_score);
+            }
+            CONFIG.alerts.active = active;
+
+            const criticalCount = active.filter(alert => alert.severity === 'CRITICAL').length;
+            AlertSystem.updateAlertCounts({
+                total_alerts: active.length,
+                critical_count: criticalCount,
+                high_count: active.length - criticalCount
+            });
+            AlertSystem.updateAlertsPanel();
+            AlertSystem.checkCriticalAlerts();
+        },
+
         checkAlerts: async () => {
             try {
-                const response = await fetch(CONFIG.endpoints.alerts);
-                const data = await response.json();
+                const data = await Utils.fetchIfChanged(CONFIG.endpoints.alerts);
                 
-                if (data.alerts) {
+                if (data && data.alerts) {
+                    CONFIG.alerts.lastEventId = data.last_event_id;
                     CONFIG.alerts.active = data.alerts.filter(
                         alert => !CONFIG.alerts.dismissed.has(alert.id)
                     );
@@ -568,8 +649,12 @@ document.addEventListener('DOMContentLoaded', function() {
             const dateRange = dateFilter ? dateFilter.value : '30';
             
             try {
-                const response = await fetch(`${CONFIG.endpoints.stats}?date_range=${dateRange}`);
-                const data = await response.json();
+                const data = await Utils.fetchIfChanged(`${CONFIG.endpoints.stats}?date_range=${dateRange}`);
+                if (data === null) {
+                    // Not modified since the last refresh
+                    DataRefresh.updateLastUpdateTime();
+                    return;
+                }
                 
                 if (data.error) {
                     throw new Error(data.error);
@@ -821,9 +906,6 @@ document.addEventListener('DOMContentLoaded', function() {
         DataRefresh.init();
         EventHandlers.init();
         
-        // Initial data load
-        AlertSystem.checkAlerts();
-        
         console.log('Dashboard initialized successfully');
         
         // Handle page visibility changes
@@ -832,12 +914,16 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Pause timers when page is hidden
                 clearInterval(CONFIG.timers.refresh);
                 clearInterval(CONFIG.timers.alerts);
+                CONFIG.timers.alerts = null;
+                if (CONFIG.alertStream) {
+                    CONFIG.alertStream.close();
+                    CONFIG.alertStream = null;
+                }
             } else {
                 // Resume timers when page is visible
                 DataRefresh.init();
+                // Refreshes the alerts before reopening the stream
                 AlertSystem.init();
-                // Immediate refresh when returning to page
-                AlertSystem.checkAlerts();
             }
         });
     }
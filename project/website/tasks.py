@@ -0,0 +1,9 @@
+# website/tasks.py - Celery tasks (used when EXPORT_JOB_BACKEND = 'celery')
+from celery import shared_task
+
+from .utils.export_jobs import run_export_job
+
+
+@shared_task(name='website.run_export_job')
+def run_export_job_task(job_id):
+    run_export_job(job_id)
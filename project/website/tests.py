@@ -1,3 +1,1795 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import shutil
+import asyncio
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from smtplib import SMTPException, SMTPRecipientsRefused, SMTPServerDisconnected
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from openpyxl import Workbook, load_workbook
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .management.commands.benchmark_risk import build_synthetic_forms
+from .management.commands.benchmark_views import compare_results
+from .models import (
+    AlertEvent, ContactMessage, DoctorStats, ExportJob, MedicoUser, OutboxEmail, Patient, PostDuringSurgeryForm,
+    PreSurgeryForm
+)
+from .routers import PIN_SESSION_KEY, analytics_database, on_primary, reading_from_analytics
+from .utils.alert_events import alert_event_stream
+from .utils.batch_risk import RISK_FIELDS, calculate_batch_risk
+from .utils.clinical_snapshot import read_state, update_snapshot_directory
+from .utils.dashboard_cache import CACHE_ALIAS, bump_data_version, data_version
+from .utils.dashboard_stats import (
+    complication_keywords, summarize_doctor_stats, summarize_postsurgery, summarize_presurgery
+)
+from .utils.email_outbox import enqueue_email, send_pending_emails
+from .utils.export_jobs import (
+    CLAIM_TIMEOUT, HEARTBEAT_INTERVAL, MAX_ATTEMPTS, parquet_available, purge_expired_exports,
+    reclaim_abandoned_jobs
+)
+from .utils.keyword_matcher import KeywordMatcher, normalize_text
+from .utils.pagination import paginate_by_cursor
+from .utils.patient_search import search_patients
+from .utils.query_inspection import RepeatedQueryError, detect_repeated_queries, fingerprint
+from .utils.request_metrics import request_metrics
+from .utils import alert_events, excel_export, risk_models
+from .utils.risk_assessment import AdvancedRiskCalculator, RiskCalculator
+from .utils.risk_memo import RiskMemo, risk_memo
+from .utils.risk_models import get_risk_model, load_risk_models
+from .utils.sqlite_tuning import apply_pragmas
+
+
+def create_doctor(username='doctor', **extra):
+    return MedicoUser.objects.create_user(
+        username=username,
+        email=f'{username}@alpha-project.com',
+        password='testpass123',
+        nombre='Dr. Test',
+        apellidos=username.title(),
+        telefono='5550000000',
+        **extra
+    )
+
+
+def create_patient(doctor, folio, **extra):
+    values = {
+        'folio_hospitalizacion': folio,
+        'nombres': 'Paciente',
+        'apellidos': folio,
+        'fecha_nacimiento': date(1980, 5, 17),
+        'medico': doctor,
+        'codigo_barras': 'codigos_barra/test.png',
+    }
+    values.update(extra)
+    return Patient.objects.create(**values)
+
+
+def create_presurgery(patient, **extra):
+    values = {
+        'folio_hospitalizacion': f'PRE-{patient.folio_hospitalizacion}',
+        'nombres': patient.nombres,
+        'apellidos': patient.apellidos,
+        'medico': patient.medico.get_full_name(),
+        'fecha_nacimiento': patient.fecha_nacimiento,
+        'codigo_barras': 'codigos_barra/test.png',
+        'fecha_reporte': timezone.now().date() - timedelta(days=1),
+        'medico_tratante': patient.medico.get_full_name(),
+        'diagnostico_preoperatorio': 'Hernia inguinal',
+        'peso': 80, 'talla': 170, 'imc': 27.7,
+        'estado_fisico_asa': 2,
+        'ayuno_hrs': 8,
+        'evaluacion_preoperatoria': 'Sin hallazgos',
+        'fc': 80, 'ta': '120/80', 'spo2_aire': 97, 'spo2_oxigeno': 99, 'glasgow': 15,
+        'mallampati': 2, 'patil_aldrete': 1,
+        'distancia_inter_incisiva': 4.5, 'distancia_tiro_mentoniana': 7.0,
+        'protrusion_mandibular': 1,
+        'macocha': 1, 'stop_bang': 2, 'desviacion_traquea': 0,
+    }
+    values.update(extra)
+    return PreSurgeryForm.objects.create(**values)
+
+
+def create_postsurgery(presurgery, **extra):
+    values = {
+        'folio_hospitalizacion': presurgery,
+        'lugar_problema': 'Quirófano 1',
+        'presencia_anestesiologo': True,
+        'tecnica_utilizada': 'Videolaringoscopía',
+        'carro_via_aerea': True,
+        'clasificacion_han': 1,
+        'aditamento_via_aerea': 'Ninguno',
+        'tiempo_preoxigenacion': 3,
+        'uso_supraglotico': False,
+        'tipo_intubacion': 'Orotraqueal',
+        'numero_intentos': 1,
+        'laringoscopia_directa': 'Cormack 1',
+        'cormack': 1,
+        'pogo': 100,
+        'intubacion_despierto': False,
+        'tipo_anestesia': 'General',
+        'sedacion': 'Propofol',
+        'cooperacion_paciente': 'Buena',
+        'algoritmo_no_intubacion': False,
+        'crico_tiroidotomia': False,
+        'traqueostomia_percutanea': False,
+        'resultado_final': 'Sin incidencias',
+        'nombre_anestesiologo': presurgery.medico,
+        'cedula_profesional': '1234567',
+        'especialidad': 'anestesiologia',
+    }
+    values.update(extra)
+    return PostDuringSurgeryForm.objects.create(**values)
+
+
+class BatchRiskParityTests(SimpleTestCase):
+    def test_batch_matches_per_form_scores(self):
+        today = timezone.now().date()
+        forms = build_synthetic_forms(2000, seed=7, today=today)
+
+        result = calculate_batch_risk(forms, reference_date=today)
+
+        for index, form in enumerate(forms):
+            score, analysis = AdvancedRiskCalculator.calculate_comprehensive_risk(form)
+            self.assertEqual(result.total_score[index], score)
+            for name, component in analysis['components'].items():
+                self.assertEqual(result.components[name][index], component['score'])
+
+    def test_values_rows_and_instances_agree(self):
+        today = timezone.now().date()
+        forms = build_synthetic_forms(200, seed=11, today=today)
+        rows = [{field: getattr(form, field) for field in RISK_FIELDS} for form in forms]
+
+        from_rows = calculate_batch_risk(rows, reference_date=today)
+        from_instances = calculate_batch_risk(forms, reference_date=today)
+
+        np.testing.assert_array_equal(from_rows.total_score, from_instances.total_score)
+        np.testing.assert_array_equal(from_rows.multiplier, from_instances.multiplier)
+
+    def test_empty_source(self):
+        result = calculate_batch_risk([])
+        self.assertEqual(len(result), 0)
+
+
+
+class RiskMemoTests(SimpleTestCase):
+    def setUp(self):
+        risk_memo('comprehensive').clear()
+        self.form = build_synthetic_forms(1, seed=3, today=timezone.now().date())[0]
+
+    def test_least_recently_used_entry_evicted(self):
+        memo = RiskMemo(maxsize=2)
+        memo.get_or_compute('a', lambda: 1)
+        memo.get_or_compute('b', lambda: 2)
+        memo.get_or_compute('a', lambda: 0)
+        memo.get_or_compute('c', lambda: 3)
+
+        self.assertEqual(memo.get_or_compute('a', lambda: 0), 1)
+        self.assertEqual(memo.get_or_compute('b', lambda: 4), 4)
+        self.assertEqual(memo.stats(), {'hits': 2, 'misses': 4, 'hit_rate': 33.3, 'size': 2, 'maxsize': 2,
+                                        'evictions': 2, 'expirations': 0})
+
+    def test_entries_expire_after_ttl(self):
+        now = [0]
+        memo = RiskMemo(ttl=10, clock=lambda: now[0])
+        memo.get_or_compute('a', lambda: 1)
+
+        now[0] = 9
+        self.assertEqual(memo.get_or_compute('a', lambda: 2), 1)
+        now[0] = 10
+        self.assertEqual(memo.get_or_compute('a', lambda: 2), 2)
+        self.assertEqual(memo.stats()['expirations'], 1)
+
+    def test_calculator_reuses_result_for_unchanged_inputs(self):
+        score, analysis = AdvancedRiskCalculator.calculate_comprehensive_risk(self.form)
+        self.form.observaciones = 'Not a risk input'
+
+        self.assertIs(AdvancedRiskCalculator.calculate_comprehensive_risk(self.form)[1], analysis)
+        self.assertEqual(score, AdvancedRiskCalculator._calculate_comprehensive_risk(self.form)[0])
+
+    def test_calculator_rescores_changed_inputs_and_new_day(self):
+        _score, analysis = AdvancedRiskCalculator.calculate_comprehensive_risk(self.form)
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=tomorrow):
+            self.assertIsNot(AdvancedRiskCalculator.calculate_comprehensive_risk(self.form)[1], analysis)
+
+        self.form.mallampati = 5 - self.form.mallampati
+        self.assertIsNot(AdvancedRiskCalculator.calculate_comprehensive_risk(self.form)[1], analysis)
+        self.assertEqual(risk_memo('comprehensive').stats()['misses'], 3)
+
+    def test_memo_can_be_disabled(self):
+        memo = RiskMemo(maxsize=0)
+        memo.get_or_compute('a', lambda: 1)
+
+        self.assertEqual(memo.get_or_compute('a', lambda: 2), 2)
+        self.assertEqual(memo.stats()['size'], 0)
+
+
+class BatchRiskQuerysetTests(TestCase):
+    def test_queryset_source(self):
+        doctor = create_doctor()
+        for index in range(5):
+            patient = create_patient(doctor, f'QS-{index}')
+            create_presurgery(patient, mallampati=index % 4 + 1, estado_fisico_asa=index + 1,
+                              antecedentes_dificultad=index % 2 == 0, imc=30 + index * 3)
+
+        forms = PreSurgeryForm.objects.order_by('folio_hospitalizacion')
+        result = AdvancedRiskCalculator.calculate_batch_risk(forms)
+
+        self.assertEqual(list(result.folios), [form.folio_hospitalizacion for form in forms])
+        expected = [AdvancedRiskCalculator.calculate_comprehensive_risk(form)[0] for form in forms]
+        self.assertEqual(list(result.total_score), expected)
+
+
+class PersistedRiskTests(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.doctor = create_doctor()
+        self.patient = create_patient(self.doctor, 'RISK-1')
+
+    def test_risk_columns_written_on_save(self):
+        form = create_presurgery(self.patient, mallampati=4, estado_fisico_asa=4)
+
+        form.refresh_from_db()
+        self.assertEqual(form.risk_score, 55)
+        self.assertEqual(form.risk_level, 'MODERADO')
+        self.assertEqual(form.risk_factors, ['Mallampati Clase 4', 'ASA 4'])
+        self.assertEqual(form.risk_version, RiskCalculator.VERSION)
+
+    def test_risk_columns_recomputed_on_edit(self):
+        form = create_presurgery(self.patient)
+        form.antecedentes_dificultad = True
+        form.mallampati = 3
+        form.estado_fisico_asa = 4
+        form.save()
+
+        form.refresh_from_db()
+        self.assertEqual(form.risk_score, 95)
+        self.assertEqual(form.risk_level, 'ALTO')
+
+    def test_backfill_command_rescores_stale_versions(self):
+        form = create_presurgery(self.patient, mallampati=3)
+        PreSurgeryForm.objects.filter(pk=form.pk).update(risk_score=None, risk_version='old')
+
+        call_command('backfill_risk_scores', stdout=StringIO())
+
+        form.refresh_from_db()
+        self.assertEqual(form.risk_score, 25)
+        self.assertEqual(form.risk_version, RiskCalculator.VERSION)
+        self.assertFalse(PreSurgeryForm.objects.stale_risk().exists())
+
+    def test_alerts_sorted_by_persisted_score(self):
+        create_presurgery(self.patient, antecedentes_dificultad=True, mallampati=3, estado_fisico_asa=4)
+        other = create_patient(self.doctor, 'RISK-2')
+        create_presurgery(other, antecedentes_dificultad=True, patil_aldrete=3, imc=36)
+        third = create_patient(self.doctor, 'RISK-3')
+        create_presurgery(third)
+
+        self.client.force_login(self.doctor)
+        response = self.client.get(reverse('patient-alerts'))
+
+        alerts = response.json()['alerts']
+        self.assertEqual([alert['risk_score'] for alert in alerts], [95, 75])
+        self.assertEqual([alert['severity'] for alert in alerts], ['CRITICAL', 'HIGH'])
+
+    def test_dashboard_views_score_stale_rows_without_writing(self):
+        form = create_presurgery(self.patient, antecedentes_dificultad=True, mallampati=3, estado_fisico_asa=4)
+        PreSurgeryForm.objects.filter(pk=form.pk).update(risk_score=None, risk_factors=[], risk_version='old')
+        stored = PreSurgeryForm.objects.values('risk_version', 'updated_at').get(pk=form.pk)
+        self.client.force_login(self.doctor)
+
+        dashboard = self.client.get(reverse('dashboard'))
+        stats = self.client.get(reverse('dashboard-stats')).json()
+
+        self.assertEqual([alert['risk_score'] for alert in stats['current_alerts']], [95])
+        self.assertEqual([patient['risk_score'] for patient in dashboard.context['critical_patients']], [95])
+        self.assertEqual(PreSurgeryForm.objects.values('risk_version', 'updated_at').get(pk=form.pk), stored)
+
+
+STRICT_MODEL = {
+    'name': 'airway-strict',
+    'version': 'strict-1',
+    'rules': [
+        {'field': 'mallampati', 'op': '>=', 'threshold': 2, 'points': 30, 'label': 'Mallampati Clase {value}'},
+        {'field': 'antecedentes_dificultad', 'op': 'truthy', 'points': 50, 'label': 'Antecedentes de dificultad'},
+    ],
+    'levels': [
+        {'min_score': 80, 'level': 'ALTO', 'color': '#e74c3c', 'description': 'Alto riesgo'},
+        {'min_score': 0, 'level': 'BAJO', 'color': '#27ae60', 'description': 'Riesgo bajo'},
+    ],
+}
+
+
+class RiskModelRegistryTests(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        # Models registered by a test do not leak into the others
+        registry = mock.patch.dict(risk_models._registry)
+        registry.start()
+        self.addCleanup(registry.stop)
+        self.doctor = create_doctor()
+        self.patient = create_patient(self.doctor, 'MODEL-1')
+
+    def test_airway_model_levels_match_calculator(self):
+        model = get_risk_model('airway-basic')
+        self.assertEqual(model.version, RiskCalculator.VERSION)
+        for score, level in ((0, 'BAJO'), (39, 'BAJO'), (40, 'MODERADO'), (69, 'MODERADO'), (70, 'ALTO'), (100, 'ALTO')):
+            self.assertEqual(model.level(score)['level'], level)
+            self.assertEqual(RiskCalculator.get_risk_level(score), model.level(score))
+
+    def test_airway_model_scores_every_rule(self):
+        form = create_presurgery(
+            self.patient, mallampati=3, estado_fisico_asa=4, imc=36, antecedentes_dificultad=True,
+            patil_aldrete=3, distancia_inter_incisiva=2.5
+        )
+
+        score, factors = get_risk_model().evaluate(form)
+
+        self.assertEqual(score, 100)
+        self.assertEqual(factors, [
+            'Mallampati Clase 3', 'ASA 4', 'IMC 36 (Obesidad)', 'Antecedentes de dificultad',
+            'Patil-Aldrete 3', 'Distancia inter-incisiva < 3cm',
+        ])
+
+    def test_declared_model_becomes_active_from_settings(self):
+        form = create_presurgery(self.patient, mallampati=2, antecedentes_dificultad=True)
+
+        with override_settings(RISK_MODEL_DEFINITIONS=[STRICT_MODEL], RISK_MODEL='airway-strict'):
+            load_risk_models()
+            self.assertEqual(list(PreSurgeryForm.objects.stale_risk()), [form])
+            call_command('backfill_risk_scores', stdout=StringIO())
+
+        form.refresh_from_db()
+        self.assertEqual(form.risk_score, 80)
+        self.assertEqual(form.risk_level, 'ALTO')
+        self.assertEqual(form.risk_version, 'strict-1')
+
+    def test_unknown_active_model_fails_at_load(self):
+        with override_settings(RISK_MODEL='missing'):
+            with self.assertRaises(ValueError):
+                load_risk_models()
+
+    def test_unknown_operator_rejected(self):
+        definition = {**STRICT_MODEL, 'rules': [{'field': 'imc', 'op': '~', 'threshold': 35, 'points': 10}]}
+        with override_settings(RISK_MODEL_DEFINITIONS=[definition]):
+            with self.assertRaises(ValueError):
+                load_risk_models()
+
+    def test_risk_endpoint_selects_model_per_request(self):
+        form = create_presurgery(self.patient, mallampati=2, antecedentes_dificultad=True)
+        with override_settings(RISK_MODEL_DEFINITIONS=[STRICT_MODEL]):
+            load_risk_models()
+        self.client.force_login(self.doctor)
+        url = reverse('presurgery-risk', args=[form.folio_hospitalizacion])
+
+        default = self.client.get(url).json()
+        strict = self.client.get(url, {'model': 'airway-strict'}).json()
+
+        self.assertEqual((default['model'], default['risk_score'], default['level']), ('airway-basic', 40, 'MODERADO'))
+        self.assertEqual((strict['version'], strict['risk_score'], strict['level']), ('strict-1', 80, 'ALTO'))
+        self.assertEqual(self.client.get(url, {'model': 'missing'}).status_code, 400)
+
+    def test_risk_endpoint_limited_to_own_patients(self):
+        form = create_presurgery(self.patient)
+        self.client.force_login(create_doctor('other'))
+
+        response = self.client.get(reverse('presurgery-risk', args=[form.folio_hospitalizacion]))
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_risk_endpoint_details_are_memoized(self):
+        form = create_presurgery(self.patient, mallampati=4, estado_fisico_asa=3)
+        self.client.force_login(self.doctor)
+        url = reverse('presurgery-risk', args=[form.folio_hospitalizacion])
+        memo = risk_memo('comprehensive')
+        memo.clear()
+
+        self.assertNotIn('comprehensive', self.client.get(url).json())
+        detail = self.client.get(url, {'detail': 'comprehensive'}).json()['comprehensive']
+        _score, analysis = AdvancedRiskCalculator._calculate_comprehensive_risk(form)
+        self.assertEqual((detail['total_score'], detail['alert_level']),
+                         (analysis['total_score'], analysis['alert_level']))
+
+        self.client.get(url, {'detail': 'comprehensive'})
+        self.assertEqual((memo.stats()['hits'], memo.stats()['misses']), (1, 1))
+
+
+class RiskScoreAnnotationTests(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        registry = mock.patch.dict(risk_models._registry)
+        registry.start()
+        self.addCleanup(registry.stop)
+        self.doctor = create_doctor()
+
+    def create_random_forms(self, count, seed):
+        """Synthetic forms, some of them on the rule thresholds, saved without computing their risk"""
+        rng = random.Random(seed)
+        forms = build_synthetic_forms(count, seed=seed, today=timezone.now().date())
+        for form in forms:
+            form.peso, form.talla, form.spo2_oxigeno, form.macocha, form.stop_bang = 80, 170, 99, 1, 2
+            if rng.random() < 0.3:
+                form.imc = rng.choice([34.99, 35, 35.0, 35.01])
+                form.distancia_inter_incisiva = rng.choice([2.99, 3, 3.0, 3.01])
+            form.comorbilidades = rng.choice(['', 'Asma'])
+        PreSurgeryForm.objects.bulk_create(forms)
+
+    def assert_annotation_matches(self, model_name=None):
+        model = get_risk_model(model_name)
+        forms = PreSurgeryForm.objects.with_risk_score(model_name)
+        self.assertTrue(forms.exists())
+        for form in forms:
+            score, _factors = model.evaluate(form)
+            self.assertEqual(form.current_risk_score, score, form.folio_hospitalizacion)
+            self.assertEqual(form.current_risk_level, model.level(score)['level'])
+
+    def test_annotation_matches_python_scores(self):
+        self.create_random_forms(500, seed=23)
+
+        self.assert_annotation_matches()
+
+    def test_annotation_matches_declared_model(self):
+        definition = {**STRICT_MODEL, 'rules': [
+            *STRICT_MODEL['rules'],
+            {'field': 'comorbilidades', 'op': 'truthy', 'points': 15, 'label': 'Comorbilidades'},
+            {'field': 'estado_fisico_asa', 'op': '==', 'threshold': 3, 'points': 20, 'label': 'ASA 3'},
+            {'field': 'imc', 'op': '>', 'threshold': 35, 'points': 40, 'label': 'IMC > 35'},
+        ]}
+        with override_settings(RISK_MODEL_DEFINITIONS=[definition]):
+            load_risk_models()
+        self.create_random_forms(300, seed=29)
+
+        self.assert_annotation_matches('airway-strict')
+
+    def test_alerts_filtered_ordered_and_paged_in_database(self):
+        # Scores 85, 95, 75 and 25
+        for folio, values in (
+            ('ALERT-1', {'antecedentes_dificultad': True, 'mallampati': 3, 'patil_aldrete': 3}),
+            ('ALERT-2', {'antecedentes_dificultad': True, 'mallampati': 3, 'estado_fisico_asa': 4}),
+            ('ALERT-3', {'antecedentes_dificultad': True, 'mallampati': 3, 'distancia_inter_incisiva': 2.5}),
+            ('ALERT-4', {'mallampati': 3}),
+        ):
+            create_presurgery(create_patient(self.doctor, folio), **values)
+        self.client.force_login(self.doctor)
+        url = reverse('patient-alerts')
+
+        first = self.client.get(url, {'limit': 2}).json()
+        second = self.client.get(url, {'limit': 2, 'offset': 2}).json()
+
+        self.assertEqual([alert['risk_score'] for alert in first['alerts']], [95, 85])
+        self.assertEqual([alert['risk_score'] for alert in second['alerts']], [75])
+        self.assertEqual((first['total_alerts'], first['critical_count'], first['high_count']), (3, 2, 1))
+        self.assertEqual(self.client.get(url, {'limit': 'all'}).status_code, 400)
+
+    def test_alerts_score_stale_rows_without_writing(self):
+        form = create_presurgery(create_patient(self.doctor, 'STALE-1'),
+                                 antecedentes_dificultad=True, mallampati=3, estado_fisico_asa=4)
+        PreSurgeryForm.objects.filter(pk=form.pk).update(risk_score=None, risk_factors=[], risk_version='old')
+        self.client.force_login(self.doctor)
+
+        alerts = self.client.get(reverse('patient-alerts')).json()['alerts']
+
+        self.assertEqual([(alert['risk_score'], len(alert['risk_factors'])) for alert in alerts], [(95, 3)])
+        self.assertEqual(PreSurgeryForm.objects.get(pk=form.pk).risk_version, 'old')
+
+
+
+class RescoreCohortTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor()
+        self.forms = [
+            create_presurgery(create_patient(self.doctor, 'COHORT-1')),
+            create_presurgery(create_patient(self.doctor, 'COHORT-2'), antecedentes_dificultad=True,
+                              mallampati=4, estado_fisico_asa=4, imc=42, comorbilidades='Apnea del sueño'),
+            create_presurgery(create_patient(self.doctor, 'COHORT-3'), mallampati=3, patil_aldrete=4),
+        ]
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.checkpoint = f'{directory}/checkpoint.json'
+
+    def rescore(self, *args, **options):
+        out = StringIO()
+        call_command('rescore_cohort', *args, chunk_size=2, stdout=out, **options)
+        return out.getvalue()
+
+    def assert_scored(self, form):
+        form.refresh_from_db()
+        score, _analysis = AdvancedRiskCalculator._calculate_comprehensive_risk(form)
+        self.assertEqual(form.advanced_risk_score, score)
+        self.assertEqual(form.advanced_alert_level, AdvancedRiskCalculator._determine_alert_level(score))
+        self.assertEqual(form.advanced_risk_version, AdvancedRiskCalculator.VERSION)
+        self.assertEqual(form.advanced_risk_date, timezone.now().date())
+
+    def test_scores_stored_in_chunks(self):
+        output = self.rescore(workers=1, checkpoint=self.checkpoint)
+
+        for form in self.forms:
+            self.assert_scored(form)
+        self.assertIn('rows/s', output)
+        self.assertIn('ETA', output)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_worker_processes_store_same_scores(self):
+        self.rescore(workers=2)
+
+        for form in self.forms:
+            self.assert_scored(form)
+
+    def test_dry_run_counts_tier_changes_without_writing(self):
+        self.rescore(workers=1)
+        high_risk = self.forms[1]
+        high_risk.refresh_from_db()
+        self.assertNotEqual(high_risk.advanced_alert_level, 'LOW')
+        PreSurgeryForm.objects.filter(pk=high_risk.pk).update(advanced_alert_level='LOW')
+
+        output = self.rescore('--dry-run', workers=1)
+
+        self.assertIn('1 forms (1 patients) would change alert level', output)
+        self.assertEqual(PreSurgeryForm.objects.get(pk=high_risk.pk).advanced_alert_level, 'LOW')
+
+    def test_resume_continues_after_checkpoint(self):
+        first = min(self.forms, key=lambda form: form.pk)
+        with open(self.checkpoint, 'w') as checkpoint_file:
+            json.dump({'last_pk': first.pk, 'processed': 1, 'reference_date': timezone.now().date().isoformat(),
+                       'version': AdvancedRiskCalculator.VERSION}, checkpoint_file)
+
+        output = self.rescore('--resume', workers=1, checkpoint=self.checkpoint)
+
+        self.assertIn('Scoring 2 of 3 forms', output)
+        first.refresh_from_db()
+        self.assertIsNone(first.advanced_risk_score)
+        for form in self.forms:
+            if form.pk != first.pk:
+                self.assert_scored(form)
+
+    def test_resume_rejects_other_calculator_version(self):
+        with open(self.checkpoint, 'w') as checkpoint_file:
+            json.dump({'last_pk': None, 'processed': 0, 'reference_date': '2024-01-01', 'version': 'old'},
+                      checkpoint_file)
+
+        with self.assertRaises(CommandError):
+            self.rescore('--resume', workers=1, checkpoint=self.checkpoint)
+
+
+class DashboardQueryCountTests(TestCase):
+    # Locked so new per-form or per-bucket queries do not creep back into the dashboard
+    DASHBOARD_QUERIES = 9
+    STATS_QUERIES = 7
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.doctor = create_doctor()
+        self.client.force_login(self.doctor)
+
+    def create_cases(self, count, offset=0):
+        for index in range(offset, offset + count):
+            patient = create_patient(self.doctor, f'DASH-{index}',
+                                     fecha_nacimiento=date(1940 + index * 7 % 80, 1, 1))
+            presurgery = create_presurgery(patient, mallampati=index % 4 + 1,
+                                           estado_fisico_asa=index % 6 + 1, imc=17 + index * 3 % 30,
+                                           antecedentes_dificultad=index % 3 == 0)
+            if index % 2:
+                create_postsurgery(presurgery, numero_intentos=index % 4 + 1,
+                                   complicaciones='Hipoxemia transitoria' if index % 3 else '')
+
+    def test_dashboard_query_count_is_constant(self):
+        for offset, count in ((0, 3), (3, 12)):
+            self.create_cases(count, offset)
+            with self.assertNumQueries(self.DASHBOARD_QUERIES):
+                response = self.client.get(reverse('dashboard'))
+            self.assertEqual(response.status_code, 200)
+
+    def test_stats_query_count_is_constant(self):
+        for offset, count in ((0, 3), (3, 12)):
+            self.create_cases(count, offset)
+            with self.assertNumQueries(self.STATS_QUERIES):
+                response = self.client.get(reverse('dashboard-stats'))
+            self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_aggregates_match_rows(self):
+        self.create_cases(12)
+        response = self.client.get(reverse('dashboard'))
+        context = response.context
+
+        forms = list(PreSurgeryForm.objects.all())
+        self.assertEqual(context['total_surgeries'], len(forms))
+        self.assertEqual(context['completed_surgeries'], PostDuringSurgeryForm.objects.count())
+        self.assertEqual(sum(json.loads(context['age_distribution']).values()), 12)
+        self.assertEqual(
+            json.loads(context['bmi_distribution'])['obese_class_3'],
+            len([form for form in forms if form.imc >= 40])
+        )
+        self.assertEqual(
+            context['intubation_data']['difficult_intubations'],
+            PostDuringSurgeryForm.objects.filter(numero_intentos__gte=3).count()
+        )
+
+
+class DoctorStatsTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor()
+        self.other = create_doctor('other')
+        self.cases = []
+        for index in range(6):
+            doctor = self.doctor if index % 3 else self.other
+            patient = create_patient(doctor, f'ROLL-{index}', fecha_nacimiento=date(1950 + index * 9, 3, 1))
+            presurgery = create_presurgery(patient, mallampati=index % 4 + 1, imc=18 + index * 5,
+                                           estado_fisico_asa=index % 6 + 1,
+                                           antecedentes_dificultad=index % 2 == 0)
+            postsurgery = None
+            if index % 2:
+                postsurgery = create_postsurgery(presurgery, numero_intentos=index,
+                                                 complicaciones='Laringoespasmo e hipoxemia')
+            self.cases.append((patient, presurgery, postsurgery))
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_doctor_stats', *args, stdout=out)
+        return out.getvalue()
+
+    def test_incremental_updates_match_rebuild(self):
+        patient, presurgery, postsurgery = self.cases[1]
+        presurgery.fecha_reporte -= timedelta(days=40)
+        presurgery.mallampati = 4
+        presurgery.save()
+        postsurgery.complicaciones = ''
+        postsurgery.numero_intentos = 1
+        postsurgery.save()
+
+        self.cases[3][2].delete()
+        self.cases[4][1].delete()
+        self.cases[5][0].activo = False
+        self.cases[5][0].save()
+        create_patient(self.doctor, 'ROLL-GONE').delete()
+
+        self.assertIn('matches the source tables', self.reconcile('--dry-run'))
+
+    def test_rollup_matches_source_aggregates(self):
+        presurgery_forms = PreSurgeryForm.objects.filter(medico=self.doctor.get_full_name())
+        postsurgery_forms = PostDuringSurgeryForm.objects.filter(folio_hospitalizacion__in=presurgery_forms)
+
+        rollup = summarize_doctor_stats(DoctorStats.objects.filter(medico=self.doctor),
+                                        DoctorStats.counter_fields())
+
+        self.assertEqual(rollup['patients']['total'], 4)
+        self.assertEqual(rollup['presurgery'], summarize_presurgery(presurgery_forms))
+        self.assertEqual(rollup['postsurgery'], summarize_postsurgery(postsurgery_forms))
+
+    def test_migration_scores_legacy_forms_and_builds_the_rollup(self):
+        migration = import_module('website.migrations.0021_backfill_doctor_stats')
+        columns = ('risk_score', 'risk_level', 'risk_version')
+        expected = list(PreSurgeryForm.objects.order_by('pk').values_list(*columns))
+        # Forms saved before the risk columns, and no rollup yet
+        PreSurgeryForm.objects.update(risk_score=None, risk_level='', risk_factors=[], risk_version='')
+        DoctorStats.objects.all().delete()
+
+        migration.backfill_risk_columns(django_apps, None)
+        migration.rebuild_doctor_stats(django_apps, None)
+
+        self.assertEqual(list(PreSurgeryForm.objects.order_by('pk').values_list(*columns)), expected)
+        self.assertEqual(PreSurgeryForm.objects.get(pk=self.cases[0][1].pk).risk_factors,
+                         ['Antecedentes de dificultad'])
+        self.assertIn('matches the source tables', self.reconcile('--dry-run'))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        DoctorStats.objects.filter(medico=self.doctor).update(surgeries=0)
+
+        output = self.reconcile('--doctor', 'doctor', '--dry-run')
+        self.assertIn('surgeries: stored 0, expected 4', output)
+        self.assertIn('dry run', output)
+
+        self.assertIn('Rebuilt DoctorStats', self.reconcile())
+        self.assertIn('matches the source tables', self.reconcile())
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.doctor = create_doctor(is_staff=True)
+        self.patient = create_patient(self.doctor, 'CACHE-1')
+        self.presurgery = create_presurgery(self.patient, mallampati=3, estado_fisico_asa=4,
+                                            antecedentes_dificultad=True)
+        self.client.force_login(self.doctor)
+
+    def test_repeated_polls_are_served_from_cache(self):
+        first = self.client.get(reverse('dashboard-stats'), {'date_range': 30}).json()
+
+        # Session, user and data version lookups
+        with self.assertNumQueries(3):
+            second = self.client.get(reverse('dashboard-stats'), {'date_range': 30}).json()
+        self.assertEqual(first, second)
+
+        # A different window is a different entry
+        self.client.get(reverse('dashboard-stats'), {'date_range': 7})
+        stats = self.client.get(reverse('dashboard-cache-stats')).json()
+        self.assertEqual(stats['stats'], {'hits': 1, 'misses': 2, 'hit_rate': 33.3})
+        self.assertIn('risk_memo', stats)
+
+    def test_saves_invalidate_cached_responses(self):
+        alerts = self.client.get(reverse('patient-alerts')).json()
+        self.assertEqual([alert['risk_score'] for alert in alerts['alerts']], [95])
+
+        self.presurgery.antecedentes_dificultad = False
+        self.presurgery.save()
+        self.assertEqual(self.client.get(reverse('patient-alerts')).json()['alerts'], [])
+
+        other = create_patient(self.doctor, 'CACHE-2')
+        create_presurgery(other)
+        stats = self.client.get(reverse('dashboard-stats')).json()
+        self.assertEqual(stats['summary']['total_patients'], 2)
+        self.assertEqual(stats['summary']['pending_surgeries'], 2)
+
+    def test_other_doctors_keep_their_entries(self):
+        other_doctor = create_doctor('other')
+        self.client.get(reverse('patient-alerts'))
+
+        create_presurgery(create_patient(other_doctor, 'CACHE-3'))
+
+        self.client.get(reverse('patient-alerts'))
+        stats = self.client.get(reverse('dashboard-cache-stats')).json()
+        self.assertEqual(stats['alerts']['hits'], 1)
+
+    def test_versions_are_shared_and_transactional(self):
+        version = data_version(self.doctor.pk)
+        try:
+            with transaction.atomic():
+                bump_data_version(self.doctor.pk)
+                raise DatabaseError
+        except DatabaseError:
+            pass
+        self.assertEqual(data_version(self.doctor.pk), version)
+
+        # Another worker has its own cache but reads the same version
+        bump_data_version(self.doctor.pk, self.doctor.pk, None)
+        caches[CACHE_ALIAS].clear()
+        self.assertEqual(data_version(self.doctor.pk), version + 1)
+        self.assertEqual(data_version(create_doctor('new').pk), 0)
+
+    def test_cache_stats_require_staff(self):
+        self.client.force_login(create_doctor('regular'))
+        response = self.client.get(reverse('dashboard-cache-stats'))
+        self.assertEqual(response.status_code, 302)
+
+
+class ConditionalDashboardTests(TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.doctor = create_doctor()
+        self.patient = create_patient(self.doctor, 'ETAG-1')
+        self.presurgery = create_presurgery(self.patient, antecedentes_dificultad=True, mallampati=3,
+                                            estado_fisico_asa=4)
+        self.client.force_login(self.doctor)
+
+    def test_unchanged_data_returns_304_without_building_the_payload(self):
+        for url in (reverse('dashboard-stats'), reverse('patient-alerts')):
+            response = self.client.get(url)
+            etag = response['ETag']
+            self.assertTrue(etag.startswith('"'))
+
+            # Session, user and data version lookups
+            with self.assertNumQueries(3):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_etag_is_the_same_in_every_worker(self):
+        url = reverse('dashboard-stats')
+        etag = self.client.get(url)['ETag']
+
+        # A worker with an empty cache still recognises the ETag
+        caches[CACHE_ALIAS].clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A save in another worker, which leaves this cache alone
+        PreSurgeryForm.objects.filter(pk=self.presurgery.pk).update(mallampati=1)
+        bump_data_version(self.doctor.pk)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_with_data_and_parameters(self):
+        url = reverse('dashboard-stats')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, {'date_range': 7})['ETag'], etag)
+
+        self.presurgery.mallampati = 1
+        self.presurgery.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(ALERT_STREAM_POLL_INTERVAL=0.01, ALERT_STREAM_HEARTBEAT=0.02, ALERT_STREAM_MAX_SECONDS=0.2)
+class AlertStreamTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor()
+        self.patient = create_patient(self.doctor, 'SSE-1')
+        self.presurgery = create_presurgery(self.patient)
+
+    def set_risk(self, **values):
+        for field, value in values.items():
+            setattr(self.presurgery, field, value)
+        self.presurgery.save()
+
+    def test_events_follow_risk_tier_changes(self):
+        self.set_risk(antecedentes_dificultad=True, patil_aldrete=3)  # 60, no alert
+        self.set_risk(imc=36)                                          # 75, HIGH
+        self.set_risk(mallampati=3)                                    # 100, CRITICAL
+        self.set_risk(nombres='Renombrado')                            # unchanged tier
+        self.presurgery.delete()
+
+        events = list(AlertEvent.objects.values_list('action', 'payload__severity'))
+        self.assertEqual(events, [('add', 'HIGH'), ('update', 'CRITICAL'), ('remove', None)])
+        self.assertEqual(AlertEvent.objects.filter(medico=self.doctor).count(), 3)
+
+    async def test_stream_resumes_after_last_event_id(self):
+        await self.async_client.aforce_login(self.doctor)
+        await sync_to_async(self.set_risk)(antecedentes_dificultad=True, patil_aldrete=3, imc=36)
+        await sync_to_async(self.set_risk)(antecedentes_dificultad=False)
+        first, second = [event async for event in AlertEvent.objects.order_by('id')]
+
+        response = await self.async_client.get(reverse('alert-stream'), headers={'Last-Event-ID': str(first.pk)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+        self.assertTrue(body.startswith('retry: '))
+        self.assertNotIn(f'id: {first.pk}\n', body)
+        self.assertIn(f'id: {second.pk}\nevent: alert\n', body)
+        self.assertIn('"action": "remove"', body)
+        self.assertIn(': heartbeat', body)
+
+    @override_settings(ALERT_STREAM_POLL_INTERVAL=30, ALERT_STREAM_HEARTBEAT=30, ALERT_STREAM_MAX_SECONDS=30)
+    async def test_saves_wake_the_stream_without_waiting_for_the_poll(self):
+        def raise_alert():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.set_risk(antecedentes_dificultad=True, patil_aldrete=3, imc=36)
+
+        stream = alert_event_stream(self.doctor.pk)
+        self.assertTrue((await anext(stream)).startswith('retry: '))
+        message = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.05)
+        self.assertFalse(message.done())
+
+        await sync_to_async(raise_alert)()
+        self.assertIn('"action": "add"', await asyncio.wait_for(message, timeout=2))
+        await stream.aclose()
+        self.assertNotIn(self.doctor.pk, alert_events._waiters)
+
+    def test_expired_events_are_purged_at_most_once_a_minute(self):
+        def expired_event():
+            event = AlertEvent.objects.create(medico=self.doctor, folio_hospitalizacion='OLD', action='remove')
+            AlertEvent.objects.filter(pk=event.pk).update(created_at=timezone.now() - timedelta(days=2))
+            return event
+
+        first = expired_event()
+        with mock.patch.object(alert_events, '_next_purge', 0.0):
+            self.set_risk(antecedentes_dificultad=True, patil_aldrete=3, imc=36)
+            self.assertFalse(AlertEvent.objects.filter(pk=first.pk).exists())
+
+            second = expired_event()
+            self.set_risk(mallampati=3)
+            self.assertTrue(AlertEvent.objects.filter(pk=second.pk).exists())
+        self.assertEqual(alert_events.purge_expired_alert_events(), 1)
+
+    def test_snapshot_carries_the_event_to_resume_after(self):
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.client.get(reverse('patient-alerts')).json()['last_event_id'], 0)
+
+        self.set_risk(antecedentes_dificultad=True, patil_aldrete=3, imc=36)
+        event = AlertEvent.objects.get()
+        self.assertEqual(self.client.get(reverse('patient-alerts')).json()['last_event_id'], event.pk)
+
+    def test_wsgi_requests_are_told_to_poll(self):
+        self.client.force_login(self.doctor)
+        response = self.client.get(reverse('alert-stream'))
+        self.assertEqual(response.status_code, 204)
+
+
+class PresurgeryRelationTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor()
+        self.patient = create_patient(self.doctor, 'REL-1')
+        self.presurgery = create_presurgery(self.patient)
+
+    def test_save_links_patient_and_doctor(self):
+        self.assertEqual(self.presurgery.patient, self.patient)
+        self.assertEqual(self.presurgery.medico_user, self.doctor)
+        self.assertEqual(list(self.patient.presurgeryform_set.all()), [self.presurgery])
+
+    def test_migration_backfills_from_folio_and_name(self):
+        backfill = import_module('website.migrations.0011_presurgery_patient_medico_user').backfill_relations
+        orphan_doctor = create_doctor('orphan')
+        orphan = create_presurgery(create_patient(orphan_doctor, 'REL-2'), folio_hospitalizacion='PRE-LEGACY')
+        PreSurgeryForm.objects.update(patient=None, medico_user=None)
+
+        backfill(django_apps, None)
+
+        self.presurgery.refresh_from_db()
+        orphan.refresh_from_db()
+        self.assertEqual((self.presurgery.patient, self.presurgery.medico_user), (self.patient, self.doctor))
+        # No patient with that folio: the doctor is matched by name
+        self.assertEqual((orphan.patient, orphan.medico_user), (None, orphan_doctor))
+
+    def test_detail_pages_join_the_patient(self):
+        create_postsurgery(self.presurgery)
+        self.client.force_login(self.doctor)
+
+        for name in ('presurgery-detail', 'postsurgery-detail'):
+            response = self.client.get(reverse(name, args=[self.presurgery.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['patient'], self.patient)
+
+        response = self.client.get(reverse('presurgery-detail', args=['PRE-MISSING']))
+        self.assertEqual(response.status_code, 404)
+
+
+class PatientListQueryCountTests(TestCase):
+    # Session, user and the annotated patient query, however many rows are listed
+    LIST_QUERIES = 3
+
+    def setUp(self):
+        self.doctor = create_doctor()
+        self.client.force_login(self.doctor)
+
+    def create_patients(self, count, offset=0):
+        for index in range(offset, offset + count):
+            patient = create_patient(self.doctor, f'LIST-{index}')
+            if index % 3:
+                presurgery = create_presurgery(patient)
+                if index % 3 == 2:
+                    create_postsurgery(presurgery)
+
+    def test_form_lists_query_count_is_constant(self):
+        for offset, count in ((0, 3), (3, 9)):
+            self.create_patients(count, offset)
+            for form_type in ('pre', 'post'):
+                with self.assertNumQueries(self.LIST_QUERIES):
+                    response = self.client.get(reverse('patient-list'), {'form': form_type})
+                self.assertEqual(len(response.context['patients']), offset + count)
+
+    def test_form_lists_link_the_presurgery_folio(self):
+        self.create_patients(3)
+        pre, post = PreSurgeryForm.objects.get(pk='PRE-LIST-1'), PreSurgeryForm.objects.get(pk='PRE-LIST-2')
+
+        response = self.client.get(reverse('patient-list'), {'form': 'pre'})
+        self.assertContains(response, reverse('presurgery-update', args=[pre.pk]))
+        self.assertContains(response, reverse('presurgery-create', args=[Patient.objects.get(folio_hospitalizacion='LIST-0').pk]))
+
+        response = self.client.get(reverse('patient-list'), {'form': 'post'})
+        self.assertContains(response, reverse('postsurgery-detail', args=[post.pk]))
+        self.assertNotContains(response, reverse('postsurgery-detail', args=[pre.pk]))
+
+
+class PatientListPaginationTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor()
+        self.client.force_login(self.doctor)
+        for index in range(7):
+            create_patient(self.doctor, f'PAGE-{index}')
+        # Registration ties are broken by the primary key
+        Patient.objects.filter(folio_hospitalizacion__in=['PAGE-2', 'PAGE-3', 'PAGE-4']).update(
+            fecha_registro=Patient.objects.get(folio_hospitalizacion='PAGE-2').fecha_registro
+        )
+        self.patients = Patient.objects.filter(medico=self.doctor)
+        self.expected = list(self.patients.order_by('-fecha_registro', '-pk'))
+
+    def test_cursors_walk_every_patient_once_in_both_directions(self):
+        pages = [paginate_by_cursor(self.patients, page_size=3)]
+        while pages[-1].has_next():
+            pages.append(paginate_by_cursor(self.patients, pages[-1].next_cursor, page_size=3))
+
+        self.assertEqual([list(page) for page in pages], [self.expected[:3], self.expected[3:6], self.expected[6:]])
+        self.assertFalse(pages[0].has_previous())
+
+        previous = paginate_by_cursor(self.patients, pages[-1].previous_cursor, page_size=3)
+        self.assertEqual(list(previous), self.expected[3:6])
+        first = paginate_by_cursor(self.patients, previous.previous_cursor, page_size=3)
+        self.assertEqual(list(first), self.expected[:3])
+        self.assertFalse(first.has_previous())
+
+    def test_list_view_follows_the_next_cursor(self):
+        response = self.client.get(reverse('patient-list'))
+        page = response.context['patients']
+        self.assertEqual(list(page), self.expected)
+        self.assertFalse(page.has_other_pages())
+
+        response = self.client.get(reverse('patient-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(list(response.context['patients']), self.expected)
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor()
+        self.client.force_login(self.doctor)
+        self.maria = create_patient(self.doctor, 'HGM-2024-001', nombres='María José', apellidos='Núñez Pérez')
+        self.juan = create_patient(self.doctor, 'HGM-2024-002', nombres='Juan', apellidos='Martínez')
+        self.patients = Patient.objects.filter(medico=self.doctor)
+
+    def search(self, query):
+        return set(search_patients(self.patients, query))
+
+    def test_fts_matches_word_prefixes_without_accents(self):
+        self.assertEqual(self.search('maria'), {self.maria})
+        self.assertEqual(self.search('PEREZ nun'), {self.maria})
+        self.assertEqual(self.search('hgm-2024'), {self.maria, self.juan})
+        self.assertEqual(self.search('"mart'), {self.juan})
+        self.assertEqual(self.search('jose juan'), set())
+
+    def test_index_follows_saves_and_deletes(self):
+        self.juan.apellidos = 'Ortega'
+        self.juan.save()
+        self.assertEqual(self.search('ortega'), {self.juan})
+        self.assertEqual(self.search('martinez'), set())
+
+        self.juan.delete()
+        self.assertEqual(self.search('ortega'), set())
+
+    def test_index_is_keyed_on_the_patient_not_its_rowid(self):
+        # As VACUUM may do to a table without an integer primary key
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE website_patient SET rowid = rowid + 1000')
+        self.assertEqual(self.search('nunez'), {self.maria})
+
+        self.maria.apellidos = 'Ortega'
+        self.maria.save()
+        self.assertEqual(self.search('nunez'), set())
+        self.juan.delete()
+        self.assertEqual(self.search('ortega'), {self.maria})
+
+    def test_prefix_columns_without_fts(self):
+        self.assertEqual(self.maria.search_apellidos, 'nunez perez')
+        with mock.patch('website.utils.patient_search.fts_enabled', return_value=False):
+            self.assertEqual(self.search('NUÑEZ'), {self.maria})
+            self.assertEqual(self.search('hgm-2024-00 mar'), {self.maria, self.juan})
+            self.assertEqual(self.search('perez'), set())
+
+    def test_rebuild_command_reindexes_bulk_writes(self):
+        Patient.objects.bulk_create([Patient(
+            folio_hospitalizacion='BULK-1', nombres='Ramón', apellidos='Íñiguez',
+            fecha_nacimiento=date(1990, 1, 1), medico=self.doctor, codigo_barras='codigos_barra/test.png'
+        )])
+        self.assertEqual(self.search('iniguez'), set())
+
+        out = StringIO()
+        call_command('rebuild_patient_search', stdout=out)
+        bulk = Patient.objects.get(folio_hospitalizacion='BULK-1')
+        self.assertIn('Refreshed search prefixes of 1 patients', out.getvalue())
+        self.assertEqual(bulk.search_apellidos, 'iniguez')
+        self.assertEqual(self.search('iniguez'), {bulk})
+
+    def test_list_view_searches_the_index(self):
+        response = self.client.get(reverse('patient-list'), {'q': 'núñez', 'form': 'pre'})
+        self.assertEqual(list(response.context['patients']), [self.maria])
+
+
+class ExcelExportTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor()
+        self.client.force_login(self.doctor)
+        first = create_presurgery(create_patient(self.doctor, 'XLS-1'), estado_fisico_asa=4, mallampati=3)
+        create_postsurgery(first, complicaciones='Hipoxemia\x0b transitoria')
+        create_presurgery(create_patient(self.doctor, 'XLS-2'))
+        create_presurgery(create_patient(create_doctor('other'), 'XLS-3'))
+
+    def export(self, **params):
+        response = self.client.get(reverse('dashboard-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        return load_workbook(BytesIO(b''.join(response.streaming_content)))
+
+    def test_summary_sheet(self):
+        workbook = self.export()
+        self.assertEqual(workbook.sheetnames, ['Dashboard Export'])
+        summary = dict(row[:2] for row in workbook['Dashboard Export'].iter_rows(values_only=True) if row)
+        self.assertEqual(summary['Total Pacientes'], 2)
+        self.assertEqual(summary['Pacientes de Alto Riesgo'], 1)
+        self.assertEqual(summary['Total Cirugías'], 1)
+        self.assertEqual(summary['Tasa de Complicaciones'], '100.00%')
+        self.assertEqual(summary['Mallampati Promedio'], 2.5)
+
+    def test_case_sheet_lists_the_doctors_cases(self):
+        rows = list(self.export(cases='1')['Casos'].iter_rows(values_only=True))
+        header, cases = rows[0], rows[1:]
+        self.assertEqual(header[0], 'Folio Hospitalización')
+        self.assertEqual([case[0] for case in cases], ['PRE-XLS-1', 'PRE-XLS-2'])
+        complications = header.index('Complicaciones')
+        self.assertEqual([case[complications] for case in cases], ['Hipoxemia transitoria', None])
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.doctor = create_doctor()
+        self.client.force_login(self.doctor)
+        for index in range(3):
+            create_presurgery(create_patient(self.doctor, f'JOB-{index}'), mallampati=index + 1)
+
+    def request_export(self, **data):
+        return self.client.post(reverse('export-job-create'), data)
+
+    def download(self, job_id):
+        response = self.client.get(reverse('export-job-download', args=[job_id]))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    @override_settings(EXPORT_JOB_BACKEND='eager')
+    def test_eager_jobs_finish_and_can_be_downloaded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.request_export(format='csv')
+        self.assertEqual(response.status_code, 202)
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((status['status'], status['progress'], status['processed_rows']), ('done', 100, 3))
+
+        rows = list(csv.reader(StringIO(self.download(status['id']).decode('utf-8-sig'))))
+        self.assertEqual(rows[0][0], 'Folio Hospitalización')
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ['PRE-JOB-0', 'PRE-JOB-1', 'PRE-JOB-2'])
+
+    def test_identical_requests_share_the_active_job(self):
+        first = self.request_export(format='xlsx', cases='1')
+        second = self.request_export(format='xlsx', cases='1')
+        other = self.request_export(format='xlsx')
+
+        self.assertEqual((first.status_code, second.status_code, other.status_code), (202, 200, 202))
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertNotEqual(first.json()['id'], other.json()['id'])
+        self.assertEqual(self.request_export(format='pdf').status_code, 400)
+
+    def test_worker_command_runs_queued_jobs(self):
+        job_id = self.request_export(format='xlsx', cases='1').json()['id']
+        self.assertEqual(self.client.get(reverse('export-job-status', args=[job_id])).json()['progress'], 0)
+
+        out = StringIO()
+        call_command('run_export_jobs', '--once', stdout=out)
+
+        self.assertIn(f'Export {job_id} (xlsx) done: 3 rows', out.getvalue())
+        workbook = load_workbook(BytesIO(self.download(job_id)))
+        self.assertEqual(workbook['Casos'].max_row, 4)
+        # Finished jobs no longer block a new identical request
+        self.assertEqual(self.request_export(format='xlsx', cases='1').status_code, 202)
+
+    def test_jobs_of_dead_workers_are_reclaimed(self):
+        job_id = self.request_export(format='csv').json()['id']
+        quiet = timezone.now() - CLAIM_TIMEOUT - timedelta(seconds=1)
+        # A worker claimed the job and died
+        ExportJob.objects.filter(pk=job_id).update(status=ExportJob.STATUS_RUNNING, attempts=1, heartbeat_at=quiet)
+
+        # The identical request finds the job queued again
+        response = self.request_export(format='csv')
+        self.assertEqual((response.status_code, response.json()['id']), (200, job_id))
+        self.assertEqual(ExportJob.objects.get(pk=job_id).status, ExportJob.STATUS_PENDING)
+
+        call_command('run_export_jobs', '--once', stdout=StringIO())
+        job = ExportJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.attempts, job.processed_rows), (ExportJob.STATUS_DONE, 2, 3))
+
+    def test_jobs_are_failed_after_the_last_attempt(self):
+        # A job still reporting progress is left alone
+        busy_id = self.request_export(format='xlsx').json()['id']
+        ExportJob.objects.filter(pk=busy_id).update(
+            status=ExportJob.STATUS_RUNNING, attempts=1, heartbeat_at=timezone.now()
+        )
+        job_id = self.request_export(format='csv').json()['id']
+        quiet = timezone.now() - CLAIM_TIMEOUT - timedelta(seconds=1)
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.STATUS_RUNNING, attempts=MAX_ATTEMPTS, heartbeat_at=quiet
+        )
+
+        with self.assertLogs('website.utils.export_jobs', 'ERROR'):
+            self.assertEqual(reclaim_abandoned_jobs(), 1)
+        self.assertEqual(ExportJob.objects.get(pk=job_id).status, ExportJob.STATUS_FAILED)
+        self.assertEqual(ExportJob.objects.get(pk=busy_id).status, ExportJob.STATUS_RUNNING)
+        # The failed job no longer blocks a new request
+        self.assertEqual(self.request_export(format='csv').status_code, 202)
+
+    def test_slow_steps_without_progress_keep_the_claim(self):
+        job_id = self.request_export(format='xlsx').json()['id']
+        clock = [timezone.now()]
+        summary_sections, save = excel_export.summary_sections, Workbook.save
+
+        def slow_summary(user):
+            clock[0] += 2 * HEARTBEAT_INTERVAL
+            return summary_sections(user)
+
+        def slow_save(workbook, output):
+            clock[0] += 2 * HEARTBEAT_INTERVAL
+            # Past CLAIM_TIMEOUT since the claim, but not since the last heartbeat
+            self.assertEqual(reclaim_abandoned_jobs(), 0)
+            save(workbook, output)
+
+        with mock.patch.object(timezone, 'now', lambda: clock[0]), \
+                mock.patch.object(excel_export, 'summary_sections', slow_summary), \
+                mock.patch.object(Workbook, 'save', slow_save):
+            call_command('run_export_jobs', '--once', stdout=StringIO())
+
+        job = ExportJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.attempts), (ExportJob.STATUS_DONE, 1))
+        self.assertEqual(job.heartbeat_at, clock[0])
+
+    @override_settings(EXPORT_JOB_BACKEND='eager')
+    def test_expired_files_are_removed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job_id = self.request_export(format='csv').json()['id']
+        job = ExportJob.objects.get(pk=job_id)
+        self.assertTrue(job.file.storage.exists(job.file.name))
+
+        self.assertEqual(purge_expired_exports(now=job.expires_at + timedelta(seconds=1)), 1)
+
+        self.assertFalse(job.file.storage.exists(job.file.name))
+        self.assertEqual(ExportJob.objects.get(pk=job_id).status, ExportJob.STATUS_EXPIRED)
+        self.assertEqual(self.client.get(reverse('export-job-download', args=[job_id])).status_code, 404)
+
+    def test_other_doctors_cannot_see_a_job(self):
+        job_id = self.request_export(format='csv').json()['id']
+        self.client.force_login(create_doctor('other'))
+        self.assertEqual(self.client.get(reverse('export-job-status', args=[job_id])).status_code, 404)
+
+    @override_settings(EXPORT_JOB_BACKEND='eager')
+    def test_parquet_export(self):
+        if not parquet_available():
+            self.assertEqual(self.request_export(format='parquet').status_code, 400)
+            return
+        import pandas as pd
+
+        with self.captureOnCommitCallbacks(execute=True):
+            job_id = self.request_export(format='parquet').json()['id']
+        frame = pd.read_parquet(BytesIO(self.download(job_id)))
+        self.assertEqual(sorted(frame['mallampati']), [1, 2, 3])
+        self.assertTrue(frame['post_surgery_form__numero_intentos'].isna().all())
+
+
+@skipUnless(parquet_available(), 'pyarrow is not installed')
+@override_settings(CLINICAL_SNAPSHOT_LAG_SECONDS=0)
+class ClinicalSnapshotTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.doctor = create_doctor()
+        self.forms = [
+            create_presurgery(create_patient(self.doctor, f'SNAP-{index}'), mallampati=index + 1)
+            for index in range(3)
+        ]
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_clinical_snapshot', '--output', self.directory, *args, stdout=out)
+        return out.getvalue()
+
+    def read_snapshot(self):
+        import pandas as pd
+
+        state = read_state(self.directory)
+        frame = pd.concat([pd.read_parquet(f'{self.directory}/{part}') for part in state['parts']])
+        return state, frame
+
+    def test_nightly_runs_only_append_changed_rows(self):
+        self.assertIn('Wrote 3 rows', self.export())
+        self.assertIn('No rows changed', self.export())
+
+        create_postsurgery(self.forms[1], numero_intentos=2)
+        self.assertIn('Wrote 1 rows', self.export())
+
+        state, frame = self.read_snapshot()
+        self.assertEqual(len(state['parts']), 2)
+        latest = frame.sort_values('changed_at').drop_duplicates('folio_hospitalizacion', keep='last')
+        self.assertEqual(len(latest), 3)
+        attempts = latest.set_index('folio_hospitalizacion')['post_numero_intentos']
+        self.assertEqual(attempts['PRE-SNAP-1'], 2)
+        self.assertTrue(attempts.drop('PRE-SNAP-1').isna().all())
+        self.assertEqual(sorted(latest['patient_folio']), ['SNAP-0', 'SNAP-1', 'SNAP-2'])
+        self.assertIn('risk_score', latest.columns)
+
+        self.export('--full')
+        state, frame = self.read_snapshot()
+        self.assertEqual((len(state['parts']), len(frame)), (1, 3))
+
+    def test_deleted_forms_are_written_as_tombstones(self):
+        self.export()
+        self.forms[0].delete()
+        self.assertIn('Wrote 0 rows and 1 deletions', self.export())
+        self.assertIn('No rows changed', self.export())
+
+        state, frame = self.read_snapshot()
+        latest = frame.sort_values('changed_at').drop_duplicates('folio_hospitalizacion', keep='last')
+        self.assertEqual(sorted(latest[~latest['deleted']]['folio_hospitalizacion']), ['PRE-SNAP-1', 'PRE-SNAP-2'])
+        self.assertNotIn('folios', state)
+
+    def test_forms_created_again_are_not_tombstoned(self):
+        self.export()
+        patient = self.forms[0].patient
+        self.forms[0].delete()
+        create_presurgery(patient, mallampati=4)
+        self.assertIn('Wrote 1 rows', self.export())
+
+        _state, frame = self.read_snapshot()
+        latest = frame.sort_values('changed_at').drop_duplicates('folio_hospitalizacion', keep='last')
+        self.assertFalse(latest['deleted'].any())
+        self.assertEqual(latest.set_index('folio_hospitalizacion')['mallampati']['PRE-SNAP-0'], 4)
+
+    @override_settings(CLINICAL_SNAPSHOT_LAG_SECONDS=60)
+    def test_changes_wait_out_the_lag(self):
+        now = timezone.now()
+        run = update_snapshot_directory(self.directory, now=now)
+        self.assertEqual((run.rows, run.high_water_mark), (0, now - timedelta(seconds=60)))
+        self.assertEqual(update_snapshot_directory(self.directory, now=now + timedelta(seconds=61)).rows, 3)
+
+        PreSurgeryForm.objects.filter(pk=self.forms[2].pk).update(updated_at=now + timedelta(seconds=118))
+        self.assertEqual(update_snapshot_directory(self.directory, now=now + timedelta(seconds=170)).rows, 0)
+        # Stamped before the change above and the last run, but committed after them
+        PreSurgeryForm.objects.filter(pk=self.forms[1].pk).update(updated_at=now + timedelta(seconds=115))
+        self.assertEqual(update_snapshot_directory(self.directory, now=now + timedelta(seconds=240)).rows, 2)
+
+    def test_endpoint_is_scoped_to_the_doctor(self):
+        import pyarrow as pa
+
+        other = create_doctor('other')
+        create_presurgery(create_patient(other, 'SNAP-OTHER'))
+
+        self.client.force_login(self.doctor)
+        response = self.client.get(reverse('clinical-snapshot'), {'format': 'arrow'})
+        self.assertEqual(response.status_code, 200)
+        table = pa.ipc.open_file(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(sorted(table.column('patient_folio').to_pylist()), ['SNAP-0', 'SNAP-1', 'SNAP-2'])
+
+        since = response['X-Snapshot-High-Water-Mark']
+        self.forms[0].save()
+        response = self.client.get(reverse('clinical-snapshot'), {'format': 'arrow', 'since': since})
+        self.assertEqual(response['X-Snapshot-Rows'], '1')
+        self.assertEqual(self.client.get(reverse('clinical-snapshot'), {'since': 'ayer'}).status_code, 400)
+
+        self.client.force_login(create_doctor('staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('clinical-snapshot'))['X-Snapshot-Rows'], '4')
+
+
+@override_settings(CONTACT_EMAIL='contacto@alpha-project.com', DEFAULT_FROM_EMAIL='no-reply@alpha-project.com')
+class EmailOutboxTests(TestCase):
+    contact = {
+        'name': 'Ana López', 'email': 'ana@example.com', 'phone': '5550000000',
+        'subject': 'general', 'message': 'Hola',
+    }
+
+    def test_contact_form_only_enqueues(self):
+        self.assertEqual(self.client.post(reverse('contact'), self.contact).status_code, 302)
+        self.client.post(reverse('contact'), self.contact)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(ContactMessage.objects.count(), 2)
+        # The resubmitted message is queued once
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.recipients, email.reply_to), (['contacto@alpha-project.com'], ['ana@example.com']))
+
+    def test_message_is_queued_again_once_delivered_or_failed(self):
+        email, created = enqueue_email('Aviso', 'Texto', ['contacto@alpha-project.com'])
+        self.assertTrue(created)
+        self.assertEqual(enqueue_email('Aviso', 'Texto', ['contacto@alpha-project.com']), (email, False))
+
+        for status in (OutboxEmail.STATUS_SENT, OutboxEmail.STATUS_FAILED):
+            OutboxEmail.objects.filter(pk=email.pk).update(status=status)
+            email, created = enqueue_email('Aviso', 'Texto', ['contacto@alpha-project.com'])
+            self.assertTrue(created)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.STATUS_PENDING).get(), email)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OutboxEmail.objects.create(dedupe_key=email.dedupe_key, subject='Aviso', body='Texto')
+
+    def test_worker_sends_a_batch_over_one_connection(self):
+        for index in range(3):
+            enqueue_email(f'Aviso {index}', 'Texto', ['contacto@alpha-project.com'])
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', autospec=True) as open_connection:
+            out = StringIO()
+            call_command('send_outbox', '--once', stdout=out)
+
+        self.assertEqual(open_connection.call_count, 1)
+        self.assertIn('Sent 3, retrying 0, failed 0', out.getvalue())
+        self.assertEqual(sorted(message.subject for message in mail.outbox), ['Aviso 0', 'Aviso 1', 'Aviso 2'])
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.STATUS_SENT).exists())
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_DELAY=60)
+    def test_failures_are_retried_with_backoff(self):
+        email, _created = enqueue_email('Aviso', 'Texto', ['contacto@alpha-project.com'])
+        now = timezone.now()
+        send_messages = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+
+        with mock.patch(send_messages, side_effect=SMTPException('421 try again later')):
+            self.assertEqual(send_pending_emails(now=now).retrying, 1)
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboxEmail.STATUS_PENDING, 1))
+            self.assertEqual(email.next_attempt_at, now + timedelta(seconds=60))
+            self.assertEqual(send_pending_emails(now=now + timedelta(seconds=59)).retrying, 0)
+
+            now += timedelta(seconds=60)
+            self.assertEqual(send_pending_emails(now=now).retrying, 1)
+            email.refresh_from_db()
+            self.assertEqual(email.next_attempt_at, now + timedelta(seconds=120))
+
+        self.assertEqual(send_pending_emails(now=now + timedelta(seconds=120)).sent, 1)
+        self.assertEqual(len(mail.outbox), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.STATUS_SENT, 3))
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1)
+    def test_gives_up_after_the_last_attempt(self):
+        enqueue_email('Aviso', 'Texto', ['contacto@alpha-project.com'])
+        send_messages = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+        refused = SMTPRecipientsRefused({'contacto@alpha-project.com': (550, b'No such user')})
+        with mock.patch(send_messages, side_effect=refused):
+            self.assertEqual(send_pending_emails().failed, 1)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.STATUS_FAILED)
+        self.assertEqual(send_pending_emails().sent, 0)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1, EMAIL_OUTBOX_RETRY_DELAY=60)
+    def test_connection_failures_do_not_use_up_attempts(self):
+        for index in range(3):
+            enqueue_email(f'Aviso {index}', 'Texto', ['contacto@alpha-project.com'])
+        now = timezone.now()
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('refused')):
+            self.assertEqual(send_pending_emails(now=now).retrying, 3)
+        self.assertEqual(
+            set(OutboxEmail.objects.values_list('status', 'attempts', 'next_attempt_at', 'last_error')),
+            {(OutboxEmail.STATUS_PENDING, 0, now + timedelta(seconds=60), 'refused')}
+        )
+
+        # The server drops the connection after the first message
+        send_messages = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+        now += timedelta(seconds=60)
+        with mock.patch(send_messages, side_effect=[1, SMTPServerDisconnected('closed')]):
+            run = send_pending_emails(now=now)
+        self.assertEqual((run.sent, run.retrying, run.failed), (1, 2, 0))
+
+        run = send_pending_emails(now=now + timedelta(seconds=60))
+        self.assertEqual((run.sent, run.failed), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class GenerateSampleDataTests(TestCase):
+    def generate(self, *args, media=False):
+        options = () if media else ('--no-media',)
+        call_command('generate_sample_data', '--patients', '12', '--batch-size', '5', '--seed', '3',
+                     *options, '--clear', *args, stdout=StringIO())
+        stats = DoctorStats.objects.order_by('day').values_list(*DoctorStats.counter_fields())
+        forms = PreSurgeryForm.objects.order_by('pk').values_list(
+            'pk', 'patient__nombres', 'imc', 'mallampati', 'risk_score', 'risk_level',
+            'post_surgery_form__cormack'
+        )
+        return list(forms), list(stats)
+
+    def test_bulk_mode_matches_saving_row_by_row(self):
+        saved = self.generate()
+        bulk = self.generate('--bulk')
+        self.assertEqual(len(bulk[0]), 12)
+        self.assertEqual(bulk, saved)
+        self.assertEqual(self.generate('--bulk', '--workers', '2'), saved)
+
+        patient = Patient.objects.get(folio_hospitalizacion='SAMPLE-007')
+        found = search_patients(Patient.objects.all(), f'{patient.nombres.split()[0]} sample-007')
+        self.assertEqual(list(found), [patient])
+
+    def test_barcode_images_leave_the_other_values_alone(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            # One image per patient when saving row by row, a shared placeholder in bulk
+            saved = self.generate(media=True)
+            self.assertTrue(Patient.objects.get(folio_hospitalizacion='SAMPLE-001').codigo_barras.name)
+            self.assertEqual(self.generate('--bulk', media=True), saved)
+        self.assertEqual(self.generate(), saved)
+
+
+class BenchmarkViewsTests(TestCase):
+    def test_results_are_written_and_compared_with_the_baseline(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        results = f'{directory}/results.json'
+
+        # The test database is disposable already
+        call_command('benchmark_views', '--sizes', '8', '--repeat', '1', '--in-place', '--json', results,
+                     '--csv', f'{directory}/results.csv', stdout=StringIO())
+
+        with open(results) as results_file:
+            report = json.load(results_file)
+        views = {result['view']: result for result in report['results']}
+        self.assertEqual(set(views), {'dashboard', 'dashboard-stats', 'patient-alerts', 'patient-list',
+                                      'patient-detail'})
+        self.assertEqual(views['patient-list']['queries'], PatientListQueryCountTests.LIST_QUERIES)
+        with open(f'{directory}/results.csv') as csv_file:
+            self.assertEqual(len(list(csv.DictReader(csv_file))), 5)
+        # The synthetic cohort is rolled back
+        self.assertFalse(Patient.objects.exists())
+
+        views['patient-list']['queries'] -= 1
+        with open(results, 'w') as results_file:
+            json.dump(report, results_file)
+        with self.assertRaisesMessage(CommandError, 'patient-list @ 8: queries'):
+            call_command('benchmark_views', '--sizes', '8', '--repeat', '1', '--in-place',
+                         '--views', 'patient-list', '--baseline', results, '--time-threshold', '100',
+                         '--memory-threshold', '100', stdout=StringIO())
+
+    def test_compare_results_ignores_noise(self):
+        baseline = [{'view': 'dashboard', 'size': 1000, 'wall_ms': 10.0, 'queries': 5, 'peak_kb': 100.0}]
+        slower = [{'view': 'dashboard', 'size': 1000, 'wall_ms': 11.5, 'queries': 5, 'peak_kb': 110.0}]
+        self.assertEqual(compare_results(slower, baseline, time_threshold=0.1), [])
+
+        slower[0]['wall_ms'] = 20.0
+        self.assertEqual(compare_results(slower, baseline), ['dashboard @ 1000: wall time 10.0 ms -> 20.0 ms'])
+        self.assertEqual(compare_results(slower, baseline, time_threshold=1.5), [])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        request_metrics.reset()
+        self.doctor = create_doctor()
+        create_patient(self.doctor, 'M-001')
+        self.client.force_login(self.doctor)
+
+    def test_requests_are_recorded_by_view(self):
+        self.client.get(reverse('patient-list'))
+        self.client.get(reverse('patient-list'))
+
+        metrics = request_metrics.render()
+        self.assertIn('http_requests_total{view="patient-list",method="GET",status="200"} 2', metrics)
+        self.assertIn('http_request_db_queries_count{view="patient-list",method="GET"} 2', metrics)
+        # No request makes more than 50 queries
+        self.assertIn('http_request_db_queries_bucket{view="patient-list",method="GET",le="50"} 2', metrics)
+        self.assertIn('http_response_size_bytes_count{view="patient-list",method="GET"} 2', metrics)
+
+    def test_unknown_methods_share_one_label(self):
+        self.client.generic('BREW', reverse('patient-list'))
+        self.client.generic('PROPFIND', reverse('patient-list'))
+
+        metrics = request_metrics.render()
+        self.assertIn('http_request_duration_seconds_count{view="patient-list",method="other"} 2', metrics)
+        self.assertNotIn('BREW', metrics)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        self.client.get(reverse('patient-list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403
+        )
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
+
+        self.doctor.is_staff = True
+        self.doctor.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(SLOW_REQUEST_SECONDS=0, SLOW_REQUEST_TOP_QUERIES=2)
+    def test_slow_requests_are_logged_with_their_slowest_queries(self):
+        with self.assertLogs('website.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('patient-list'))
+        message = logs.output[0]
+        self.assertIn('Slow request GET /', message)
+        self.assertIn('(patient-list)', message)
+        self.assertIn('SELECT', message)
+        # Only the SQL: the parameters may hold patient data
+        self.assertNotIn('M-001', message)
+        self.assertEqual(message.count(' ms ['), 2)
+
+    @override_settings(SLOW_REQUEST_SECONDS=None)
+    def test_slow_request_log_can_be_disabled(self):
+        with self.assertNoLogs('website.slow_requests'):
+            self.client.get(reverse('patient-list'))
+
+
+class RepeatedQueryTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor()
+        for i in range(4):
+            create_postsurgery(create_presurgery(create_patient(self.doctor, f'M-00{i}')))
+        self.client.force_login(self.doctor)
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint('SELECT "a"."id" FROM "a" WHERE "a"."id" IN (%s, %s, %s) AND "a"."n" = \'x\' LIMIT 21'),
+            fingerprint('SELECT  "a"."id" FROM "a"\nWHERE "a"."id" IN (%s, %s) AND "a"."n" = \'y\' LIMIT 1'),
+        )
+        self.assertNotEqual(fingerprint('SELECT * FROM "a" WHERE "id" = %s'), fingerprint('SELECT * FROM "b" WHERE "id" = %s'))
+
+    def test_repeated_statement_is_reported_with_its_origin(self):
+        with self.assertRaises(RepeatedQueryError) as raised:
+            with detect_repeated_queries(threshold=2):
+                for form in PreSurgeryForm.objects.all():
+                    form.patient.nombres
+        report = str(raised.exception)
+        self.assertIn('4x [default] SELECT', report)
+        self.assertIn('website/tests.py', report)
+        self.assertIn('form.patient.nombres', report)
+
+        with detect_repeated_queries(threshold=2):
+            for form in PreSurgeryForm.objects.select_related('patient'):
+                form.patient.nombres
+
+    def test_views_do_not_repeat_queries_per_patient(self):
+        patient = Patient.objects.first()
+        for url in (reverse('dashboard'), reverse('dashboard-stats'), reverse('patient-alerts'),
+                    reverse('patient-list'), reverse('patient-detail', args=[patient.pk])):
+            with self.subTest(url=url), detect_repeated_queries(threshold=3):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(DETECT_REPEATED_QUERIES=True, REPEATED_QUERY_THRESHOLD=0)
+    def test_middleware_logs_repeated_statements(self):
+        with self.assertLogs('website.repeated_queries', 'WARNING') as logs:
+            self.client.get(reverse('patient-list'))
+            self.client.get(reverse('patient-list'))
+        self.assertIn('GET /', logs.output[0])
+        self.assertIn('(patient-list)', logs.output[0])
+
+    @override_settings(DETECT_REPEATED_QUERIES=True, REPEATED_QUERY_THRESHOLD=0, REPEATED_QUERY_RAISE=True)
+    def test_middleware_can_fail_the_request(self):
+        with self.assertRaises(RepeatedQueryError), self.assertLogs('django.request', 'ERROR'):
+            self.client.get(reverse('patient-list'))
+
+
+class SqliteTuningTests(TestCase):
+    def test_new_connections_get_the_configured_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_apply_pragmas_switches_a_database_file_to_wal(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        db = sqlite3.connect(f'{directory}/tuned.sqlite3')
+        self.addCleanup(db.close)
+
+        applied = apply_pragmas(db, {'journal_mode': 'WAL', 'cache_size': -2000})
+        self.assertEqual(applied, {'journal_mode': 'wal', 'cache_size': -2000})
+        with self.assertRaises(ValueError):
+            apply_pragmas(db, {'cache_size': '1; DROP TABLE x'})
+
+    def test_concurrency_benchmark_runs_both_modes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        call_command('benchmark_sqlite_concurrency', '--duration', '0.2', '--rows', '200', '--readers', '1',
+                     '--writers', '1', '--json', f'{directory}/results.json', stdout=StringIO())
+
+        with open(f'{directory}/results.json') as results_file:
+            results = {result['mode']: result for result in json.load(results_file)['results']}
+        self.assertEqual(results['default']['journal_mode'], 'delete')
+        self.assertEqual(results['tuned']['journal_mode'], 'wal')
+        self.assertGreater(results['tuned']['writer_ops_per_s'], 0)
+        self.assertGreater(results['tuned']['reader_ops_per_s'], 0)
+
+
+class AnalyticsRouterTests(TestCase):
+    """The replica is a second SQLite file: a copy of the test database taken before any test data"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Copied before the test case opens its transaction
+        cls.directory = tempfile.mkdtemp()
+        replica_path = f'{cls.directory}/replica.sqlite3'
+        connections['default'].ensure_connection()
+        replica = sqlite3.connect(replica_path)
+        connections['default'].connection.backup(replica)
+        replica.close()
+        # Registered here rather than in settings: the test runner only sets up configured aliases
+        connections.settings['replica'] = {
+            **connections.settings['default'], 'NAME': f'file:{replica_path}?mode=ro', 'OPTIONS': {},
+        }
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.doctor = create_doctor()
+        for i in range(3):
+            create_presurgery(create_patient(self.doctor, f'R-00{i}'))
+        caches[CACHE_ALIAS].clear()
+        self.client.force_login(self.doctor)
+
+    def total_patients(self):
+        return self.client.get(reverse('dashboard-stats')).json()['summary']['total_patients']
+
+    def test_analytics_views_read_from_the_replica(self):
+        self.assertEqual(analytics_database(), 'replica')
+        # The replica has not caught up with the patients yet
+        self.assertEqual(self.total_patients(), 0)
+        # Other views, and writes, use the primary
+        self.assertContains(self.client.get(reverse('patient-list')), 'R-002')
+        self.assertFalse(Patient.objects.using('replica').exists())
+
+    def test_users_who_just_wrote_read_from_the_primary(self):
+        self.client.post(reverse('dismiss-alert', args=['alert_R-000']))
+        self.assertIn(PIN_SESSION_KEY, self.client.session)
+        self.assertEqual(self.total_patients(), 3)
+
+        session = self.client.session
+        session[PIN_SESSION_KEY] = 0
+        session.save()
+        # Drop the stats cached from the primary
+        bump_data_version(self.doctor.pk)
+        self.assertEqual(self.total_patients(), 0)
+
+    def test_writes_refused_while_reading_from_the_replica(self):
+        with reading_from_analytics():
+            with self.assertRaises(RuntimeError):
+                Patient.objects.filter(medico=self.doctor).update(activo=False)
+            with on_primary():
+                Patient.objects.filter(folio_hospitalizacion='R-000').update(activo=False)
+        self.assertFalse(Patient.objects.get(folio_hospitalizacion='R-000').activo)
+
+    def test_dashboard_leaves_primary_rollup_alone(self):
+        PreSurgeryForm.objects.update(risk_version='old')
+        rollup = list(DoctorStats.objects.values())
+
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertEqual(self.total_patients(), 0)
+
+        self.assertEqual(list(DoctorStats.objects.values()), rollup)
+        self.assertFalse(PreSurgeryForm.objects.exclude(risk_version='old').exists())
+
+    def test_replica_is_opened_read_only_in_its_own_journal_mode(self):
+        with connections['replica'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'delete')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            with self.assertRaises(DatabaseError):
+                cursor.execute('DELETE FROM website_patient')
+
+    @override_settings(ANALYTICS_DATABASE='reporting')
+    def test_reads_fall_back_to_the_primary_without_a_replica(self):
+        self.assertIsNone(analytics_database())
+        self.assertEqual(self.total_patients(), 3)
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def test_matching_ignores_accents_and_case(self):
+        self.assertEqual(normalize_text('HIPERTENSIÓN, Neumonía'), 'hipertension, neumonia')
+        matcher = KeywordMatcher([('cardio', ['hipertensión', 'infarto']), ('resp', ['neumonia']),
+                                  ('renal', ['insuficiencia renal'])])
+        self.assertEqual(matcher.categories('Neumonía e HIPERTENSION arterial'), ('cardio', 'resp'))
+        self.assertEqual(matcher.categories('hipertensión'), ('cardio',))
+        self.assertEqual(matcher.flags('Infarto previo'), (True, False, False))
+        self.assertEqual(matcher.categories(None), ())
+        # Long notes are not cached but match the same way
+        self.assertEqual(matcher.categories('sin cambios ' * 100 + 'Insuficiencia Renal'), ('renal',))
+
+    def test_risk_engine_matches_accented_history(self):
+        form = PreSurgeryForm(comorbilidades='Hipertensión arterial, neumonía', medicamentos='Heparina',
+                              alergias='Látex')
+        factors = AdvancedRiskCalculator._calculate_medical_history_risk(form)['factors']
+        self.assertEqual(factors, ['Comorbilidades respiratorias', 'Comorbilidades cardiovasculares',
+                                   'Terapia anticoagulante', 'Alergias relevantes para anestesia'])
+
+    def test_complication_keywords_match_unaccented_text(self):
+        self.assertEqual(complication_keywords('Intubacion dificil, NEUMOTORAX'),
+                         ('intubación difícil', 'neumotórax'))
@@ -41,7 +41,24 @@ urlpatterns = [
     # Dashboard API endpoints
     path('api/dashboard/stats/', views.get_dashboard_stats, name='dashboard-stats'),
     path('api/dashboard/alerts/', views.get_patient_alerts, name='patient-alerts'),
+    path('api/dashboard/alerts/stream/', views.alert_stream, name='alert-stream'),
     path('api/dashboard/alerts/dismiss/<str:alert_id>/', views.dismiss_alert, name='dismiss-alert'),
+    path('api/dashboard/cache-stats/', views.get_dashboard_cache_stats, name='dashboard-cache-stats'),
+    path('api/dashboard/export/', views.export_dashboard, name='dashboard-export'),
+
+    # Background exports
+    path('api/exports/', views.create_export_job, name='export-job-create'),
+    path('api/exports/<uuid:pk>/', views.export_job_status, name='export-job-status'),
+    path('api/exports/<uuid:pk>/download/', views.export_job_download, name='export-job-download'),
+
+    # Columnar snapshot of the clinical dataset
+    path('api/research/snapshot/', views.clinical_snapshot, name='clinical-snapshot'),
+
+    # Risk of a form under a registered risk model (?model=)
+    path('api/presurgery/<str:pk>/risk/', views.presurgery_risk, name='presurgery-risk'),
+
+    # Prometheus scrape endpoint
+    path('metrics', views.metrics, name='metrics'),
 ]
 
 # Error handlers
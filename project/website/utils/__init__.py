@@ -2,5 +2,6 @@
 # This file makes the utils directory a Python package
 
 from .risk_assessment import RiskCalculator, AdvancedRiskCalculator
+from .batch_risk import BatchRiskResult, calculate_batch_risk
 
-__all__ = ['RiskCalculator', 'AdvancedRiskCalculator']
\ No newline at end of file
+__all__ = ['RiskCalculator', 'AdvancedRiskCalculator', 'BatchRiskResult', 'calculate_batch_risk']
\ No newline at end of file
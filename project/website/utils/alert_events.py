@@ -0,0 +1,179 @@
+# website/utils/alert_events.py - Airway alert tiers and the Server-Sent Events feed
+
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ..models import AlertEvent
+
+
+# Risk score thresholds of the dashboard alerts
+HIGH_ALERT_SCORE = 70
+CRITICAL_ALERT_SCORE = 80
+
+# EventSource reconnect delay, in milliseconds
+RECONNECT_DELAY_MS = 3000
+
+# How long streamed events are kept for clients resuming with Last-Event-ID
+EVENT_RETENTION = timedelta(days=1)
+
+# Seconds between purges of expired events, per process
+PURGE_INTERVAL = 60
+
+_next_purge = 0.0
+
+# Open streams of this process by doctor: (event loop, asyncio.Event) pairs
+# set by notify_alert_streams
+_waiters = defaultdict(set)
+_waiters_lock = threading.Lock()
+
+
+def alert_severity(risk_score):
+    """Alert tier of a risk score, or None when no alert is raised"""
+    if risk_score is None or risk_score < HIGH_ALERT_SCORE:
+        return None
+    return 'CRITICAL' if risk_score >= CRITICAL_ALERT_SCORE else 'HIGH'
+
+
+def alert_payload(form, timestamp=None, has_post_surgery=None):
+    """Alert of a PreSurgeryForm in the shape returned by the alerts API"""
+    if has_post_surgery is None:
+        has_post_surgery = hasattr(form, 'post_surgery_form')
+    return {
+        'id': f"alert_{form.folio_hospitalizacion}",
+        'severity': alert_severity(form.risk_score),
+        'patient_name': f"{form.nombres} {form.apellidos}",
+        'folio': form.folio_hospitalizacion,
+        'risk_score': form.risk_score,
+        'risk_factors': form.risk_factors,
+        'timestamp': timestamp or timezone.now().isoformat(),
+        'has_post_surgery': has_post_surgery,
+    }
+
+
+def record_alert_change(medico_id, before, form, has_post_surgery=False):
+    """
+    Store an AlertEvent when a save moves the form between alert tiers, or changes
+    the score of a form that stays alerted. ``before`` is the stored form prior to
+    the save (None for new forms); ``form`` is None when it was deleted.
+    """
+    if medico_id is None:
+        return None
+
+    old_score = before.risk_score if before is not None else None
+    new_score = form.risk_score if form is not None else None
+    old_severity, new_severity = alert_severity(old_score), alert_severity(new_score)
+
+    if new_severity is None:
+        if old_severity is None:
+            return None
+        folio = before.folio_hospitalizacion
+        action, payload = 'remove', {'id': f"alert_{folio}", 'folio': folio}
+    elif old_severity is None:
+        folio = form.folio_hospitalizacion
+        action, payload = 'add', alert_payload(form, has_post_surgery=has_post_surgery)
+    elif old_severity != new_severity or old_score != new_score:
+        folio = form.folio_hospitalizacion
+        action, payload = 'update', alert_payload(form, has_post_surgery=has_post_surgery)
+    else:
+        return None
+
+    global _next_purge
+    if time.monotonic() >= _next_purge:
+        _next_purge = time.monotonic() + PURGE_INTERVAL
+        purge_expired_alert_events()
+
+    event = AlertEvent.objects.create(
+        medico_id=medico_id, folio_hospitalizacion=folio, action=action, payload=payload
+    )
+    # Streams only see the event once it is committed
+    transaction.on_commit(partial(notify_alert_streams, medico_id))
+    return event
+
+
+def purge_expired_alert_events(now=None):
+    """Delete the events older than EVENT_RETENTION"""
+    now = now or timezone.now()
+    deleted, _ = AlertEvent.objects.filter(created_at__lt=now - EVENT_RETENTION).delete()
+    return deleted
+
+
+def notify_alert_streams(medico_id):
+    """Wake the doctor's open streams in this process; safe to call from any thread"""
+    with _waiters_lock:
+        waiters = list(_waiters.get(medico_id, ()))
+    for loop, wakeup in waiters:
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:  # The stream's event loop has closed
+            pass
+
+
+def format_event(event):
+    """Serialize an AlertEvent as a Server-Sent Events message"""
+    data = json.dumps(dict(event.payload, action=event.action))
+    return f"id: {event.pk}\nevent: alert\ndata: {data}\n\n"
+
+
+async def alert_event_stream(medico_id, last_event_id=None):
+    """
+    Yield a doctor's alert events as Server-Sent Events. Resumes after
+    ``last_event_id`` when given, otherwise starts from the newest event. Saves
+    in this process wake the stream through notify_alert_streams; events written
+    by other processes are picked up every ALERT_STREAM_POLL_INTERVAL. Sends a
+    comment as heartbeat while idle and ends after ALERT_STREAM_MAX_SECONDS;
+    EventSource then reconnects with the Last-Event-ID header.
+    """
+    poll_interval = getattr(settings, 'ALERT_STREAM_POLL_INTERVAL', 3)
+    heartbeat_interval = getattr(settings, 'ALERT_STREAM_HEARTBEAT', 15)
+    max_seconds = getattr(settings, 'ALERT_STREAM_MAX_SECONDS', 300)
+    events = AlertEvent.objects.filter(medico_id=medico_id)
+
+    if last_event_id is None:
+        last_event_id = (await events.aaggregate(last=Max('id')))['last'] or 0
+
+    yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    waiter = (loop, wakeup)
+    with _waiters_lock:
+        _waiters[medico_id].add(waiter)
+    try:
+        started = last_sent = loop.time()
+        while loop.time() - started < max_seconds:
+            # Cleared before the query, so a notification during it is not lost
+            wakeup.clear()
+            batch = [event async for event in events.filter(id__gt=last_event_id).order_by('id')[:100]]
+            for event in batch:
+                yield format_event(event)
+                last_event_id = event.pk
+            if len(batch) == 100:
+                continue  # More are waiting
+
+            now = loop.time()
+            if batch:
+                last_sent = now
+            elif now - last_sent >= heartbeat_interval:
+                yield ": heartbeat\n\n"
+                last_sent = now
+
+            timeout = min(poll_interval, last_sent + heartbeat_interval - now, started + max_seconds - now)
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _waiters_lock:
+            _waiters[medico_id].discard(waiter)
+            if not _waiters[medico_id]:
+                del _waiters[medico_id]
@@ -0,0 +1,266 @@
+# website/utils/batch_risk.py - Vectorized cohort scoring for AdvancedRiskCalculator
+
+from datetime import date
+from operator import attrgetter, itemgetter
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from django.utils import timezone
+
+from .keyword_matcher import risk_group_matcher
+from .risk_assessment import AdvancedRiskCalculator
+
+
+# Columns read from PreSurgeryForm by the vectorized pass
+RISK_FIELDS = ('folio_hospitalizacion', *AdvancedRiskCalculator.INPUT_FIELDS)
+
+COMPONENTS = (
+    'airway_anatomy', 'patient_factors', 'medical_history', 'physiological', 'procedure_factors'
+)
+
+
+class BatchRiskResult:
+    """
+    Column-oriented result of a vectorized risk pass.
+    Every column is a NumPy array aligned with ``folios``.
+    """
+
+    def __init__(self, folios: np.ndarray, components: Dict[str, np.ndarray],
+                 multiplier: np.ndarray, total_score: np.ndarray):
+        self.folios = folios
+        self.components = components
+        self.multiplier = multiplier
+        self.total_score = total_score
+
+    def __len__(self):
+        return len(self.folios)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Return every column keyed by name, ready for ``pandas.DataFrame``"""
+        columns = {'folio_hospitalizacion': self.folios}
+        columns.update(self.components)
+        columns['multiplier'] = self.multiplier
+        columns['total_score'] = self.total_score
+        return columns
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """Return a single form's scores as plain Python values"""
+        return {name: column[index].item() if hasattr(column[index], 'item') else column[index]
+                for name, column in self.columns().items()}
+
+
+def calculate_batch_risk(source, reference_date: Optional[date] = None,
+                         calculator=AdvancedRiskCalculator) -> BatchRiskResult:
+    """
+    Score many PreSurgeryForms in one vectorized pass.
+
+    ``source`` may be a PreSurgeryForm queryset, an iterable of ``values()`` dicts
+    or an iterable of model instances. Results match
+    ``calculator.calculate_comprehensive_risk`` form by form.
+    """
+    if reference_date is None:
+        reference_date = timezone.now().date()
+
+    columns = _load_columns(source)
+    size = len(columns['folio_hospitalizacion'])
+
+    components = {
+        'airway_anatomy': _airway_anatomy_scores(calculator, columns),
+        'patient_factors': _patient_factor_scores(calculator, columns, reference_date),
+        'medical_history': _medical_history_scores(calculator, columns),
+        'physiological': _physiological_scores(columns),
+        'procedure_factors': _procedure_scores(columns, reference_date),
+    }
+
+    # Same left-to-right summation as the per-form path so results are bit-identical
+    weights = calculator.RISK_WEIGHTS
+    total = np.zeros(size)
+    for name in COMPONENTS:
+        total = total + components[name] * weights[name]
+
+    multiplier = _interaction_multiplier(columns)
+    final_score = np.minimum(total * multiplier, 100.0)
+
+    return BatchRiskResult(
+        folios=np.array(columns['folio_hospitalizacion'], dtype=object),
+        components=components,
+        multiplier=multiplier,
+        total_score=final_score,
+    )
+
+
+def alert_levels(scores: np.ndarray, calculator=AdvancedRiskCalculator) -> np.ndarray:
+    """Vectorized ``calculator._determine_alert_level``"""
+    thresholds = calculator.ALERT_THRESHOLDS
+    return np.select([scores >= threshold for threshold, _level in thresholds],
+                     [level for _threshold, level in thresholds], default='LOW')
+
+
+def _load_columns(source) -> Dict[str, List[Any]]:
+    """Read RISK_FIELDS from a queryset, values() or values_list() rows or instances into column lists"""
+    if hasattr(source, 'values_list'):
+        rows = list(source.values_list(*RISK_FIELDS).iterator(chunk_size=2000))
+    else:
+        items = list(source)
+        if items and isinstance(items[0], tuple):
+            # values_list(*RISK_FIELDS) rows
+            rows = items
+        elif items and isinstance(items[0], dict):
+            try:
+                rows = list(map(itemgetter(*RISK_FIELDS), items))
+            except KeyError:
+                rows = [tuple(item.get(field) for field in RISK_FIELDS) for item in items]
+        else:
+            rows = list(map(attrgetter(*RISK_FIELDS), items))
+
+    if not rows:
+        return {field: [] for field in RISK_FIELDS}
+    return dict(zip(RISK_FIELDS, (list(column) for column in zip(*rows))))
+
+
+def _numeric(values: Iterable[Any]) -> np.ndarray:
+    """Float column with NaN for missing values (NaN fails every comparison)"""
+    return np.array(list(values), dtype=float)
+
+
+def _flag(values: Iterable[Any]) -> np.ndarray:
+    """Boolean column following Python truthiness"""
+    return np.array([bool(value) for value in values], dtype=bool)
+
+
+def _lookup(values: np.ndarray, table: Dict[int, Dict[str, Any]], default: float) -> np.ndarray:
+    """Map coded values through a score table, falling back to ``default``"""
+    scores = np.full(len(values), default, dtype=float)
+    for code, data in table.items():
+        scores[values == code] = data['score']
+    return scores
+
+
+def _keyword_flags(texts: Iterable[Optional[str]], groups) -> List[np.ndarray]:
+    """
+    Flag texts mentioning each calculator group (see KeywordMatcher). Each
+    distinct text is scanned once, since clinical free text repeats heavily.
+    """
+    matcher = risk_group_matcher(tuple(groups))
+    seen = {}
+    flags = []
+    for text in texts:
+        hits = seen.get(text)
+        if hits is None:
+            hits = seen[text] = matcher.flags(text)
+        flags.append(hits)
+
+    if not flags:
+        return [np.zeros(0, dtype=bool) for _group in matcher.groups]
+    return list(np.array(flags, dtype=bool).T)
+
+
+def _airway_anatomy_scores(calculator, columns) -> np.ndarray:
+    mallampati = _numeric(columns['mallampati'])
+    patil = _numeric(columns['patil_aldrete'])
+    inter_incisal = _numeric(columns['distancia_inter_incisiva'])
+    thyromental = _numeric(columns['distancia_tiro_mentoniana'])
+    protrusion = _numeric(columns['protrusion_mandibular'])
+    deviation = _numeric(columns['desviacion_traquea'])
+
+    score = _lookup(mallampati, calculator.MALLAMPATI_SCORES, calculator.MALLAMPATI_SCORES[1]['score'])
+    score += np.where(patil >= 3, 20, np.where(patil == 2, 10, 0))
+    has_inter_incisal = inter_incisal != 0
+    score += np.where(has_inter_incisal & (inter_incisal < 3), 15,
+                      np.where(has_inter_incisal & (inter_incisal < 3.5), 8, 0))
+    score += np.where((thyromental != 0) & (thyromental < 6), 12, 0)
+    score += np.where(protrusion >= 3, 10, 0)
+    score += np.where(deviation > 0, 8, 0)
+    return np.minimum(score, 100)
+
+
+def _patient_factor_scores(calculator, columns, reference_date) -> np.ndarray:
+    asa = _numeric(columns['estado_fisico_asa'])
+    bmi = _numeric(columns['imc'])
+
+    score = _lookup(asa, calculator.ASA_SCORES, calculator.ASA_SCORES[1]['score'])
+
+    # BMI categories are half-open ranges; anything outside them scores as 'normal'
+    bmi_score = np.zeros(len(bmi))
+    for data in calculator.BMI_CATEGORIES.values():
+        low, high = data['range']
+        bmi_score[(bmi >= low) & (bmi < high)] = data['score']
+    score += np.where((bmi != 0) & ~np.isnan(bmi), bmi_score, 0)
+
+    birth_dates = columns['fecha_nacimiento']
+    has_birth = np.array([bool(value) for value in birth_dates], dtype=bool)
+    birth_year = np.array([value.year if value else 0 for value in birth_dates], dtype=int)
+    birth_md = np.array([value.month * 100 + value.day if value else 0 for value in birth_dates], dtype=int)
+    reference_md = reference_date.month * 100 + reference_date.day
+    age = reference_date.year - birth_year - (reference_md < birth_md)
+    score += np.where(has_birth & (age >= 80), 15,
+                      np.where(has_birth & (age >= 70), 10,
+                               np.where(has_birth & (age <= 2), 12, 0)))
+    return np.minimum(score, 100)
+
+
+def _medical_history_scores(calculator, columns) -> np.ndarray:
+    score = np.where(_flag(columns['antecedentes_dificultad']), 40.0, 0.0)
+
+    comorbidity_flags = _keyword_flags(columns['comorbilidades'], calculator.COMORBIDITY_GROUPS)
+    for flags, (_label, _keywords, points) in zip(comorbidity_flags, calculator.COMORBIDITY_GROUPS):
+        score += np.where(flags, points, 0)
+
+    medication_flags = _keyword_flags(columns['medicamentos'], calculator.MEDICATION_GROUPS)
+    for flags, (_label, _keywords, points) in zip(medication_flags, calculator.MEDICATION_GROUPS):
+        score += np.where(flags, points, 0)
+
+    score += np.where(_flag(columns['tabaquismo']), 8, 0)
+    _label, _keywords, points = calculator.ALLERGY_GROUP
+    allergy_flags, = _keyword_flags(columns['alergias'], (calculator.ALLERGY_GROUP,))
+    score += np.where(allergy_flags, points, 0)
+    return np.minimum(score, 100)
+
+
+def _physiological_scores(columns) -> np.ndarray:
+    glasgow = _numeric(columns['glasgow'])
+    spo2 = _numeric(columns['spo2_aire'])
+    heart_rate = _numeric(columns['fc'])
+
+    has_glasgow = glasgow != 0
+    score = np.where(has_glasgow & (glasgow <= 8), 20.0,
+                     np.where(has_glasgow & (glasgow <= 12), 10.0, 0.0))
+    has_spo2 = spo2 != 0
+    score += np.where(has_spo2 & (spo2 < 90), 15, np.where(has_spo2 & (spo2 < 95), 8, 0))
+    has_heart_rate = heart_rate != 0
+    score += np.where(heart_rate > 120, 5, np.where(has_heart_rate & (heart_rate < 50), 8, 0))
+    score += np.where(_flag(columns['estridor_laringeo']), 25, 0)
+    score += np.where(_flag(columns['problemas_deglucion']), 12, 0)
+    return np.minimum(score, 100)
+
+
+def _procedure_scores(columns, reference_date) -> np.ndarray:
+    report_dates = columns['fecha_reporte']
+    urgent = np.array([value == reference_date for value in report_dates], dtype=bool)
+    fasting = _numeric(columns['ayuno_hrs'])
+    gastric_ml = _numeric(columns['usg_gastrico_ml'])
+    uses_usg = _flag(columns['uso_usg_gastrico'])
+
+    score = np.where(urgent, 10.0, 0.0)
+    # The per-form "< 2 hours" branch sits behind "< 6 hours" and never fires
+    score += np.where(fasting < 6, 15, 0)
+    score += np.where(_flag(columns['uso_glp1']), 12, 0)
+    score += np.where(uses_usg & (gastric_ml > 100), 20,
+                      np.where(uses_usg & (gastric_ml > 50), 10, 0))
+    return np.minimum(score, 100)
+
+
+def _interaction_multiplier(columns) -> np.ndarray:
+    mallampati = _numeric(columns['mallampati'])
+    asa = _numeric(columns['estado_fisico_asa'])
+    bmi = _numeric(columns['imc'])
+    previous_difficulty = _flag(columns['antecedentes_dificultad'])
+
+    high_mallampati = mallampati >= 3
+    high_asa = asa >= 4
+
+    multiplier = np.ones(len(mallampati))
+    multiplier = np.where(high_mallampati & high_asa, multiplier * 1.3, multiplier)
+    multiplier = np.where((bmi >= 35) & previous_difficulty, multiplier * 1.4, multiplier)
+    multiplier = np.where(high_mallampati & high_asa & previous_difficulty, multiplier * 1.2, multiplier)
+    return np.minimum(multiplier, 2.0)
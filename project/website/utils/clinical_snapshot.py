@@ -0,0 +1,261 @@
+# website/utils/clinical_snapshot.py - Columnar (Parquet / Arrow IPC) snapshots of the clinical dataset
+
+import json
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from ..models import PostDuringSurgeryForm, PreSurgeryForm, SnapshotTombstone
+
+
+CHUNK_SIZE = 5000
+
+FORMAT_EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+# Written next to the part files of an incremental snapshot directory
+STATE_FILE = '_snapshot_state.json'
+
+
+def snapshot_lag():
+    """
+    Age a change must reach before it is exported. A transaction stamps
+    updated_at before it commits, so a row saved just before a run can
+    become visible only after it, with a timestamp below the mark.
+    """
+    return timedelta(seconds=getattr(settings, 'CLINICAL_SNAPSHOT_LAG_SECONDS', 60))
+
+
+def _form_columns(model, column_prefix='', path_prefix=''):
+    return [
+        (f'{column_prefix}{field.name}', f'{path_prefix}{field.name}')
+        for field in model._meta.concrete_fields
+        if not field.is_relation and not isinstance(field, models.FileField)
+    ]
+
+
+# (column, queryset path): one row per pre-surgery form, joined with its patient
+# and its optional post-surgery form. The risk columns come with the form.
+SNAPSHOT_COLUMNS = [
+    ('patient_id', 'patient__id_paciente'),
+    ('patient_folio', 'patient__folio_hospitalizacion'),
+    ('patient_fecha_registro', 'patient__fecha_registro'),
+    ('patient_activo', 'patient__activo'),
+    ('medico_user_id', 'medico_user'),
+    *_form_columns(PreSurgeryForm),
+    *_form_columns(PostDuringSurgeryForm, 'post_', 'post_surgery_form__'),
+]
+
+# Latest change to any of the joined rows; the incremental high-water mark
+CHANGED_AT = Greatest(
+    'updated_at',
+    # Greatest is NULL when any argument is on SQLite, so missing joins fall back
+    Coalesce('post_surgery_form__updated_at', 'updated_at'),
+    Coalesce('patient__ultima_actualizacion', 'updated_at'),
+)
+
+
+def _field(path):
+    model, parts = PreSurgeryForm, path.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    return model._meta.get_field(parts[-1])
+
+
+def arrow_type(field):
+    """Arrow type for the values of a model field"""
+    import pyarrow as pa
+
+    if field.is_relation:
+        return arrow_type(field.target_field)
+    internal_type = field.get_internal_type()
+    if internal_type in ('CharField', 'TextField', 'UUIDField', 'JSONField'):
+        return pa.string()
+    if internal_type == 'DateField':
+        return pa.date32()
+    if internal_type == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC')
+    if internal_type == 'FloatField':
+        return pa.float64()
+    if internal_type == 'BooleanField':
+        return pa.bool_()
+    if internal_type.endswith(('IntegerField', 'AutoField')):
+        return pa.int64()
+    raise ValueError(f"No Arrow type for {internal_type}")
+
+
+def _to_arrow(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def snapshot_schema():
+    import pyarrow as pa
+
+    # deleted marks tombstones: rows of forms deleted since an earlier part
+    return pa.schema(
+        [(column, arrow_type(_field(path))) for column, path in SNAPSHOT_COLUMNS]
+        + [('changed_at', pa.timestamp('us', tz='UTC')), ('deleted', pa.bool_())]
+    )
+
+
+def snapshot_queryset(medico=None, since=None, until=None):
+    """
+    Forms to snapshot, oldest change first; ``since`` and ``until`` keep only
+    rows changed after and up to them
+    """
+    forms = PreSurgeryForm.objects.annotate(changed_at=CHANGED_AT)
+    if medico is not None:
+        forms = forms.filter(medico_user=medico)
+    if since is not None:
+        forms = forms.filter(changed_at__gt=since)
+    if until is not None:
+        forms = forms.filter(changed_at__lte=until)
+    return forms.order_by('changed_at', 'pk')
+
+
+def write_snapshot(output, forms, snapshot_format='parquet', chunk_size=CHUNK_SIZE, tombstones=()):
+    """
+    Write ``forms`` (from snapshot_queryset) to ``output`` as Parquet or an Arrow
+    IPC file, one record batch per chunk, followed by a tombstone row for each
+    ``(folio_hospitalizacion, deleted_at)`` in ``tombstones``. Returns the
+    number of form rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = snapshot_schema()
+    paths = [path for _column, path in SNAPSHOT_COLUMNS] + ['changed_at']
+    folio = [column for column, _path in SNAPSHOT_COLUMNS].index('folio_hospitalizacion')
+
+    def record_batch(rows, deleted=False):
+        columns = [
+            pa.array([_to_arrow(value) for value in column], type=field.type)
+            for column, field in zip(zip(*rows), schema)
+        ]
+        return pa.RecordBatch.from_arrays([*columns, pa.array([deleted] * len(rows))], schema=schema)
+
+    def tombstone(folio_hospitalizacion, deleted_at):
+        row = [None] * len(paths)
+        row[folio], row[-1] = folio_hospitalizacion, deleted_at
+        return row
+
+    if snapshot_format == 'parquet':
+        writer = pq.ParquetWriter(output, schema)
+    elif snapshot_format == 'arrow':
+        writer = pa.ipc.new_file(output, schema)
+    else:
+        raise ValueError(f"Formato de snapshot no soportado: {snapshot_format}")
+
+    count, rows = 0, []
+    with writer:
+        for row in forms.values_list(*paths).iterator(chunk_size=chunk_size):
+            rows.append(row)
+            if len(rows) == chunk_size:
+                writer.write_batch(record_batch(rows))
+                count, rows = count + len(rows), []
+        if rows:
+            writer.write_batch(record_batch(rows))
+            count += len(rows)
+        tombstones = [tombstone(*deletion) for deletion in tombstones]
+        if tombstones:
+            writer.write_batch(record_batch(tombstones, deleted=True))
+    return count
+
+
+@dataclass
+class SnapshotRun:
+    rows: int
+    deleted: int
+    part: str | None
+    high_water_mark: datetime | None
+    rebuilt: bool
+
+
+def read_state(directory):
+    try:
+        with open(os.path.join(directory, STATE_FILE)) as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_state(directory, state):
+    path = os.path.join(directory, STATE_FILE)
+    with open(f'{path}.tmp', 'w') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def snapshot_tombstones(since=None, until=None):
+    """
+    ``(folio_hospitalizacion, deleted_at)`` of the forms deleted after ``since``
+    and up to ``until``, skipping folios that have since been created again
+    (their new row is exported after the deletion)
+    """
+    tombstones = SnapshotTombstone.objects.exclude(
+        folio_hospitalizacion__in=PreSurgeryForm.objects.values('pk')
+    )
+    if since is not None:
+        tombstones = tombstones.filter(deleted_at__gt=since)
+    if until is not None:
+        tombstones = tombstones.filter(deleted_at__lte=until)
+    return tombstones.order_by('deleted_at', 'pk').values_list('folio_hospitalizacion', 'deleted_at')
+
+
+def update_snapshot_directory(directory, snapshot_format='parquet', full=False, chunk_size=CHUNK_SIZE, now=None):
+    """
+    Append the rows changed since the last run as a new part file, up to
+    snapshot_lag() ago; the end of that window is the next run's high-water
+    mark. A row changed again later reappears in a later part, and a form
+    deleted in the window reappears as a tombstone (``deleted`` set, other
+    columns empty), so readers keep the last occurrence of each
+    folio_hospitalizacion and drop it when that is a tombstone. A full run
+    (or a change of format or columns) deletes the previous parts and starts
+    over.
+    """
+    os.makedirs(directory, exist_ok=True)
+    columns = [column for column, _path in SNAPSHOT_COLUMNS] + ['changed_at', 'deleted']
+    state = read_state(directory)
+    rebuilt = full or state is None or state['format'] != snapshot_format or state['columns'] != columns
+
+    if rebuilt:
+        for part in (state or {}).get('parts', []):
+            try:
+                os.remove(os.path.join(directory, part))
+            except FileNotFoundError:
+                pass
+        state = {'format': snapshot_format, 'columns': columns, 'high_water_mark': None, 'parts': []}
+
+    now = now or timezone.now()
+    since = datetime.fromisoformat(state['high_water_mark']) if state['high_water_mark'] else None
+    until = now - snapshot_lag()
+    # A rebuilt snapshot has no earlier rows to delete
+    deleted = list(snapshot_tombstones(since, until)) if since is not None else []
+    part = f"part-{now:%Y%m%dT%H%M%S%f}.{FORMAT_EXTENSIONS[snapshot_format]}"
+    path = os.path.join(directory, part)
+
+    with open(f'{path}.tmp', 'wb') as output:
+        rows = write_snapshot(
+            output, snapshot_queryset(since=since, until=until), snapshot_format, chunk_size, tombstones=deleted
+        )
+    if rows or deleted:
+        os.replace(f'{path}.tmp', path)
+        state['parts'].append(part)
+    else:
+        os.remove(f'{path}.tmp')
+        part = None
+    if since is None or until > since:
+        state['high_water_mark'] = until.isoformat()
+    # Written by earlier versions, which diffed every folio to find deletions
+    state.pop('folios', None)
+    _write_state(directory, state)
+    return SnapshotRun(rows, len(deleted), part, datetime.fromisoformat(state['high_water_mark']), rebuilt)
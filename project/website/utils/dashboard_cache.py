@@ -0,0 +1,125 @@
+# website/utils/dashboard_cache.py - Versioned cache for the dashboard JSON endpoints
+
+import hashlib
+
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import DashboardVersion
+from .risk_models import get_risk_model
+
+
+# Alias in settings.CACHES
+CACHE_ALIAS = 'dashboard'
+
+# Namespaces with hit/miss counters
+NAMESPACES = ('stats', 'alerts')
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _counter_key(namespace, outcome):
+    return f'dashboard:{outcome}:{namespace}'
+
+
+def _increment(cache, key):
+    # add() is a no-op when the key exists, so concurrent first writers do not reset it
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def data_version(medico_id):
+    """
+    Current data version of a doctor. Read through the router, so under an
+    analytics view it is the version the replica's data is at.
+    """
+    version = DashboardVersion.objects.filter(pk=medico_id).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_data_version(*medico_ids):
+    """
+    Invalidate every cached response of the given doctors. The bump is part of
+    the surrounding transaction: other workers see the new version together
+    with the data that caused it, and not at all if it rolls back.
+    """
+    medico_ids = {medico_id for medico_id in medico_ids if medico_id is not None}
+    if not medico_ids:
+        return
+    DashboardVersion.objects.bulk_create(
+        [DashboardVersion(medico_id=medico_id) for medico_id in medico_ids], ignore_conflicts=True
+    )
+    DashboardVersion.objects.filter(pk__in=medico_ids).update(version=F('version') + 1)
+
+
+# Name used by the signal handlers and the DoctorStats rollup
+invalidate_doctors = bump_data_version
+
+
+def _request_version(user):
+    # Read once per request (request.user is loaded per request), so the ETag
+    # and the cache key of a response always agree
+    if not hasattr(user, '_dashboard_data_version'):
+        user._dashboard_data_version = data_version(user.pk)
+    return user._dashboard_data_version
+
+
+def _payload_key(namespace, user, params):
+    return ':'.join(str(part) for part in (
+        'dashboard', namespace, user.pk, _request_version(user),
+        # Windows are relative to today and scores to the active risk model
+        timezone.localdate().isoformat(), get_risk_model().version, *params
+    ))
+
+
+def etag(namespace, user, *params):
+    """
+    Strong validator for a payload: it changes exactly when the cache key does,
+    so a matching If-None-Match can be answered without building anything.
+    It depends only on the database version, never on this process's cache,
+    so every worker gives a client the same answer.
+    """
+    return hashlib.sha256(_payload_key(namespace, user, params).encode()).hexdigest()[:32]
+
+
+def get_or_build(namespace, user, build, *params):
+    """
+    Return the cached payload for (namespace, user, params, data version),
+    calling ``build(user, *params)`` on a miss
+    """
+    cache = _cache()
+    key = _payload_key(namespace, user, params)
+
+    payload = cache.get(key)
+    if payload is not None:
+        _increment(cache, _counter_key(namespace, 'hits'))
+        return payload
+
+    _increment(cache, _counter_key(namespace, 'misses'))
+    payload = build(user, *params)
+    cache.set(key, payload)
+    return payload
+
+
+def cache_stats():
+    """Hit and miss counters per namespace"""
+    cache = _cache()
+    stats = {}
+    for namespace in NAMESPACES:
+        hits = cache.get(_counter_key(namespace, 'hits'), 0)
+        misses = cache.get(_counter_key(namespace, 'misses'), 0)
+        total = hits + misses
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total * 100, 1) if total else 0,
+        }
+    return stats
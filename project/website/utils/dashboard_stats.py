@@ -0,0 +1,270 @@
+# website/utils/dashboard_stats.py - Single-pass aggregations for the dashboard
+
+from datetime import timedelta
+
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from .keyword_matcher import KeywordMatcher
+
+
+# Age buckets as (key, upper age bound), matching `(today - birth).days // 365`
+AGE_BUCKETS = (
+    ('pediatric', 18),     # 0-17
+    ('young_adult', 40),   # 18-39
+    ('middle_age', 65),    # 40-64
+    ('elderly', None),     # 65+
+)
+
+# BMI buckets keep the historical inclusive ranges (values between ranges are not counted)
+BMI_BUCKETS = (
+    ('underweight', Q(imc__lt=18.5)),
+    ('normal', Q(imc__range=(18.5, 24.9))),
+    ('overweight', Q(imc__range=(25, 29.9))),
+    ('obese_class_1', Q(imc__range=(30, 34.9))),
+    ('obese_class_2', Q(imc__range=(35, 39.9))),
+    ('obese_class_3', Q(imc__gte=40)),
+)
+
+RISK_BUCKETS = (
+    ('low', Q(risk_score__lt=40)),
+    ('moderate', Q(risk_score__gte=40, risk_score__lt=60)),
+    ('high', Q(risk_score__gte=60, risk_score__lt=80)),
+    ('critical', Q(risk_score__gte=80)),
+)
+
+ASA_VALUES = range(1, 7)
+MALLAMPATI_VALUES = range(1, 5)
+
+COMPLICATION_KEYWORDS = (
+    'intubación difícil',
+    'broncoaspiración',
+    'hipoxemia',
+    'laringoespasmo',
+    'traumatismo dental',
+    'esofágica',
+    'neumotórax',
+)
+
+# DoctorStats counter column for each complication keyword
+COMPLICATION_FIELDS = {
+    'intubación difícil': 'complication_intubacion_dificil',
+    'broncoaspiración': 'complication_broncoaspiracion',
+    'hipoxemia': 'complication_hipoxemia',
+    'laringoespasmo': 'complication_laringoespasmo',
+    'traumatismo dental': 'complication_traumatismo_dental',
+    'esofágica': 'complication_esofagica',
+    'neumotórax': 'complication_neumotorax',
+}
+
+# Each keyword is its own category; 'intubacion dificil' counts as 'intubación difícil'
+COMPLICATION_MATCHER = KeywordMatcher((keyword, (keyword,)) for keyword in COMPLICATION_KEYWORDS)
+
+HAS_COMPLICATIONS = Q(complicaciones__isnull=False) & ~Q(complicaciones='')
+NO_COMPLICATIONS = Q(complicaciones__isnull=True) | Q(complicaciones='')
+
+
+def _count(condition=None):
+    return Count('pk', filter=condition)
+
+
+def summarize_patients(patients, registered_since=None):
+    """Patient totals and age distribution in a single query"""
+    now = timezone.now()
+    today = now.date()
+
+    aggregates = {
+        'total': _count(),
+        'this_month': _count(Q(fecha_registro__month=now.month, fecha_registro__year=now.year)),
+    }
+    if registered_since is not None:
+        aggregates['registered_since'] = _count(Q(fecha_registro__gte=registered_since))
+
+    # An age below N years means the birth date falls after today - N*365 days
+    lower_cutoff = None
+    for key, max_age in AGE_BUCKETS:
+        condition = Q()
+        if max_age is not None:
+            condition &= Q(fecha_nacimiento__gt=today - timedelta(days=max_age * 365))
+        if lower_cutoff is not None:
+            condition &= Q(fecha_nacimiento__lte=lower_cutoff)
+        aggregates[f'age_{key}'] = _count(condition)
+        if max_age is not None:
+            lower_cutoff = today - timedelta(days=max_age * 365)
+
+    result = patients.aggregate(**aggregates)
+    result['age_distribution'] = {key: result.pop(f'age_{key}') for key, _max_age in AGE_BUCKETS}
+    return result
+
+
+def summarize_presurgery(forms):
+    """Risk, ASA, Mallampati and BMI statistics for pre-surgery forms in a single query"""
+    aggregates = {
+        'total': _count(),
+        'average_risk_score': Avg('risk_score'),
+        'high_mallampati': _count(Q(mallampati__gte=3)),
+        'high_asa': _count(Q(estado_fisico_asa__gte=4)),
+        'bmi_count': Count('imc'),
+        'bmi_average': Avg('imc'),
+        'bmi_high': _count(Q(imc__gte=35)),
+    }
+    aggregates.update({f'risk_{key}': _count(condition) for key, condition in RISK_BUCKETS})
+    aggregates.update({f'bmi_{key}': _count(condition) for key, condition in BMI_BUCKETS})
+    aggregates.update({f'asa_{value}': _count(Q(estado_fisico_asa=value)) for value in ASA_VALUES})
+    aggregates.update({f'mallampati_{value}': _count(Q(mallampati=value)) for value in MALLAMPATI_VALUES})
+
+    return _presurgery_summary(forms.aggregate(**aggregates))
+
+
+def _presurgery_summary(result):
+    risk_distribution = {key: result[f'risk_{key}'] for key, _condition in RISK_BUCKETS}
+    bmi_distribution = {key: result[f'bmi_{key}'] for key, _condition in BMI_BUCKETS}
+    obese = bmi_distribution['obese_class_1'] + bmi_distribution['obese_class_2'] + bmi_distribution['obese_class_3']
+
+    return {
+        'total': result['total'],
+        'average_risk_score': result['average_risk_score'] or 0,
+        'high_mallampati': result['high_mallampati'],
+        'high_asa': result['high_asa'],
+        'risk_distribution': risk_distribution,
+        'asa_distribution': [
+            {'estado_fisico_asa': value, 'count': result[f'asa_{value}']}
+            for value in ASA_VALUES if result[f'asa_{value}']
+        ],
+        'mallampati_distribution': [
+            {'mallampati': value, 'count': result[f'mallampati_{value}']}
+            for value in MALLAMPATI_VALUES if result[f'mallampati_{value}']
+        ],
+        'bmi': {
+            'distribution': bmi_distribution,
+            'average_bmi': round(result['bmi_average'] or 0, 1),
+            'high_bmi_patients': result['bmi_high'] if result['bmi_count'] else 0,
+            'obesity_rate': round(obese / max(result['bmi_count'], 1) * 100, 1) if result['bmi_count'] else 0,
+        },
+    }
+
+
+def summarize_postsurgery(forms, keywords=True):
+    """
+    Complication and intubation outcomes for post-surgery forms in a single query,
+    plus one more for the complication keyword analysis when ``keywords`` is set
+    """
+    result = forms.aggregate(
+        total=_count(),
+        with_complications=_count(HAS_COMPLICATIONS),
+        with_morbidity=_count(Q(morbilidad=True)),
+        with_mortality=_count(Q(mortalidad=True)),
+        successful=_count(NO_COMPLICATIONS & Q(morbilidad=False, mortalidad=False)),
+        first_attempt=_count(Q(numero_intentos=1)),
+        multiple_attempts=_count(Q(numero_intentos__gt=1)),
+        difficult=_count(Q(numero_intentos__gte=3)),
+        average_attempts=Avg('numero_intentos'),
+    )
+    complications_text = []
+    if keywords and result['total']:
+        complications_text = forms.filter(HAS_COMPLICATIONS).values_list('complicaciones', flat=True)
+    return _postsurgery_summary(result, lambda: analyze_complication_keywords(complications_text))
+
+
+def _postsurgery_summary(result, common_complications):
+    total = result['total']
+
+    if total == 0:
+        complications = {
+            'total_surgeries': 0,
+            'with_complications': 0,
+            'with_morbidity': 0,
+            'with_mortality': 0,
+            'complications_percentage': 0,
+            'morbidity_percentage': 0,
+            'mortality_percentage': 0,
+            'common_complications': []
+        }
+        intubation = {
+            'total_attempts': 0,
+            'first_attempt': 0,
+            'multiple_attempts': 0,
+            'success_rate': 0,
+            'average_attempts': 0,
+            'difficult_intubations': 0
+        }
+    else:
+        complications = {
+            'total_surgeries': total,
+            'with_complications': result['with_complications'],
+            'with_morbidity': result['with_morbidity'],
+            'with_mortality': result['with_mortality'],
+            'complications_percentage': round((result['with_complications'] / total) * 100, 1),
+            'morbidity_percentage': round((result['with_morbidity'] / total) * 100, 1),
+            'mortality_percentage': round((result['with_mortality'] / total) * 100, 1),
+            'common_complications': common_complications()
+        }
+        intubation = {
+            'total_attempts': total,
+            'first_attempt': result['first_attempt'],
+            'multiple_attempts': result['multiple_attempts'],
+            'success_rate': round((result['first_attempt'] / total) * 100, 1),
+            'average_attempts': round(result['average_attempts'] or 0, 1),
+            'difficult_intubations': result['difficult']
+        }
+
+    return {
+        'total': total,
+        'successful_outcomes': result['successful'],
+        'multiple_attempts': result['multiple_attempts'],
+        'complications': complications,
+        'intubation': intubation,
+    }
+
+
+def summarize_doctor_stats(rows, fields, month_start=None):
+    """
+    Patient, pre-surgery and post-surgery statistics from DoctorStats rows in a
+    single query, in the same shapes as the summarize_* functions above
+    """
+    # Aliases must not shadow the column names they sum
+    aggregates = {f'sum_{field}': Sum(field, default=0) for field in fields}
+    if month_start is not None:
+        aggregates['patients_this_month'] = Sum('patients', filter=Q(day__gte=month_start), default=0)
+    result = rows.aggregate(**aggregates)
+    totals = {field: result[f'sum_{field}'] for field in fields}
+
+    patients = {'total': totals['patients'], 'this_month': result.get('patients_this_month', 0)}
+
+    presurgery = dict(totals, total=totals['surgeries'])
+    presurgery['average_risk_score'] = totals['risk_total'] / totals['risk_count'] if totals['risk_count'] else 0
+    presurgery['bmi_average'] = totals['bmi_total'] / totals['bmi_count'] if totals['bmi_count'] else 0
+
+    postsurgery = dict(totals, total=totals['completed'])
+    postsurgery['average_attempts'] = (
+        totals['attempts_total'] / totals['attempts_count'] if totals['attempts_count'] else 0
+    )
+    keyword_counts = {keyword: totals[field] for keyword, field in COMPLICATION_FIELDS.items()}
+
+    return {
+        'patients': patients,
+        'presurgery': _presurgery_summary(presurgery),
+        'postsurgery': _postsurgery_summary(postsurgery, lambda: _top_complications(keyword_counts)),
+    }
+
+
+def analyze_complication_keywords(complications_text):
+    """Analyze complications text for common keywords"""
+    keywords = dict.fromkeys(COMPLICATION_KEYWORDS, 0)
+
+    for text in complications_text:
+        for keyword in complication_keywords(text):
+            keywords[keyword] += 1
+
+    return _top_complications(keywords)
+
+
+def complication_keywords(text):
+    """Keywords mentioned in a single complications text, ignoring accents and case"""
+    return COMPLICATION_MATCHER.categories(text)
+
+
+def _top_complications(keywords):
+    # Return top 5 complications
+    sorted_complications = sorted(keywords.items(), key=lambda x: x[1], reverse=True)
+    return [{'complication': k, 'count': v} for k, v in sorted_complications[:5] if v > 0]
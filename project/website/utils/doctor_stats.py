@@ -0,0 +1,178 @@
+# website/utils/doctor_stats.py - Incremental maintenance of the DoctorStats rollup
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import DoctorStats, Patient, PostDuringSurgeryForm, PreSurgeryForm
+from .dashboard_cache import invalidate_doctors
+from .dashboard_stats import COMPLICATION_FIELDS, complication_keywords
+
+
+def patient_contributions(patient):
+    """Rollup contribution of a patient, keyed by registration day"""
+    if patient is None or not patient.activo or not patient.fecha_registro:
+        return []
+    day = timezone.localdate(patient.fecha_registro)
+    return [((patient.medico_id, day), Counter(patients=1))]
+
+
+def case_contributions(presurgery, postsurgery=None):
+    """
+    Rollup contributions of a surgical case (a pre-surgery form and its optional
+    post-surgery form), keyed by the responsible doctor and the report day
+    """
+    if presurgery is None or presurgery.medico_user_id is None:
+        return []
+
+    counters = presurgery_counters(presurgery)
+    if postsurgery is not None:
+        counters.update(postsurgery_counters(postsurgery))
+    return [((presurgery.medico_user_id, presurgery.fecha_reporte), counters)]
+
+
+def presurgery_counters(form):
+    """Counter values of a single pre-surgery form (mirrors summarize_presurgery)"""
+    counters = Counter(surgeries=1)
+
+    if form.risk_score is not None:
+        counters['risk_count'] += 1
+        counters['risk_total'] += form.risk_score
+        if form.risk_score < 40:
+            counters['risk_low'] += 1
+        elif form.risk_score < 60:
+            counters['risk_moderate'] += 1
+        elif form.risk_score < 80:
+            counters['risk_high'] += 1
+        else:
+            counters['risk_critical'] += 1
+
+    if form.mallampati is not None:
+        counters[f'mallampati_{form.mallampati}'] += 1
+        if form.mallampati >= 3:
+            counters['high_mallampati'] += 1
+    if form.estado_fisico_asa is not None:
+        counters[f'asa_{form.estado_fisico_asa}'] += 1
+        if form.estado_fisico_asa >= 4:
+            counters['high_asa'] += 1
+
+    imc = form.imc
+    if imc is not None:
+        counters['bmi_count'] += 1
+        counters['bmi_total'] += imc
+        if imc >= 35:
+            counters['bmi_high'] += 1
+        # Same inclusive ranges as BMI_BUCKETS; values between ranges are not counted
+        if imc < 18.5:
+            counters['bmi_underweight'] += 1
+        elif 18.5 <= imc <= 24.9:
+            counters['bmi_normal'] += 1
+        elif 25 <= imc <= 29.9:
+            counters['bmi_overweight'] += 1
+        elif 30 <= imc <= 34.9:
+            counters['bmi_obese_class_1'] += 1
+        elif 35 <= imc <= 39.9:
+            counters['bmi_obese_class_2'] += 1
+        elif imc >= 40:
+            counters['bmi_obese_class_3'] += 1
+    return counters
+
+
+def postsurgery_counters(form):
+    """Counter values of a single post-surgery form (mirrors summarize_postsurgery)"""
+    counters = Counter(completed=1)
+
+    has_complications = bool(form.complicaciones)
+    if has_complications:
+        counters['with_complications'] += 1
+        for keyword in complication_keywords(form.complicaciones):
+            counters[COMPLICATION_FIELDS[keyword]] += 1
+    if form.morbilidad:
+        counters['with_morbidity'] += 1
+    if form.mortalidad:
+        counters['with_mortality'] += 1
+    if not has_complications and not form.morbilidad and not form.mortalidad:
+        counters['successful'] += 1
+
+    attempts = form.numero_intentos
+    if attempts is not None:
+        counters['attempts_count'] += 1
+        counters['attempts_total'] += attempts
+        if attempts == 1:
+            counters['first_attempt'] += 1
+        if attempts > 1:
+            counters['multiple_attempts'] += 1
+        if attempts >= 3:
+            counters['difficult'] += 1
+    return counters
+
+
+def apply_contributions(before, after):
+    """
+    Move the rollup from the ``before`` contributions to the ``after`` ones,
+    touching only the keys and counters that changed
+    """
+    deltas = defaultdict(Counter)
+    for key, counters in before:
+        deltas[key].subtract(counters)
+    for key, counters in after:
+        deltas[key].update(counters)
+
+    for (medico_id, day), counters in deltas.items():
+        changes = {field: value for field, value in counters.items() if value}
+        if medico_id is None or day is None or not changes:
+            continue
+        with transaction.atomic():
+            stats, _created = DoctorStats.objects.get_or_create(medico_id=medico_id, day=day)
+            DoctorStats.objects.filter(pk=stats.pk).update(
+                **{field: F(field) + value for field, value in changes.items()}
+            )
+
+
+def expected_doctor_stats(medico_ids=None):
+    """Rebuild the rollup counters from source tables: {(medico_id, day): Counter}"""
+    patients = Patient.objects.filter(activo=True)
+    presurgery = PreSurgeryForm.objects.filter(medico_user__isnull=False)
+    postsurgery = PostDuringSurgeryForm.objects.all()
+    if medico_ids is not None:
+        patients = patients.filter(medico_id__in=medico_ids)
+        presurgery = presurgery.filter(medico_user_id__in=medico_ids)
+        postsurgery = postsurgery.filter(folio_hospitalizacion__medico_user_id__in=medico_ids)
+
+    expected = defaultdict(Counter)
+    for patient in patients.iterator():
+        for key, counters in patient_contributions(patient):
+            expected[key].update(counters)
+
+    postsurgery = {form.pk: form for form in postsurgery.iterator()}
+    for form in presurgery.iterator():
+        for key, counters in case_contributions(form, postsurgery.get(form.pk)):
+            expected[key].update(counters)
+    return expected
+
+
+def rebuild_doctor_stats(medico_ids=None):
+    """Replace the rollup rows (all, or only the given doctors') with freshly computed ones"""
+    expected = expected_doctor_stats(medico_ids)
+    rows = DoctorStats.objects.all()
+    if medico_ids is not None:
+        rows = rows.filter(medico_id__in=medico_ids)
+
+    stale_ids = set(rows.values_list('medico_id', flat=True))
+    with transaction.atomic():
+        rows.delete()
+        DoctorStats.objects.bulk_create([
+            DoctorStats(medico_id=medico_id, day=day, **counters)
+            for (medico_id, day), counters in expected.items()
+        ], batch_size=500)
+    invalidate_doctors(*stale_ids, *(medico_id for medico_id, _day in expected))
+    return expected
+
+
+def doctors_for_presurgery(folios):
+    """Doctor ids responsible for the given pre-surgery folios"""
+    return set(PreSurgeryForm.objects.filter(
+        folio_hospitalizacion__in=folios, medico_user__isnull=False
+    ).values_list('medico_user_id', flat=True))
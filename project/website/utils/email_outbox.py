@@ -0,0 +1,178 @@
+# website/utils/email_outbox.py - Email outbox: enqueue from requests, deliver in batches with retries
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from smtplib import SMTPConnectError, SMTPException, SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import OutboxEmail
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+
+# A batch left in 'sending' by a worker that died is picked up again after this
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+
+def max_attempts():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    """Wait before attempt ``attempts + 1``: doubles after every failure, capped at an hour"""
+    base = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60))
+    return min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def dedupe_key(subject, body, from_email, recipients):
+    message = json.dumps([subject, body, from_email, sorted(recipients)], ensure_ascii=False)
+    return hashlib.sha256(message.encode()).hexdigest()
+
+
+def enqueue_email(subject, body, recipients, from_email=None, reply_to=None):
+    """
+    Queue an email for the outbox worker. Returns ``(email, created)``; an
+    identical message (a resubmitted form, a double click) is only queued once
+    while the first copy is waiting or being sent. Once it has been sent or
+    has failed, the same message is queued again.
+    """
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL or ''
+    key = dedupe_key(subject, body, from_email, recipients)
+    active = OutboxEmail.objects.filter(dedupe_key=key, status__in=OutboxEmail.ACTIVE_STATUSES)
+
+    email = active.first()
+    if email is not None:
+        return email, False
+    try:
+        with transaction.atomic():
+            email = OutboxEmail.objects.create(
+                dedupe_key=key, subject=subject, body=body, from_email=from_email,
+                recipients=list(recipients), reply_to=list(reply_to or []),
+            )
+    except IntegrityError:
+        # A concurrent identical request queued it first
+        return active.get(), False
+    return email, True
+
+
+def _due(now):
+    return OutboxEmail.objects.filter(
+        status__in=[OutboxEmail.STATUS_PENDING, OutboxEmail.STATUS_SENDING], next_attempt_at__lte=now
+    )
+
+
+def claim_batch(batch_size=BATCH_SIZE, now=None):
+    """Mark up to ``batch_size`` due emails as sending and return them"""
+    now = now or timezone.now()
+    ids = list(_due(now).order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # Rows claimed by a concurrent worker in the meantime no longer match _due
+    lease = now + CLAIM_TIMEOUT
+    _due(now).filter(pk__in=ids).update(status=OutboxEmail.STATUS_SENDING, next_attempt_at=lease)
+    return list(OutboxEmail.objects.filter(
+        pk__in=ids, status=OutboxEmail.STATUS_SENDING, next_attempt_at=lease
+    ).order_by('next_attempt_at', 'pk'))
+
+
+def _message(email, connection):
+    return EmailMessage(
+        email.subject, email.body, email.from_email or None, email.recipients,
+        reply_to=email.reply_to or None, connection=connection
+    )
+
+
+def _failed(email, error, now):
+    attempts = email.attempts + 1
+    if attempts >= max_attempts():
+        logger.error("Giving up on outbox email %s after %s attempts: %s", email.pk, attempts, error)
+        status, next_attempt_at = OutboxEmail.STATUS_FAILED, now
+    else:
+        logger.warning("Outbox email %s failed (attempt %s), retrying: %s", email.pk, attempts, error)
+        status, next_attempt_at = OutboxEmail.STATUS_PENDING, now + retry_delay(attempts)
+    OutboxEmail.objects.filter(pk=email.pk).update(
+        status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=str(error)
+    )
+    return status
+
+
+def _connection_failed(error):
+    """Whether a send failed because of the connection rather than the message"""
+    if isinstance(error, (SMTPServerDisconnected, SMTPConnectError)):
+        return True
+    # SMTPException subclasses OSError; other OSErrors are socket errors
+    return isinstance(error, OSError) and not isinstance(error, SMTPException)
+
+
+def _deferred(emails, error, now):
+    """Put emails back in the queue after a connection failure, without charging them an attempt"""
+    logger.warning("Mail server unavailable, %s outbox emails deferred: %s", len(emails), error)
+    return OutboxEmail.objects.filter(
+        pk__in=[email.pk for email in emails], status=OutboxEmail.STATUS_SENDING
+    ).update(status=OutboxEmail.STATUS_PENDING, next_attempt_at=now + retry_delay(1), last_error=str(error))
+
+
+@dataclass
+class OutboxRun:
+    sent: int = 0
+    retrying: int = 0
+    failed: int = 0
+
+
+def send_pending_emails(batch_size=BATCH_SIZE, now=None):
+    """
+    Deliver one batch of due emails over a single connection. A failed email is
+    retried later with exponential backoff, and given up on after
+    settings.EMAIL_OUTBOX_MAX_ATTEMPTS attempts. When the connection itself
+    fails, the emails not sent yet are retried after the base delay without
+    counting an attempt, so an outage does not use up the whole queue's retries.
+    """
+    now = now or timezone.now()
+    run = OutboxRun()
+    emails = claim_batch(batch_size, now)
+    if not emails:
+        return run
+
+    def failed(email, error):
+        if _failed(email, error, now) == OutboxEmail.STATUS_FAILED:
+            run.failed += 1
+        else:
+            run.retrying += 1
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        run.retrying += _deferred(emails, e, now)
+        return run
+
+    try:
+        for index, email in enumerate(emails):
+            # One message per call, so a rejected recipient only fails its own email
+            try:
+                connection.send_messages([_message(email, connection)])
+            except Exception as e:
+                if _connection_failed(e):
+                    run.retrying += _deferred(emails[index:], e, now)
+                    break
+                failed(email, e)
+            else:
+                OutboxEmail.objects.filter(pk=email.pk).update(
+                    status=OutboxEmail.STATUS_SENT, attempts=email.attempts + 1,
+                    sent_at=timezone.now(), last_error=''
+                )
+                run.sent += 1
+    finally:
+        connection.close()
+    return run
@@ -0,0 +1,171 @@
+# website/utils/excel_export.py - Write-only Excel export of the dashboard data
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from ..models import Patient, PostDuringSurgeryForm, PreSurgeryForm
+from .dashboard_stats import ASA_VALUES
+
+
+# Per-case sheet: one row per pre-surgery form, joined with its post-surgery form
+CASE_FIELDS = (
+    'folio_hospitalizacion',
+    'nombres',
+    'apellidos',
+    'fecha_nacimiento',
+    'fecha_reporte',
+    'diagnostico_preoperatorio',
+    'peso',
+    'talla',
+    'imc',
+    'estado_fisico_asa',
+    'mallampati',
+    'patil_aldrete',
+    'antecedentes_dificultad',
+    'risk_score',
+    'risk_level',
+    'post_surgery_form__tecnica_utilizada',
+    'post_surgery_form__tipo_intubacion',
+    'post_surgery_form__numero_intentos',
+    'post_surgery_form__cormack',
+    'post_surgery_form__complicaciones',
+    'post_surgery_form__morbilidad',
+    'post_surgery_form__mortalidad',
+)
+
+CHUNK_SIZE = 2000
+
+HEADER_FONT = Font(bold=True, color="FFFFFF")
+HEADER_FILL = PatternFill(start_color="2B4570", end_color="2B4570", fill_type="solid")
+BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+
+
+def _header(ws, value):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = HEADER_FONT
+    cell.fill = HEADER_FILL
+    cell.border = BORDER
+    return cell
+
+
+def case_field(path):
+    """Model field behind a CASE_FIELDS path"""
+    model = PreSurgeryForm
+    if path.startswith('post_surgery_form__'):
+        model, path = PostDuringSurgeryForm, path.removeprefix('post_surgery_form__')
+    return model._meta.get_field(path)
+
+
+def column_label(path):
+    return str(case_field(path).verbose_name)
+
+
+def _clean(value):
+    # Free text may hold control characters that are not valid in the sheet XML
+    return ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+
+
+def summary_sections(user):
+    """Summary sections of the export as (title, {label: value}), in two queries"""
+    now = timezone.localdate()
+    stats = PreSurgeryForm.objects.filter(medico_user=user).aggregate(
+        this_month=Count('pk', filter=Q(fecha_reporte__year=now.year, fecha_reporte__month=now.month)),
+        high_asa=Count('pk', filter=Q(estado_fisico_asa__gte=4)),
+        difficult_airway=Count('pk', filter=Q(mallampati__gte=3) | Q(patil_aldrete__gte=3)),
+        mallampati_average=Avg('mallampati'),
+        surgeries=Count('post_surgery_form'),
+        complications=Count('post_surgery_form', filter=Q(
+            post_surgery_form__complicaciones__isnull=False
+        ) & ~Q(post_surgery_form__complicaciones='')),
+        **{f'asa_{value}': Count('pk', filter=Q(estado_fisico_asa=value)) for value in ASA_VALUES}
+    )
+    surgeries = stats['surgeries']
+    mallampati_average = stats['mallampati_average']
+
+    return [
+        ("Información General", {
+            "Total Pacientes": Patient.objects.filter(medico=user, activo=True).count(),
+            "Cirugías Este Mes": stats['this_month'],
+            "Pacientes de Alto Riesgo": stats['high_asa'],
+        }),
+        ("Estadísticas ASA", {
+            value: stats[f'asa_{value}'] for value in ASA_VALUES if stats[f'asa_{value}']
+        }),
+        ("Complicaciones", {
+            "Total Cirugías": surgeries,
+            "Cirugías con Complicaciones": stats['complications'],
+            "Tasa de Complicaciones": f"{stats['complications'] / max(surgeries, 1) * 100:.2f}%",
+        }),
+        ("Métricas de Vía Aérea", {
+            "Vía Aérea Difícil": stats['difficult_airway'],
+            "Mallampati Promedio": round(mallampati_average, 2) if mallampati_average is not None else None,
+        }),
+    ]
+
+
+def case_queryset(user):
+    return PreSurgeryForm.objects.filter(medico_user=user).order_by('fecha_reporte', 'pk')
+
+
+def case_rows(user, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Per-case rows, fetched from the database in chunks. ``progress`` is called
+    with the number of rows produced so far after every chunk.
+    """
+    produced = 0
+    for row in case_queryset(user).values_list(*CASE_FIELDS).iterator(chunk_size=chunk_size):
+        yield [_clean(value) for value in row]
+        produced += 1
+        if progress is not None and produced % chunk_size == 0:
+            progress(produced)
+    if progress is not None:
+        progress(produced)
+
+
+def write_dashboard_workbook(user, output, include_cases=False, chunk_size=CHUNK_SIZE, progress=None,
+                             heartbeat=None):
+    """
+    Write the dashboard export to ``output`` (a path or binary file). The workbook
+    is write-only: rows are flushed to disk as they are appended, so memory does
+    not grow with the number of cases. ``heartbeat``, when given, is called
+    around the steps that report no progress: the summary and the final save.
+    """
+    heartbeat = heartbeat or (lambda: None)
+    wb = Workbook(write_only=True)
+
+    ws = wb.create_sheet("Dashboard Export")
+    ws.column_dimensions['A'].width = 35
+    ws.column_dimensions['B'].width = 20
+    ws.column_dimensions['C'].width = 20
+
+    heartbeat()
+    ws.append([_header(ws, "Resumen de Pacientes")])
+    ws.append(["Fecha de Exportación", timezone.localtime().strftime("%Y-%m-%d %H:%M")])
+    ws.append([])
+    for section_title, data in summary_sections(user):
+        ws.append([_header(ws, section_title)])
+        for key, value in data.items():
+            ws.append([key, value])
+        ws.append([])
+
+    if include_cases:
+        cases = wb.create_sheet("Casos")
+        for column in range(1, len(CASE_FIELDS) + 1):
+            cases.column_dimensions[get_column_letter(column)].width = 18
+        cases.append([_header(cases, column_label(path)) for path in CASE_FIELDS])
+        for row in case_rows(user, chunk_size, progress):
+            cases.append(row)
+
+    heartbeat()
+    wb.save(output)
+    heartbeat()
@@ -0,0 +1,282 @@
+# website/utils/export_jobs.py - Background export jobs: dedupe, dispatch, execution and retention
+
+import csv
+import hashlib
+import io
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import ExportJob
+from ..routers import on_primary, reading_from_analytics
+from .clinical_snapshot import arrow_type
+from .excel_export import (
+    CASE_FIELDS, CHUNK_SIZE, case_field, case_queryset, case_rows, column_label, write_dashboard_workbook
+)
+
+
+logger = logging.getLogger(__name__)
+
+# A running job whose worker has not reported progress for this long is taken
+# to have died and is queued again, or failed after MAX_ATTEMPTS claims
+CLAIM_TIMEOUT = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+# Longest a running job goes without refreshing its heartbeat, well inside CLAIM_TIMEOUT
+HEARTBEAT_INTERVAL = CLAIM_TIMEOUT / 3
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_formats():
+    """Formats that can be produced here (Parquet needs pyarrow)"""
+    return [value for value, _label in ExportJob.FORMAT_CHOICES if value != 'parquet' or parquet_available()]
+
+
+def retention():
+    return timedelta(hours=getattr(settings, 'EXPORT_JOB_RETENTION_HOURS', 24))
+
+
+def dedupe_key(user, export_format, include_cases):
+    return hashlib.sha256(f'{user.pk}:{export_format}:{int(include_cases)}'.encode()).hexdigest()
+
+
+def request_export(user, export_format, include_cases=False):
+    """
+    Return ``(job, created)``: the pending or running job of an identical request
+    when there is one, otherwise a new job handed to the configured backend
+    """
+    if export_format not in export_formats():
+        raise ValueError(f"Formato de exportación no disponible: {export_format}")
+    # CSV and Parquet files are the per-case table
+    include_cases = include_cases or export_format != 'xlsx'
+    key = dedupe_key(user, export_format, include_cases)
+    active = ExportJob.objects.filter(dedupe_key=key, status__in=ExportJob.ACTIVE_STATUSES)
+
+    purge_expired_exports()
+    reclaim_abandoned_jobs()
+    job = active.first()
+    if job is not None:
+        return job, False
+    try:
+        with transaction.atomic():
+            job = ExportJob.objects.create(
+                medico=user, format=export_format, include_cases=include_cases, dedupe_key=key
+            )
+    except IntegrityError:
+        # A concurrent identical request created it first
+        return active.get(), False
+
+    enqueue_export_job(job)
+    return job, True
+
+
+def enqueue_export_job(job):
+    """
+    Hand a new job to settings.EXPORT_JOB_BACKEND once it is committed:
+    'worker' leaves it for ``manage.py run_export_jobs``, 'celery' queues a task
+    and 'eager' runs it in the current process (tests, local development)
+    """
+    backend = getattr(settings, 'EXPORT_JOB_BACKEND', 'worker')
+    if backend == 'eager':
+        transaction.on_commit(lambda: run_export_job(job.pk))
+    elif backend == 'celery':
+        from ..tasks import run_export_job_task
+        transaction.on_commit(lambda: run_export_job_task.delay(str(job.pk)))
+
+
+def next_pending_job():
+    """Id of the oldest pending job, or None"""
+    return ExportJob.objects.filter(
+        status=ExportJob.STATUS_PENDING
+    ).order_by('created_at').values_list('pk', flat=True).first()
+
+
+def reclaim_abandoned_jobs(now=None):
+    """
+    Queue running jobs without a heartbeat for CLAIM_TIMEOUT again, or fail
+    them once they have been claimed MAX_ATTEMPTS times. Returns how many
+    jobs were reclaimed.
+    """
+    now = now or timezone.now()
+    abandoned = ExportJob.objects.filter(status=ExportJob.STATUS_RUNNING, heartbeat_at__lt=now - CLAIM_TIMEOUT)
+
+    reclaimed = 0
+    for job in abandoned.only('pk', 'attempts'):
+        # Matches nothing if the worker reported progress in the meantime
+        stale = abandoned.filter(pk=job.pk, attempts=job.attempts)
+        if job.attempts >= MAX_ATTEMPTS:
+            logger.error("Giving up on export job %s after %s attempts", job.pk, job.attempts)
+            reclaimed += stale.update(
+                status=ExportJob.STATUS_FAILED, error='El proceso de exportación se detuvo',
+                finished_at=now, expires_at=now + retention()
+            )
+        elif stale.update(status=ExportJob.STATUS_PENDING, progress=0, processed_rows=0, heartbeat_at=None):
+            logger.warning("Export job %s stopped reporting progress, queued again", job.pk)
+            enqueue_export_job(job)
+            reclaimed += 1
+    return reclaimed
+
+
+def run_export_job(job_id):
+    """
+    Claim a pending job and produce its file. Returns the finished job, or None
+    when the job is not pending (another worker claimed it first).
+    """
+    now = timezone.now()
+    claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_PENDING).update(
+        status=ExportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1
+    )
+    if not claimed:
+        return None
+
+    job = ExportJob.objects.select_related('medico').get(pk=job_id)
+    # Updates by this claim; they match nothing once the job has been reclaimed
+    claim = ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_RUNNING, attempts=job.attempts)
+    try:
+        _produce(job, claim)
+    except Exception as e:
+        logger.exception("Export job %s failed", job.pk)
+        now = timezone.now()
+        claim.update(status=ExportJob.STATUS_FAILED, error=str(e), finished_at=now, expires_at=now + retention())
+    job.refresh_from_db()
+    return job
+
+
+def _produce(job, claim):
+    # The exported data is read from the analytics database; job updates are writes
+    with reading_from_analytics():
+        total = case_queryset(job.medico).count() if job.include_cases else 0
+    beat_at = timezone.now()
+    claim.update(total_rows=total, heartbeat_at=beat_at)
+
+    # Both are called from inside reading_from_analytics(); 100 is reported once the file is stored
+    def progress(processed):
+        nonlocal beat_at
+        beat_at = timezone.now()
+        with on_primary():
+            claim.update(processed_rows=processed, progress=min(processed * 100 // max(total, 1), 99),
+                         heartbeat_at=beat_at)
+
+    def heartbeat():
+        # Cheap to call often: writes only once HEARTBEAT_INTERVAL has passed
+        nonlocal beat_at
+        if timezone.now() - beat_at >= HEARTBEAT_INTERVAL:
+            beat_at = timezone.now()
+            with on_primary():
+                claim.update(heartbeat_at=beat_at)
+
+    with tempfile.TemporaryFile() as output:
+        with reading_from_analytics():
+            WRITERS[job.format](job, output, progress, heartbeat)
+        output.seek(0)
+        prefix = 'dashboard_export' if job.format == 'xlsx' else 'casos'
+        heartbeat()
+        job.file.save(f'{prefix}_{timezone.localdate():%Y%m%d}_{job.pk.hex[:8]}.{job.format}',
+                      File(output), save=False)
+
+    now = timezone.now()
+    finished = claim.update(status=ExportJob.STATUS_DONE, progress=100, file=job.file.name,
+                            finished_at=now, expires_at=now + retention())
+    if not finished:
+        # Reclaimed while this worker was still writing; the new claim produces its own file
+        logger.warning("Export job %s was reclaimed before it finished", job.pk)
+        job.file.delete(save=False)
+
+
+def _write_xlsx(job, output, progress, heartbeat):
+    write_dashboard_workbook(
+        job.medico, output, include_cases=job.include_cases, progress=progress, heartbeat=heartbeat
+    )
+
+
+def _write_csv(job, output, progress, heartbeat):
+    # BOM so spreadsheet applications read the file as UTF-8
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow([column_label(path) for path in CASE_FIELDS])
+    writer.writerows(case_rows(job.medico, progress=progress))
+    text.flush()
+    text.detach()
+    heartbeat()
+
+
+def _write_parquet(job, output, progress, heartbeat):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(path, arrow_type(case_field(path))) for path in CASE_FIELDS])
+
+    def record_batch(rows):
+        columns = zip(*rows)
+        return pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+        )
+
+    # One row group per chunk, so only a chunk of rows is held in memory
+    with pq.ParquetWriter(output, schema) as writer:
+        rows = []
+        for row in case_rows(job.medico, progress=progress):
+            rows.append(row)
+            if len(rows) == CHUNK_SIZE:
+                writer.write_batch(record_batch(rows))
+                rows = []
+        if rows:
+            writer.write_batch(record_batch(rows))
+        heartbeat()
+
+
+WRITERS = {
+    'xlsx': _write_xlsx,
+    'csv': _write_csv,
+    'parquet': _write_parquet,
+}
+
+
+def purge_expired_exports(now=None):
+    """Delete the files of jobs past their retention and mark the jobs expired"""
+    now = now or timezone.now()
+    expired = ExportJob.objects.filter(expires_at__lte=now).exclude(status=ExportJob.STATUS_EXPIRED)
+
+    purged = 0
+    for job in expired.only('pk', 'file'):
+        if job.file:
+            job.file.delete(save=False)
+        ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.STATUS_EXPIRED, file='')
+        purged += 1
+    return purged
+
+
+def export_job_payload(job):
+    """Job state in the shape returned by the export job endpoints"""
+    payload = {
+        'id': str(job.pk),
+        'format': job.format,
+        'include_cases': job.include_cases,
+        'status': job.status,
+        'progress': job.progress,
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'status_url': reverse('export-job-status', args=[job.pk]),
+        'download_url': None,
+    }
+    if job.status == ExportJob.STATUS_DONE:
+        payload['download_url'] = reverse('export-job-download', args=[job.pk])
+    return payload
@@ -0,0 +1,71 @@
+# website/utils/keyword_matcher.py - Accent- and case-insensitive keyword matching for clinical free text
+
+import unicodedata
+from functools import lru_cache
+
+
+# Short texts (structured fields like comorbilidades) repeat across forms, so
+# their results are cached per matcher; long notes rarely do
+CACHED_TEXT_LENGTH = 256
+CACHE_SIZE = 4096
+
+def normalize_text(text):
+    """
+    Casefold and strip accents, so 'Hipertensión' and 'HIPERTENSION' compare
+    equal. Characters without an ASCII base (e.g. '°') are dropped.
+    """
+    text = (text or '').casefold()
+    if text.isascii():
+        return text
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+
+
+class KeywordMatcher:
+    """
+    Keywords grouped by category, normalized once. ``categories(text)`` lists
+    the categories with a keyword in the text, normalizing the text once for
+    every category.
+
+    The keyword sets are small (a few dozen), and for those CPython's
+    substring search beats a multi-pattern automaton written in Python
+    (Aho-Corasick, ~12x slower on a 8 KB note) or a regex alternation (~4x).
+    So each keyword is searched for with ``in``, stopping at the first hit of
+    a category, and results for short texts are cached.
+    """
+
+    def __init__(self, groups):
+        """``groups``: ``(category, keywords)`` pairs, in the order results are reported"""
+        self.groups = tuple(
+            (category, tuple(dict.fromkeys(normalize_text(keyword) for keyword in keywords)))
+            for category, keywords in groups
+        )
+        self._cached_categories = lru_cache(maxsize=CACHE_SIZE)(self._categories)
+
+    def categories(self, text):
+        """Categories with at least one keyword in ``text``, in group order"""
+        if text and len(text) <= CACHED_TEXT_LENGTH:
+            return self._cached_categories(text)
+        return self._categories(text)
+
+    def _categories(self, text):
+        normalized = normalize_text(text)
+        if not normalized:
+            return ()
+        contains = normalized.__contains__
+        return tuple(category for category, keywords in self.groups if any(map(contains, keywords)))
+
+    def flags(self, text):
+        """Per category, whether it matched ``text``"""
+        found = set(self.categories(text))
+        return tuple(category in found for category, _keywords in self.groups)
+
+
+@lru_cache(maxsize=None)
+def keyword_matcher(groups):
+    """Shared matcher for a hashable tuple of ``(category, keywords)`` pairs"""
+    return KeywordMatcher(groups)
+
+
+def risk_group_matcher(groups):
+    """Matcher for risk calculator groups, ``(label, keywords, points)`` triples"""
+    return keyword_matcher(tuple((label, tuple(keywords)) for label, keywords, _points in groups))
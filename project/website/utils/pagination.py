@@ -0,0 +1,98 @@
+# website/utils/pagination.py - Keyset (cursor) pagination for long listings
+
+import base64
+import json
+
+from django.db.models import Q
+
+
+PAGE_SIZE = 20
+
+
+class CursorPage:
+    """
+    One page of a keyset-paginated queryset. Iterates like Django's Page and
+    exposes the opaque cursors of the neighbouring pages.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def encode_cursor(value, pk, reverse=False):
+    position = {'v': value.isoformat(), 'pk': str(pk)}
+    if reverse:
+        position['r'] = 1
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor, model, field):
+    """(value, pk, reverse) of a cursor, or None when it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = model._meta.get_field(field).to_python(position['v'])
+        pk = model._meta.pk.to_python(position['pk'])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    return value, pk, bool(position.get('r'))
+
+
+def paginate_by_cursor(queryset, cursor=None, field='fecha_registro', page_size=PAGE_SIZE):
+    """
+    Page through ``queryset`` newest first on (field, pk). Each page is a range
+    scan starting at the cursor, so its cost does not grow with the page number
+    the way OFFSET does.
+    """
+    position = decode_cursor(cursor, queryset.model, field)
+    reverse = position is not None and position[2]
+
+    if position is not None:
+        value, pk = position[:2]
+        # The inclusive bound comes first so the index on `field` gives the range
+        if reverse:
+            queryset = queryset.filter(Q(**{f'{field}__gte': value}),
+                                       Q(**{f'{field}__gt': value}) | Q(pk__gt=pk))
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__lte': value}),
+                                       Q(**{f'{field}__lt': value}) | Q(pk__lt=pk))
+
+    ordering = (field, 'pk') if reverse else (f'-{field}', '-pk')
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+
+    if not rows:
+        return CursorPage(rows)
+
+    first, last = rows[0], rows[-1]
+    has_next = has_more if not reverse else True
+    has_previous = has_more if reverse else position is not None
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor(getattr(last, field), last.pk) if has_next else None,
+        previous_cursor=encode_cursor(getattr(first, field), first.pk, reverse=True) if has_previous else None,
+    )
@@ -0,0 +1,122 @@
+# website/utils/patient_search.py - Indexed patient search (SQLite FTS5 or prefix columns)
+
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+# FTS5 shadow table of website_patient, kept in sync by the Patient signals
+SEARCH_TABLE = 'website_patient_search'
+
+# Normalized copies of the searchable fields, used where FTS5 is not available
+PREFIX_FIELDS = {
+    'search_folio': 'folio_hospitalizacion',
+    'search_nombres': 'nombres',
+    'search_apellidos': 'apellidos',
+}
+
+_fts5_support = {}
+
+
+def normalize_search_text(text):
+    """Lowercase text without accents, as stored in the prefix columns"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower().strip()
+
+
+def fts_enabled(connection):
+    """Whether the connection is SQLite built with FTS5 (checked once per alias)"""
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts5_support:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            _fts5_support[connection.alias] = any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+    return _fts5_support[connection.alias]
+
+
+# The patient key is stored, unindexed, next to the searchable text: rowids of
+# website_patient (a table without an integer primary key) change on VACUUM
+CREATE_SEARCH_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "id_paciente UNINDEXED, folio, nombres, apellidos, tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+_INDEX_PATIENTS = (
+    f'INSERT INTO {SEARCH_TABLE} (id_paciente, folio, nombres, apellidos) '
+    'SELECT id_paciente, folio_hospitalizacion, nombres, apellidos FROM website_patient'
+)
+
+
+def create_search_table(connection):
+    """Create the FTS5 table and fill it from the patient table"""
+    if not fts_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_SEARCH_TABLE)
+    rebuild_search_table(connection)
+
+
+def rebuild_search_table(connection):
+    """Re-index every patient, e.g. after bulk writes that bypass the signals"""
+    if not fts_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(_INDEX_PATIENTS)
+
+
+def drop_search_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def _db_pk(patient, connection):
+    # The stored representation, e.g. UUIDs as 32 hex characters on SQLite
+    return patient._meta.pk.get_db_prep_value(patient.pk, connection)
+
+
+def index_patient(patient, using='default'):
+    connection = connections[using]
+    if not fts_enabled(connection):
+        return
+    pk = _db_pk(patient, connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE id_paciente = %s', [pk])
+        cursor.execute(f'{_INDEX_PATIENTS} WHERE id_paciente = %s', [pk])
+
+
+def unindex_patient(patient, using='default'):
+    """Drop a patient from the index"""
+    connection = connections[using]
+    if fts_enabled(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE id_paciente = %s', [_db_pk(patient, connection)])
+
+
+def search_patients(patients, query):
+    """
+    Narrow a patient queryset to those whose folio, names or surnames start with
+    every word of ``query``. FTS5 matches word prefixes anywhere in a field; the
+    prefix columns match the start of each field.
+    """
+    terms = [term for term in query.split() if any(char.isalnum() for char in term)]
+    if not terms:
+        return patients
+
+    if fts_enabled(connections[patients.db]):
+        # Each word becomes a quoted prefix phrase, so user input is never FTS syntax
+        match = ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        return patients.filter(pk__in=RawSQL(
+            f'SELECT id_paciente FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match]
+        ))
+
+    for term in terms:
+        term = normalize_search_text(term)
+        patients = patients.filter(
+            Q(search_folio__startswith=term) | Q(search_nombres__startswith=term) |
+            Q(search_apellidos__startswith=term)
+        )
+    return patients
@@ -0,0 +1,176 @@
+# website/utils/query_inspection.py - Per-request query recording and repeated-query (N+1) detection
+
+import heapq
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+from django.conf import settings
+
+
+# Frames of the originating stack reported for a repeated query
+STACK_DEPTH = 6
+
+# Transaction bookkeeping, repeated by design inside atomic blocks
+IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_VALUE_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+# Recorders of the query being run. Context variables are copied into the
+# threads that run sync views under ASGI, so their queries are recorded too.
+_recorders = ContextVar('query_recorders', default=())
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every database connection (see signals.py);
+    runs the query through the recorders active in the current context
+    """
+    for recorder in reversed(_recorders.get()):
+        execute = partial(recorder, execute)
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def recording(recorder):
+    """Pass every query run in this context through ``recorder`` (an execute wrapper)"""
+    token = _recorders.set((*_recorders.get(), recorder))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times queries, keeping the slowest ``top`` of them"""
+
+    def __init__(self, top=0):
+        self.top = top
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []
+        self._order = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if self.top:
+                # SQL only: the parameters hold patient data
+                self._order += 1
+                entry = (elapsed, self._order, context['connection'].alias, sql)
+                if len(self.slowest) < self.top:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+
+
+def fingerprint(sql):
+    """
+    SQL with its literals and placeholders replaced by ``?`` and IN lists
+    collapsed, so the same statement run with different values compares equal
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _VALUE_LIST.sub('(...)', sql.replace('%s', '?'))
+    return _SPACE.sub(' ', sql).strip()
+
+
+def app_stack(depth=STACK_DEPTH):
+    """Innermost ``depth`` frames of the current stack that belong to the project"""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return frames[-depth:]
+
+
+@dataclass
+class RepeatedQuery:
+    alias: str
+    sql: str
+    count: int
+    stack: list = field(default_factory=list)
+
+    def describe(self):
+        origin = ''.join(traceback.format_list(self.stack)) or '  (no project frames)\n'
+        return f'{self.count}x [{self.alias}] {self.sql[:500]}\n{origin}'
+
+
+class RepeatedQueryError(AssertionError):
+    pass
+
+
+class RepeatedQueryDetector:
+    """
+    execute_wrapper that fingerprints every statement and flags the ones run
+    more than ``threshold`` times, with the project stack they were run from
+    """
+
+    def __init__(self, threshold=None, stack_depth=STACK_DEPTH):
+        if threshold is None:
+            threshold = getattr(settings, 'REPEATED_QUERY_THRESHOLD', 5)
+        self.threshold = threshold
+        self.stack_depth = stack_depth
+        self.counts = Counter()
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(IGNORED_PREFIXES):
+            key = (context['connection'].alias, fingerprint(sql))
+            self.counts[key] += 1
+            # The stack is only taken once, when the statement becomes a repeat
+            if self.counts[key] == self.threshold + 1:
+                self.stacks[key] = app_stack(self.stack_depth)
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """Statements run more than ``threshold`` times, most repeated first"""
+        return [
+            RepeatedQuery(alias, sql, count, self.stacks.get((alias, sql), []))
+            for (alias, sql), count in self.counts.most_common()
+            if count > self.threshold
+        ]
+
+    def report(self):
+        repeated = self.repeated()
+        if not repeated:
+            return ''
+        return f'{len(repeated)} statement(s) run more than {self.threshold} times:\n' + '\n'.join(
+            query.describe() for query in repeated
+        )
+
+
+@contextmanager
+def detect_repeated_queries(threshold=None, fail=True):
+    """
+    Detect repeated statements run inside the block, e.g. in a test::
+
+        with detect_repeated_queries(threshold=2):
+            self.client.get(reverse('dashboard'))
+
+    With ``fail`` a RepeatedQueryError (an AssertionError) is raised on exit
+    if any were found; otherwise inspect the yielded detector.
+    """
+    detector = RepeatedQueryDetector(threshold)
+    with recording(detector):
+        yield detector
+    if fail and detector.repeated():
+        raise RepeatedQueryError(detector.report())
@@ -0,0 +1,121 @@
+# website/utils/request_metrics.py - Per-view request metrics in the Prometheus text format
+
+import threading
+from bisect import bisect_left
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total = self.series.get(labels, (None, 0))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+        # Index of the first bucket the value fits in; the last slot is +Inf
+        counts[bisect_left(self.buckets, value)] += 1
+        self.series[labels] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {_number(total)}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{_labels(self.label_names, labels)}}} {_number(value)}')
+        return lines
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    """
+    Request metrics of this process. Each worker process keeps its own, so
+    Prometheus should scrape every worker (or the values are per worker).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter(
+                'http_requests_total', 'Requests by view, method and status code.', ('view', 'method', 'status')
+            )
+            self.duration = Histogram(
+                'http_request_duration_seconds', 'Request latency.', ('view', 'method'), DURATION_BUCKETS
+            )
+            self.db_queries = Histogram(
+                'http_request_db_queries', 'Database queries per request.', ('view', 'method'), QUERY_COUNT_BUCKETS
+            )
+            self.db_duration = Histogram(
+                'http_request_db_duration_seconds', 'Time spent in database queries per request.',
+                ('view', 'method'), DURATION_BUCKETS
+            )
+            self.response_size = Histogram(
+                'http_response_size_bytes', 'Response body size, when known.', ('view', 'method'), SIZE_BUCKETS
+            )
+
+    def observe(self, view, method, status, seconds, queries=None, query_seconds=None, size=None):
+        """Record a request; ``queries`` and ``size`` are None when they are not known"""
+        labels = (view, method)
+        with self._lock:
+            self.requests.inc((view, method, str(status)))
+            self.duration.observe(labels, seconds)
+            if queries is not None:
+                self.db_queries.observe(labels, queries)
+                self.db_duration.observe(labels, query_seconds)
+            if size is not None:
+                self.response_size.observe(labels, size)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = (self.requests, self.duration, self.db_queries, self.db_duration, self.response_size)
+            return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+request_metrics = RequestMetrics()
@@ -5,11 +5,36 @@ from typing import Dict, List, Tuple, Any
 from django.utils import timezone
 from datetime import datetime, timedelta
 
+from .keyword_matcher import risk_group_matcher
+from .risk_memo import fingerprint, risk_memo
+from .risk_models import AIRWAY_BASIC, get_risk_model
+
 class AdvancedRiskCalculator:
     """
     Enhanced risk calculator with multi-factor analysis and machine learning approach
     """
     
+    # Bump whenever scoring rules change so memoized results are not reused
+    VERSION = 'advanced-1'
+    
+    # Alert levels by minimum score, highest first; lower scores are 'LOW'
+    ALERT_THRESHOLDS = ((80, 'CRITICAL'), (60, 'HIGH'), (40, 'MODERATE'))
+    
+    # PreSurgeryForm fields the score depends on, besides today's date
+    INPUT_FIELDS = (
+        # Airway anatomy
+        'mallampati', 'patil_aldrete', 'distancia_inter_incisiva',
+        'distancia_tiro_mentoniana', 'protrusion_mandibular', 'desviacion_traquea',
+        # Patient factors
+        'estado_fisico_asa', 'imc', 'fecha_nacimiento',
+        # Medical history
+        'antecedentes_dificultad', 'comorbilidades', 'medicamentos', 'tabaquismo', 'alergias',
+        # Physiological
+        'glasgow', 'spo2_aire', 'fc', 'estridor_laringeo', 'problemas_deglucion',
+        # Procedure
+        'fecha_reporte', 'ayuno_hrs', 'uso_glp1', 'uso_usg_gastrico', 'usg_gastrico_ml',
+    )
+    
     # Weight coefficients for different risk factors (based on clinical evidence)
     RISK_WEIGHTS = {
         'airway_anatomy': 0.35,      # Mallampati, inter-incisal distance, etc.
@@ -47,12 +72,45 @@ class AdvancedRiskCalculator:
         'obese_3': {'range': (40, 100), 'score': 35, 'factor': 'Obesidad grado III'}
     }
 
+    # Keyword groups scanned in free-text history fields: (factor, keywords, points)
+    COMORBIDITY_GROUPS = (
+        # Respiratory conditions
+        ('Comorbilidades respiratorias', ('asma', 'epoc', 'apnea', 'neumonia', 'bronquitis'), 15),
+        # Cardiovascular conditions
+        ('Comorbilidades cardiovasculares', ('hipertension', 'cardiaca', 'infarto', 'arritmia'), 10),
+        # Endocrine conditions
+        ('Comorbilidades endocrinas', ('diabetes', 'tiroides', 'acromegalia'), 12),
+        # Rheumatologic conditions affecting neck mobility
+        ('Condiciones que afectan movilidad cervical', ('artritis', 'espondilitis', 'esclerodermia'), 18),
+    )
+    
+    MEDICATION_GROUPS = (
+        # Anticoagulants (bleeding risk)
+        ('Terapia anticoagulante', ('warfarina', 'heparina', 'rivaroxaban', 'apixaban'), 8),
+        # Steroids (potential difficult mask ventilation)
+        ('Terapia con esteroides', ('esteroide', 'prednisona'), 5),
+    )
+    
+    ALLERGY_GROUP = (
+        'Alergias relevantes para anestesia', ('penicilina', 'latex', 'succinilcolina', 'rocuronio'), 5
+    )
+
     @classmethod
     def calculate_comprehensive_risk(cls, presurgery_form) -> Tuple[float, Dict[str, Any]]:
         """
         Calculate comprehensive risk assessment with detailed breakdown
         Returns: (total_risk_score, detailed_analysis)
+        
+        Results are memoized on the form's INPUT_FIELDS, the calculator version and
+        today's date (age and urgency depend on it); treat the analysis as read-only.
         """
+        key = (cls, cls.VERSION, timezone.now().date(), fingerprint(presurgery_form, cls.INPUT_FIELDS))
+        return risk_memo('comprehensive').get_or_compute(
+            key, lambda: cls._calculate_comprehensive_risk(presurgery_form)
+        )
+
+    @classmethod
+    def _calculate_comprehensive_risk(cls, presurgery_form) -> Tuple[float, Dict[str, Any]]:
         try:
             # Calculate individual risk components
             airway_risk = cls._calculate_airway_anatomy_risk(presurgery_form)
@@ -99,6 +157,15 @@ class AdvancedRiskCalculator:
             # Fallback to basic calculation if advanced fails
             return cls.calculate_basic_risk(presurgery_form)
 
+    @classmethod
+    def calculate_batch_risk(cls, presurgery_forms, reference_date=None):
+        """
+        Vectorized counterpart of calculate_comprehensive_risk for whole cohorts
+        Returns: BatchRiskResult with NumPy columns per component
+        """
+        from .batch_risk import calculate_batch_risk
+        return calculate_batch_risk(presurgery_forms, reference_date=reference_date, calculator=cls)
+
     @classmethod
     def _calculate_airway_anatomy_risk(cls, form) -> Dict[str, Any]:
         """Calculate risk based on airway anatomy assessment"""
@@ -210,46 +277,15 @@ class AdvancedRiskCalculator:
         
         # Comorbidities assessment
         if hasattr(form, 'comorbilidades') and form.comorbilidades:
-            comorbidities_text = form.comorbilidades.lower()
-            
-            # Respiratory conditions
-            respiratory_conditions = ['asma', 'epoc', 'apnea', 'neumonia', 'bronquitis']
-            if any(condition in comorbidities_text for condition in respiratory_conditions):
-                score += 15
-                factors.append("Comorbilidades respiratorias")
-            
-            # Cardiovascular conditions
-            cardiac_conditions = ['hipertension', 'cardiaca', 'infarto', 'arritmia']
-            if any(condition in comorbidities_text for condition in cardiac_conditions):
-                score += 10
-                factors.append("Comorbilidades cardiovasculares")
-            
-            # Endocrine conditions
-            endocrine_conditions = ['diabetes', 'tiroides', 'acromegalia']
-            if any(condition in comorbidities_text for condition in endocrine_conditions):
-                score += 12
-                factors.append("Comorbilidades endocrinas")
-            
-            # Rheumatologic conditions affecting neck mobility
-            rheumatic_conditions = ['artritis', 'espondilitis', 'esclerodermia']
-            if any(condition in comorbidities_text for condition in rheumatic_conditions):
-                score += 18
-                factors.append("Condiciones que afectan movilidad cervical")
+            for label, points in cls._matched_groups(cls.COMORBIDITY_GROUPS, form.comorbilidades):
+                score += points
+                factors.append(label)
         
         # Medication assessment
         if hasattr(form, 'medicamentos') and form.medicamentos:
-            medications_text = form.medicamentos.lower()
-            
-            # Anticoagulants (bleeding risk)
-            anticoagulants = ['warfarina', 'heparina', 'rivaroxaban', 'apixaban']
-            if any(med in medications_text for med in anticoagulants):
-                score += 8
-                factors.append("Terapia anticoagulante")
-            
-            # Steroids (potential difficult mask ventilation)
-            if 'esteroide' in medications_text or 'prednisona' in medications_text:
-                score += 5
-                factors.append("Terapia con esteroides")
+            for label, points in cls._matched_groups(cls.MEDICATION_GROUPS, form.medicamentos):
+                score += points
+                factors.append(label)
         
         # Smoking history
         if hasattr(form, 'tabaquismo') and form.tabaquismo:
@@ -258,11 +294,9 @@ class AdvancedRiskCalculator:
         
         # Allergies that might affect airway management
         if hasattr(form, 'alergias') and form.alergias:
-            allergies_text = form.alergias.lower()
-            drug_allergies = ['penicilina', 'latex', 'succinilcolina', 'rocuronio']
-            if any(allergy in allergies_text for allergy in drug_allergies):
-                score += 5
-                factors.append("Alergias relevantes para anestesia")
+            for label, points in cls._matched_groups((cls.ALLERGY_GROUP,), form.alergias):
+                score += points
+                factors.append(label)
         
         return {
             'score': min(score, 100),
@@ -271,6 +305,12 @@ class AdvancedRiskCalculator:
             'weight': cls.RISK_WEIGHTS['medical_history']
         }
 
+    @staticmethod
+    def _matched_groups(groups, text):
+        """(label, points) of the keyword groups mentioned in ``text``, ignoring accents and case"""
+        matched = set(risk_group_matcher(groups).categories(text))
+        return [(label, points) for label, _keywords, points in groups if label in matched]
+
     @classmethod
     def _calculate_physiological_risk(cls, form) -> Dict[str, Any]:
         """Calculate risk based on current physiological status"""
@@ -461,14 +501,10 @@ class AdvancedRiskCalculator:
     @classmethod
     def _determine_alert_level(cls, risk_score: float) -> str:
         """Determine alert level based on risk score"""
-        if risk_score >= 80:
-            return 'CRITICAL'
-        elif risk_score >= 60:
-            return 'HIGH'
-        elif risk_score >= 40:
-            return 'MODERATE'
-        else:
-            return 'LOW'
+        for threshold, level in cls.ALERT_THRESHOLDS:
+            if risk_score >= threshold:
+                return level
+        return 'LOW'
 
     @classmethod
     def _estimate_difficulty_class(cls, risk_score: float) -> Dict[str, Any]:
@@ -689,76 +725,16 @@ class AdvancedRiskCalculator:
 
 # website/utils/risk_assessment.py
 class RiskCalculator:
+    """The airway model of the risk model registry (see risk_models.AIRWAY_BASIC)"""
+    # Bump whenever scoring rules change so persisted scores get backfilled
+    VERSION = AIRWAY_BASIC.version
+
     @staticmethod
     def calculate_airway_risk(presurgery_form):
         """Calculate airway difficulty risk score (0-100)"""
-        risk_score = 0
-        risk_factors = []
-        
-        # Mallampati scoring
-        if presurgery_form.mallampati >= 3:
-            risk_score += 25
-            risk_factors.append(f"Mallampati Clase {presurgery_form.mallampati}")
-        
-        # ASA classification
-        if presurgery_form.estado_fisico_asa >= 4:
-            risk_score += 30
-            risk_factors.append(f"ASA {presurgery_form.estado_fisico_asa}")
-        
-        # BMI assessment
-        if presurgery_form.imc >= 35:
-            risk_score += 15
-            risk_factors.append(f"IMC {presurgery_form.imc} (Obesidad)")
-        
-        # Previous difficulties
-        if presurgery_form.antecedentes_dificultad:
-            risk_score += 40
-            risk_factors.append("Antecedentes de dificultad")
-        
-        # Patil-Aldrete
-        if presurgery_form.patil_aldrete >= 3:
-            risk_score += 20
-            risk_factors.append(f"Patil-Aldrete {presurgery_form.patil_aldrete}")
-        
-        # Inter-incisal distance
-        if presurgery_form.distancia_inter_incisiva < 3:
-            risk_score += 10
-            risk_factors.append("Distancia inter-incisiva < 3cm")
-        
-        return min(risk_score, 100), risk_factors
-    
+        return get_risk_model(AIRWAY_BASIC.name).evaluate(presurgery_form)
+
     @staticmethod
     def get_risk_level(score):
         """Get risk level description"""
-        if score >= 70:
-            return {
-                'level': 'ALTO',
-                'color': '#e74c3c',
-                'description': 'Alto riesgo de vía aérea difícil',
-                'recommendations': [
-                    'Considerar intubación con paciente despierto',
-                    'Tener disponible carro de vía aérea difícil',
-                    'Personal experimentado requerido'
-                ]
-            }
-        elif score >= 40:
-            return {
-                'level': 'MODERADO',
-                'color': '#f39c12',
-                'description': 'Riesgo moderado - preparación especial',
-                'recommendations': [
-                    'Pre-oxigenación extendida',
-                    'Videolaringoscopio disponible',
-                    'Plan B definido'
-                ]
-            }
-        else:
-            return {
-                'level': 'BAJO',
-                'color': '#27ae60',
-                'description': 'Riesgo bajo - manejo estándar',
-                'recommendations': [
-                    'Procedimiento estándar',
-                    'Monitoreo rutinario'
-                ]
-            }
\ No newline at end of file
+        return get_risk_model(AIRWAY_BASIC.name).level(score)
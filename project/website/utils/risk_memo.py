@@ -0,0 +1,102 @@
+# website/utils/risk_memo.py - Bounded LRU/TTL memo of risk calculations keyed by their inputs
+
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from operator import attrgetter
+
+from django.conf import settings
+
+
+class RiskMemo:
+    """
+    Results keyed by a fingerprint of the calculator inputs, so an unchanged
+    form is scored once however many views or polls ask for it. Holds at most
+    ``maxsize`` entries, evicting the least recently used, and recomputes
+    entries older than ``ttl`` seconds. ``maxsize=0`` turns it off.
+    """
+
+    def __init__(self, maxsize=4096, ttl=3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get_or_compute(self, key, compute):
+        """The stored result for ``key``, or ``compute()`` stored under it"""
+        if not self.maxsize:
+            return compute()
+
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self.ttl is None or now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+
+        # Outside the lock: concurrent misses on one key may both compute
+        result = compute()
+        with self._lock:
+            self._entries[key] = (now, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+@lru_cache(maxsize=None)
+def _values_getter(fields):
+    return attrgetter(*fields)
+
+
+def fingerprint(form, fields):
+    """Values of ``fields`` (a tuple of two or more names) on a form, as a hashable key"""
+    return _values_getter(fields)(form)
+
+
+# Memos of this process by name; each worker keeps its own
+_memos = {}
+_memos_lock = threading.Lock()
+
+
+def risk_memo(name):
+    """The memo ``name``, sized by settings.RISK_MEMO_SIZE and RISK_MEMO_TTL"""
+    memo = _memos.get(name)
+    if memo is None:
+        with _memos_lock:
+            memo = _memos.setdefault(name, RiskMemo(
+                maxsize=getattr(settings, 'RISK_MEMO_SIZE', 4096),
+                ttl=getattr(settings, 'RISK_MEMO_TTL', 3600),
+            ))
+    return memo
+
+
+def risk_memo_stats():
+    """Hit, miss and eviction counters per memo"""
+    return {name: memo.stats() for name, memo in sorted(_memos.items())}
@@ -0,0 +1,222 @@
+# website/utils/risk_models.py - Risk models declared as rule tables and compiled into evaluation plans
+
+import operator
+from dataclasses import dataclass
+from typing import Any, Tuple
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Least
+
+
+# Comparison of a rule; 'truthy' flags any true value (booleans, non-empty text)
+OPERATORS = {
+    '>=': operator.ge,
+    '>': operator.gt,
+    '<=': operator.le,
+    '<': operator.lt,
+    '==': operator.eq,
+    'truthy': None,
+}
+
+# Field lookup of each comparison, for the SQL form of a model
+LOOKUPS = {'>=': 'gte', '>': 'gt', '<=': 'lte', '<': 'lt', '==': 'exact'}
+
+
+@dataclass(frozen=True)
+class Rule:
+    """``points`` when ``field <op> threshold``; ``label`` may use ``{value}``"""
+    field: str
+    op: str
+    threshold: Any = None
+    points: int = 0
+    label: str = ''
+
+
+@dataclass(frozen=True)
+class RiskLevel:
+    """Level of the scores from ``min_score`` up to the next level's"""
+    min_score: float
+    level: str
+    color: str
+    description: str
+    recommendations: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class RiskModel:
+    """
+    A scoring version. Persisted scores record ``version``, so any change to
+    the rules or levels needs a new version (see backfill_risk_scores).
+    """
+    name: str
+    version: str
+    rules: Tuple[Rule, ...]
+    levels: Tuple[RiskLevel, ...]
+    max_score: int = 100
+
+    @classmethod
+    def from_dict(cls, data):
+        """Model from plain data, e.g. an entry of settings.RISK_MODEL_DEFINITIONS"""
+        return cls(
+            name=data['name'],
+            version=data['version'],
+            rules=tuple(Rule(**rule) for rule in data['rules']),
+            levels=tuple(
+                RiskLevel(**{**level, 'recommendations': tuple(level.get('recommendations', ()))})
+                for level in data['levels']
+            ),
+            max_score=data.get('max_score', 100),
+        )
+
+
+class CompiledRiskModel:
+    """
+    A RiskModel flattened into ``(field, compare, threshold, points, label,
+    label_has_value)`` steps, so scoring a form is a single loop with no
+    per-rule lookups
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.name = model.name
+        self.version = model.version
+        self.max_score = model.max_score
+
+        plan = []
+        for rule in model.rules:
+            if rule.op not in OPERATORS:
+                raise ValueError(f"Risk model {model.name}: unknown operator {rule.op!r} for {rule.field}")
+            plan.append((rule.field, OPERATORS[rule.op], rule.threshold, rule.points, rule.label,
+                         '{value}' in rule.label))
+        self.plan = tuple(plan)
+        self.fields = tuple(dict.fromkeys(rule.field for rule in model.rules))
+
+        if not model.levels:
+            raise ValueError(f"Risk model {model.name} has no levels")
+        self.levels = tuple(sorted(model.levels, key=lambda level: level.min_score, reverse=True))
+
+    def evaluate(self, form):
+        """``(score, factors)`` of a form; missing values never match"""
+        score = 0
+        factors = []
+        for field, compare, threshold, points, label, label_has_value in self.plan:
+            value = getattr(form, field, None)
+            if value is None:
+                continue
+            if value if compare is None else compare(value, threshold):
+                score += points
+                factors.append(label.format(value=value) if label_has_value else label)
+        return min(score, self.max_score), factors
+
+    def score_expression(self, model_class):
+        """
+        The score as a SQL expression over ``model_class`` columns, equal to
+        ``evaluate()``: NULL columns never match, the sum is capped at max_score
+        """
+        terms = [
+            Case(When(self._condition(model_class, rule), then=Value(rule.points)),
+                 default=Value(0), output_field=IntegerField())
+            for rule in self.model.rules
+        ]
+        if not terms:
+            return Value(0, output_field=IntegerField())
+        total = sum(terms[1:], terms[0])
+        return Least(total, Value(self.max_score), output_field=IntegerField())
+
+    def level_expression(self, score_field):
+        """The level label of the score annotated as ``score_field``"""
+        return Case(
+            *(When(**{f'{score_field}__gte': level.min_score}, then=Value(level.level))
+              for level in self.levels[:-1]),
+            default=Value(self.levels[-1].level),
+        )
+
+    @staticmethod
+    def _condition(model_class, rule):
+        if rule.op != 'truthy':
+            return Q(**{f'{rule.field}__{LOOKUPS[rule.op]}': rule.threshold})
+        # Python truthiness: True, non-zero numbers, non-empty text
+        internal_type = model_class._meta.get_field(rule.field).get_internal_type()
+        if internal_type in ('BooleanField', 'NullBooleanField'):
+            return Q(**{rule.field: True})
+        falsy = '' if internal_type in ('CharField', 'TextField') else 0
+        return Q(**{f'{rule.field}__isnull': False}) & ~Q(**{rule.field: falsy})
+
+    def level(self, score):
+        """Level, color, description and recommendations of a score"""
+        for level in self.levels:
+            if score is not None and score >= level.min_score:
+                break
+        else:
+            level = self.levels[-1]
+        return {
+            'level': level.level,
+            'color': level.color,
+            'description': level.description,
+            'recommendations': list(level.recommendations),
+        }
+
+
+_registry = {}
+
+
+def register_risk_model(model):
+    """Compile and register a model, replacing one of the same name"""
+    compiled = CompiledRiskModel(model)
+    _registry[model.name] = compiled
+    return compiled
+
+
+def load_risk_models():
+    """Register the models declared in settings.RISK_MODEL_DEFINITIONS (run at startup)"""
+    for data in getattr(settings, 'RISK_MODEL_DEFINITIONS', ()):
+        register_risk_model(RiskModel.from_dict(data))
+    # Fail at startup rather than on the first save when RISK_MODEL is unknown
+    get_risk_model()
+
+
+def risk_model_names():
+    return sorted(_registry)
+
+
+def get_risk_model(name=None):
+    """Compiled model ``name``, by default the active one (settings.RISK_MODEL)"""
+    name = name or getattr(settings, 'RISK_MODEL', AIRWAY_BASIC.name)
+    try:
+        return _registry[name]
+    except KeyError:
+        raise ValueError(f"Modelo de riesgo desconocido: {name}")
+
+
+# Airway difficulty model persisted on PreSurgeryForm since the first risk columns
+AIRWAY_BASIC = RiskModel(
+    name='airway-basic',
+    version='basic-1',
+    rules=(
+        Rule('mallampati', '>=', 3, 25, 'Mallampati Clase {value}'),
+        Rule('estado_fisico_asa', '>=', 4, 30, 'ASA {value}'),
+        Rule('imc', '>=', 35, 15, 'IMC {value} (Obesidad)'),
+        Rule('antecedentes_dificultad', 'truthy', None, 40, 'Antecedentes de dificultad'),
+        Rule('patil_aldrete', '>=', 3, 20, 'Patil-Aldrete {value}'),
+        Rule('distancia_inter_incisiva', '<', 3, 10, 'Distancia inter-incisiva < 3cm'),
+    ),
+    levels=(
+        RiskLevel(70, 'ALTO', '#e74c3c', 'Alto riesgo de vía aérea difícil', (
+            'Considerar intubación con paciente despierto',
+            'Tener disponible carro de vía aérea difícil',
+            'Personal experimentado requerido',
+        )),
+        RiskLevel(40, 'MODERADO', '#f39c12', 'Riesgo moderado - preparación especial', (
+            'Pre-oxigenación extendida',
+            'Videolaringoscopio disponible',
+            'Plan B definido',
+        )),
+        RiskLevel(0, 'BAJO', '#27ae60', 'Riesgo bajo - manejo estándar', (
+            'Procedimiento estándar',
+            'Monitoreo rutinario',
+        )),
+    ),
+)
+
+register_risk_model(AIRWAY_BASIC)
@@ -0,0 +1,49 @@
+# website/utils/sqlite_tuning.py - Connection pragmas for running SQLite under concurrent load
+
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Stored in the database file rather than the connection
+PERSISTENT_PRAGMAS = {'journal_mode'}
+
+_NAME = re.compile(r'^[a-z_]+$')
+_VALUE = re.compile(r'^(-?\d+|[A-Za-z]+)$')
+
+
+def sqlite_pragmas(alias=DEFAULT_DB_ALIAS):
+    """
+    settings.SQLITE_PRAGMAS for connections to ``alias``, or nothing when
+    settings.SQLITE_TUNING is off. Other aliases (the read-only replica) do
+    not get the pragmas that would rewrite their file.
+    """
+    if not getattr(settings, 'SQLITE_TUNING', False):
+        return {}
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if alias != DEFAULT_DB_ALIAS:
+        pragmas = {name: value for name, value in pragmas.items() if name not in PERSISTENT_PRAGMAS}
+    return pragmas
+
+
+def apply_pragmas(connection, pragmas):
+    """
+    Run ``PRAGMA name = value`` for each pragma on a DB-API connection and
+    return the resulting values. journal_mode is persistent (it is stored in
+    the database file); the others only last as long as the connection.
+    """
+    applied = {}
+    cursor = connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            # Pragmas cannot take parameters, so only plain names and values are accepted
+            if not _NAME.match(name) or not _VALUE.match(str(value)):
+                raise ValueError(f'Invalid SQLite pragma: {name} = {value!r}')
+            cursor.execute(f'PRAGMA {name} = {value}')
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            applied[name] = row[0] if row else None
+    finally:
+        cursor.close()
+    return applied
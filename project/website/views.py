@@ -3,79 +3,53 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import get_user_model, login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.db import IntegrityError
-from django.db.models import Count, Avg, Q, Sum, F, Case, When, IntegerField
+from django.db.models import Count, Avg, Q, Sum, F, Case, When, IntegerField, Max
 from django.db.models.functions import TruncMonth, TruncWeek, ExtractHour
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
 from django.core.paginator import Paginator
-from django.http import JsonResponse, FileResponse, HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, FileResponse, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
 from django.utils.translation import gettext_lazy as _
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 from django.conf import settings
 
+import hmac
 import json
-import pandas as pd
+import logging
+import os
+import tempfile
 from datetime import datetime, timedelta
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from io import BytesIO
 
 # Local imports
-from .models import Patient, PreSurgeryForm, PostDuringSurgeryForm, MedicoUser
+from .models import Patient, PreSurgeryForm, PostDuringSurgeryForm, MedicoUser, DoctorStats, ExportJob, AlertEvent
+from .routers import analytics_view
+from .utils import dashboard_cache
+from .utils.alert_events import CRITICAL_ALERT_SCORE, HIGH_ALERT_SCORE, alert_event_stream, alert_payload
+from .utils.clinical_snapshot import FORMAT_EXTENSIONS, snapshot_lag, snapshot_queryset, write_snapshot
+from .utils.dashboard_stats import summarize_patients, summarize_doctor_stats
+from .utils.excel_export import write_dashboard_workbook
+from .utils.email_outbox import enqueue_email
+from .utils.export_jobs import export_job_payload, parquet_available, request_export
+from .utils.pagination import paginate_by_cursor
+from .utils.patient_search import search_patients
+from .utils.request_metrics import request_metrics
+from .utils.risk_assessment import AdvancedRiskCalculator
+from .utils.risk_memo import risk_memo_stats
+from .utils.risk_models import get_risk_model
 from .forms import (
     MedicRegistrationForm, ContactForm, PatientForm, 
     PreSurgeryCreateForm, PostSurgeryCreateForm
 )
 
-# Try to import risk assessment, create fallback if not available
-try:
-    from .utils.risk_assessment import RiskCalculator, AdvancedRiskCalculator
-except ImportError:
-    # Fallback risk calculator if the advanced one fails
-    class RiskCalculator:
-        @staticmethod
-        def calculate_airway_risk(form):
-            # Basic fallback calculation
-            risk_score = 0
-            risk_factors = []
-            
-            if hasattr(form, 'mallampati') and form.mallampati >= 3:
-                risk_score += 25
-                risk_factors.append(f"Mallampati {form.mallampati}")
-            
-            if hasattr(form, 'estado_fisico_asa') and form.estado_fisico_asa >= 4:
-                risk_score += 30
-                risk_factors.append(f"ASA {form.estado_fisico_asa}")
-            
-            return min(risk_score, 100), risk_factors
-        
-        @staticmethod
-        def get_risk_level(score):
-            if score >= 70:
-                return {
-                    'level': 'ALTO',
-                    'color': '#e74c3c',
-                    'description': 'Alto riesgo de vía aérea difícil',
-                    'recommendations': ['Preparación especial requerida']
-                }
-            elif score >= 40:
-                return {
-                    'level': 'MODERADO',
-                    'color': '#f39c12',
-                    'description': 'Riesgo moderado',
-                    'recommendations': ['Monitoreo adicional']
-                }
-            else:
-                return {
-                    'level': 'BAJO',
-                    'color': '#27ae60',
-                    'description': 'Riesgo bajo',
-                    'recommendations': ['Manejo estándar']
-                }
 
+logger = logging.getLogger(__name__)
 
 # Your existing view functions start here...
 User = get_user_model()
@@ -171,17 +145,9 @@ def contact(request):
             Mensaje: {form.cleaned_data['message']}
             """
             
-            try:
-                send_mail(
-                    subject,
-                    message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [settings.CONTACT_EMAIL],
-                    fail_silently=False,
-                )
-                messages.success(request, 'Mensaje enviado correctamente. Nos pondremos en contacto pronto.')
-            except Exception as e:
-                messages.warning(request, 'El mensaje se ha guardado pero hubo un problema al enviar la notificación.')
+            # Delivered by manage.py send_outbox, so the request never waits on SMTP
+            enqueue_email(subject, message, [settings.CONTACT_EMAIL], reply_to=[form.cleaned_data['email']])
+            messages.success(request, 'Mensaje enviado correctamente. Nos pondremos en contacto pronto.')
             
             return redirect('contact')
     else:
@@ -206,17 +172,17 @@ def patient_list(request):
     """
     search_query = request.GET.get('q', '')
     form_type = request.GET.get('form', '')
-    patients = Patient.objects.filter(medico=request.user, activo=True)
+    # Form flags and folio annotated in the same query as the patients
+    patients = Patient.objects.filter(medico=request.user, activo=True).with_form_status()
     
     if search_query:
-        patients = patients.filter(
-            Q(folio_hospitalizacion__icontains=search_query) |
-            Q(nombres__icontains=search_query) |
-            Q(apellidos__icontains=search_query)
-        )
+        patients = search_patients(patients, search_query)
+    
+    # Keyset pages over the (medico, fecha_registro) index
+    page = paginate_by_cursor(patients, request.GET.get('cursor'))
     
     context = {
-        'patients': patients,
+        'patients': page,
         'search_query': search_query,
         'form_type': form_type  # Pass the form type to the template
     }
@@ -281,14 +247,12 @@ def patient_detail(request, pk):
         return redirect('patient-list')
     
     # Get pre-surgery forms for this patient
-    presurgery_forms = PreSurgeryForm.objects.filter(
-        folio_hospitalizacion__startswith=f"PRE-{patient.folio_hospitalizacion}"
-    ).order_by('-fecha_reporte')
+    presurgery_forms = patient.presurgeryform_set.order_by('-fecha_reporte')
     
     # Get post-surgery forms for this patient
     postsurgery_forms = PostDuringSurgeryForm.objects.filter(
-        folio_hospitalizacion__folio_hospitalizacion__in=presurgery_forms.values_list('folio_hospitalizacion', flat=True)
-    ).order_by('-folio_hospitalizacion__fecha_reporte')
+        folio_hospitalizacion__patient=patient
+    ).select_related('folio_hospitalizacion').order_by('-folio_hospitalizacion__fecha_reporte')
     
     context = {
         'patient': patient,
@@ -324,9 +288,7 @@ def presurgery_create(request, patient_id):
     
     try:
         # Check if a form already exists for this patient
-        existing_form = PreSurgeryForm.objects.filter(
-            folio_hospitalizacion=f"PRE-{patient.folio_hospitalizacion}"
-        ).first()
+        existing_form = patient.presurgeryform_set.first()
         
         if existing_form:
             messages.warning(request, 'Ya existe un formulario pre-quirúrgico para este paciente.')
@@ -340,6 +302,8 @@ def presurgery_create(request, patient_id):
                     presurgery.folio_hospitalizacion = f"PRE-{patient.folio_hospitalizacion}"
                     presurgery.fecha_reporte = timezone.now().date()
                     presurgery.medico = request.user.get_full_name()
+                    presurgery.patient = patient
+                    presurgery.medico_user = request.user
                     presurgery.save()
                     
                     messages.success(request, 'Formulario pre-quirúrgico creado exitosamente.')
@@ -373,8 +337,10 @@ def presurgery_create(request, patient_id):
 
 @login_required
 def presurgery_detail(request, pk):
-    presurgery = get_object_or_404(PreSurgeryForm, folio_hospitalizacion=pk)
-    patient = get_object_or_404(Patient, folio_hospitalizacion=pk.replace('PRE-', ''))
+    presurgery = get_object_or_404(
+        PreSurgeryForm.objects.select_related('patient'), folio_hospitalizacion=pk, patient__isnull=False
+    )
+    patient = presurgery.patient
     
     # Check if user has permission to view this form
     if patient.medico != request.user and not request.user.is_staff:
@@ -388,8 +354,10 @@ def presurgery_detail(request, pk):
 
 @login_required
 def presurgery_update(request, pk):
-    presurgery = get_object_or_404(PreSurgeryForm, folio_hospitalizacion=pk)
-    patient = get_object_or_404(Patient, folio_hospitalizacion=pk.replace('PRE-', ''))
+    presurgery = get_object_or_404(
+        PreSurgeryForm.objects.select_related('patient'), folio_hospitalizacion=pk, patient__isnull=False
+    )
+    patient = presurgery.patient
     
     if patient.medico != request.user and not request.user.is_staff:
         messages.error(request, 'No tienes permiso para editar este formulario.')
@@ -420,19 +388,13 @@ def presurgery_update(request, pk):
 @login_required
 def postsurgery_create(request, patient_id):
     """Create post-surgery form - FIXED VERSION"""
-    print(f"DEBUG: Starting postsurgery_create for patient {patient_id}")
-    print(f"DEBUG: Request method: {request.method}")
-    
-    if request.method == 'POST':
-        print(f"DEBUG: POST data: {request.POST}")
-        print(f"DEBUG: FILES data: {request.FILES}")
+    # Never log the submitted data: it is clinical information
+    logger.debug("postsurgery_create %s for patient %s", request.method, patient_id)
     patient = get_object_or_404(Patient, id_paciente=patient_id, medico=request.user)
     
     # Get the pre-surgery form
     try:
-        presurgery = PreSurgeryForm.objects.get(
-            folio_hospitalizacion=f"PRE-{patient.folio_hospitalizacion}"
-        )
+        presurgery = patient.presurgeryform_set.get()
     except PreSurgeryForm.DoesNotExist:
         messages.error(request, 'Debe completar el formulario pre-quirúrgico antes de crear el post-quirúrgico.')
         return redirect('patient-detail', patient_id)
@@ -497,9 +459,13 @@ def postsurgery_detail(request, pk):
     """
     View for displaying post-surgery form details
     """
-    postsurgery = get_object_or_404(PostDuringSurgeryForm, folio_hospitalizacion__folio_hospitalizacion=pk)
+    postsurgery = get_object_or_404(
+        PostDuringSurgeryForm.objects.select_related('folio_hospitalizacion__patient'),
+        folio_hospitalizacion__folio_hospitalizacion=pk,
+        folio_hospitalizacion__patient__isnull=False
+    )
     # Get the related patient through the pre-surgery form
-    patient = Patient.objects.get(folio_hospitalizacion=pk.replace('PRE-', ''))
+    patient = postsurgery.folio_hospitalizacion.patient
     
     # Check permissions
     if patient.medico != request.user and not request.user.is_staff:
@@ -516,8 +482,12 @@ def postsurgery_update(request, pk):
     """
     Update view for post-surgery form
     """
-    postsurgery = get_object_or_404(PostDuringSurgeryForm, folio_hospitalizacion__folio_hospitalizacion=pk)
-    patient = Patient.objects.get(folio_hospitalizacion=pk.replace('PRE-', ''))
+    postsurgery = get_object_or_404(
+        PostDuringSurgeryForm.objects.select_related('folio_hospitalizacion__patient'),
+        folio_hospitalizacion__folio_hospitalizacion=pk,
+        folio_hospitalizacion__patient__isnull=False
+    )
+    patient = postsurgery.folio_hospitalizacion.patient
     
     # Check permissions
     if patient.medico != request.user and not request.user.is_staff:
@@ -548,6 +518,7 @@ def postsurgery_update(request, pk):
 ## Dashboard view:
 
 @login_required
+@analytics_view
 def dashboard(request):
     """Enhanced dashboard with AI risk assessment and real-time alerts"""
     
@@ -556,114 +527,59 @@ def dashboard(request):
     
     # Pre-surgery forms for this user
     presurgery_forms = PreSurgeryForm.objects.filter(
-        medico=request.user.get_full_name()
-    ).select_related().prefetch_related('post_surgery_form')
-    
-    # Post-surgery forms
-    postsurgery_forms = PostDuringSurgeryForm.objects.filter(
-        folio_hospitalizacion__in=presurgery_forms.values('folio_hospitalizacion')
+        medico_user=request.user
+    ).select_related('post_surgery_form')
+    
+    # Counters come from the per-day rollup, so this stays constant-size
+    doctor_stats = DoctorStats.objects.filter(medico=request.user)
+    rollup = summarize_doctor_stats(
+        doctor_stats, DoctorStats.counter_fields(),
+        month_start=timezone.localdate().replace(day=1)
     )
+    patient_stats = rollup['patients']
+    patient_stats['age_distribution'] = summarize_patients(user_patients)['age_distribution']
+    presurgery_stats = rollup['presurgery']
+    postsurgery_stats = rollup['postsurgery']
     
     # Basic Statistics
-    total_patients = user_patients.count()
-    total_surgeries = presurgery_forms.count()
-    completed_surgeries = postsurgery_forms.count()
+    total_patients = patient_stats['total']
+    total_surgeries = presurgery_stats['total']
+    completed_surgeries = postsurgery_stats['total']
     pending_surgeries = total_surgeries - completed_surgeries
+    patients_this_month = patient_stats['this_month']
     
-    patients_this_month = user_patients.filter(
-        fecha_registro__month=datetime.now().month,
-        fecha_registro__year=datetime.now().year
-    ).count()
+    # Latest assessments
+    risk_assessments = [
+        build_risk_assessment(form)
+        for form in with_current_risk(presurgery_forms.order_by('-fecha_reporte')[:10])
+    ]
     
-    # Risk Assessment Analysis
-    risk_assessments = []
+    # Generate alerts for high-risk patients, highest risk first
     high_risk_alerts = []
     critical_patients = []
-    
-    for form in presurgery_forms:
-        try:
-            risk_score, risk_factors = RiskCalculator.calculate_airway_risk(form)
-            risk_level = RiskCalculator.get_risk_level(risk_score)
-            
-            assessment = {
-                'form': form,
-                'patient_name': f"{form.nombres} {form.apellidos}",
-                'folio': form.folio_hospitalizacion,
-                'risk_score': risk_score,
-                'risk_level': risk_level['level'],
-                'risk_color': risk_level['color'],
-                'risk_factors': risk_factors,
-                'recommendations': risk_level['recommendations'],
-                'has_post_surgery': hasattr(form, 'post_surgery_form'),
-                'fecha_reporte': form.fecha_reporte
-            }
-            
-            risk_assessments.append(assessment)
-            
-            # Generate alerts for high-risk patients
-            if risk_score >= 70:  # Critical risk
-                alert = generate_critical_alert(form, risk_score, risk_factors)
-                high_risk_alerts.append(alert)
-                critical_patients.append(assessment)
-            elif risk_score >= 40:  # High risk
-                alert = generate_high_risk_alert(form, risk_score, risk_factors)
-                high_risk_alerts.append(alert)
-                
-        except Exception as e:
-            print(f"Error calculating risk for {form.folio_hospitalizacion}: {e}")
-            continue
-    
-    # Risk Distribution
-    risk_distribution = {'low': 0, 'moderate': 0, 'high': 0, 'critical': 0}
-    for assessment in risk_assessments:
-        score = assessment['risk_score']
-        if score >= 80:
-            risk_distribution['critical'] += 1
-        elif score >= 60:
-            risk_distribution['high'] += 1
-        elif score >= 40:
-            risk_distribution['moderate'] += 1
-        else:
-            risk_distribution['low'] += 1
-    
-    # ASA Score Distribution
-    asa_distribution = list(presurgery_forms
-        .values('estado_fisico_asa')
-        .annotate(count=Count('estado_fisico_asa'))
-        .order_by('estado_fisico_asa'))
-    
-    # Mallampati Distribution
-    mallampati_distribution = list(presurgery_forms
-        .values('mallampati')
-        .annotate(count=Count('mallampati'))
-        .order_by('mallampati'))
+    for form in with_current_risk(
+        presurgery_forms.with_risk_score().filter(current_risk_score__gte=40).order_by('-current_risk_score')
+    ):
+        if form.risk_score >= 70:  # Critical risk
+            high_risk_alerts.append(generate_critical_alert(form, form.risk_score, form.risk_factors))
+            if len(critical_patients) < 5:
+                critical_patients.append(build_risk_assessment(form))
+        else:  # High risk
+            high_risk_alerts.append(generate_high_risk_alert(form, form.risk_score, form.risk_factors))
     
     # Monthly Surgery Trends
-    monthly_surgeries = list(presurgery_forms
-        .annotate(month=TruncMonth('fecha_reporte'))
+    monthly_surgeries = list(doctor_stats
+        .filter(surgeries__gt=0)
+        .annotate(month=TruncMonth('day'))
         .values('month')
-        .annotate(count=Count('folio_hospitalizacion'))
+        .annotate(count=Sum('surgeries'))
         .order_by('month'))
     
-    # BMI Distribution and Analysis
-    bmi_stats = calculate_bmi_distribution(presurgery_forms)
-    
-    # Age Distribution
-    age_distribution = calculate_age_distribution(user_patients)
-    
-    # Complications Analysis
-    complications_data = analyze_complications(postsurgery_forms)
-    
-    # Intubation Success Analysis
-    intubation_data = analyze_intubation_outcomes(postsurgery_forms)
-    
     # Recent Activity Feed
     recent_activity = get_recent_activity(request.user, limit=10)
     
     # Performance Metrics
-    performance_metrics = calculate_performance_metrics(
-        presurgery_forms, postsurgery_forms, risk_assessments
-    )
+    performance_metrics = calculate_performance_metrics(presurgery_stats, postsurgery_stats)
     
     # Upcoming Scheduled Procedures (if fecha_reporte is in future)
     upcoming_procedures = presurgery_forms.filter(
@@ -679,27 +595,27 @@ def dashboard(request):
         'patients_this_month': patients_this_month,
         
         # Risk Assessment Data
-        'risk_assessments': risk_assessments[:10],  # Latest 10
+        'risk_assessments': risk_assessments,  # Latest 10
         'high_risk_alerts': high_risk_alerts,
-        'critical_patients': critical_patients[:5],  # Top 5 critical
-        'risk_distribution': json.dumps(risk_distribution),
-        'total_risk_assessments': len(risk_assessments),
+        'critical_patients': critical_patients,  # Top 5 critical
+        'risk_distribution': json.dumps(presurgery_stats['risk_distribution']),
+        'total_risk_assessments': total_surgeries,
         
         # Chart Data
-        'asa_distribution': json.dumps(asa_distribution),
-        'mallampati_data': json.dumps(mallampati_distribution),
+        'asa_distribution': json.dumps(presurgery_stats['asa_distribution']),
+        'mallampati_data': json.dumps(presurgery_stats['mallampati_distribution']),
         'monthly_surgeries': json.dumps([{
             'month': d['month'].strftime('%Y-%m-%d') if d['month'] else None,
             'count': d['count']
         } for d in monthly_surgeries]),
-        'bmi_distribution': json.dumps(bmi_stats['distribution']),
-        'age_distribution': json.dumps(age_distribution),
+        'bmi_distribution': json.dumps(presurgery_stats['bmi']['distribution']),
+        'age_distribution': json.dumps(patient_stats['age_distribution']),
         
         # Analysis Data
-        'complications_data': complications_data,
-        'intubation_data': intubation_data,
+        'complications_data': postsurgery_stats['complications'],
+        'intubation_data': postsurgery_stats['intubation'],
         'performance_metrics': performance_metrics,
-        'bmi_stats': bmi_stats,
+        'bmi_stats': presurgery_stats['bmi'],
         
         # Activity Data
         'recent_activity': recent_activity,
@@ -713,6 +629,36 @@ def dashboard(request):
     
     return render(request, 'dashboard.html', context)
 
+def with_current_risk(forms):
+    """
+    The forms with their risk columns as the active risk model scores them.
+    Rows stored under an older version are rescored in memory only: GET views
+    (some served from the replica) never write, backfill_risk_scores persists them.
+    """
+    version = get_risk_model().version
+    forms = list(forms)
+    for form in forms:
+        if form.risk_version != version:
+            for field, value in form.compute_risk().items():
+                setattr(form, field, value)
+    return forms
+
+def build_risk_assessment(form):
+    """Build the dashboard risk card for a form from its persisted risk columns"""
+    risk_level = get_risk_model().level(form.risk_score)
+    return {
+        'form': form,
+        'patient_name': f"{form.nombres} {form.apellidos}",
+        'folio': form.folio_hospitalizacion,
+        'risk_score': form.risk_score,
+        'risk_level': form.risk_level,
+        'risk_color': risk_level['color'],
+        'risk_factors': form.risk_factors,
+        'recommendations': risk_level['recommendations'],
+        'has_post_surgery': hasattr(form, 'post_surgery_form'),
+        'fecha_reporte': form.fecha_reporte
+    }
+
 def generate_critical_alert(form, risk_score, risk_factors):
     """Generate critical risk alert"""
     return {
@@ -761,158 +707,6 @@ def generate_high_risk_alert(form, risk_score, risk_factors):
         'icon': 'fas fa-exclamation-circle'
     }
 
-def calculate_bmi_distribution(forms):
-    """Calculate BMI distribution and statistics"""
-    distribution = {
-        'underweight': forms.filter(imc__lt=18.5).count(),
-        'normal': forms.filter(imc__range=(18.5, 24.9)).count(),
-        'overweight': forms.filter(imc__range=(25, 29.9)).count(),
-        'obese_class_1': forms.filter(imc__range=(30, 34.9)).count(),
-        'obese_class_2': forms.filter(imc__range=(35, 39.9)).count(),
-        'obese_class_3': forms.filter(imc__gte=40).count()
-    }
-    
-    # Calculate statistics
-    bmi_values = forms.exclude(imc__isnull=True).values_list('imc', flat=True)
-    if bmi_values:
-        avg_bmi = sum(bmi_values) / len(bmi_values)
-        high_bmi_patients = forms.filter(imc__gte=35).count()
-        obesity_rate = (distribution['obese_class_1'] + distribution['obese_class_2'] + 
-                       distribution['obese_class_3']) / max(len(bmi_values), 1) * 100
-    else:
-        avg_bmi = 0
-        high_bmi_patients = 0
-        obesity_rate = 0
-    
-    return {
-        'distribution': distribution,
-        'average_bmi': round(avg_bmi, 1),
-        'high_bmi_patients': high_bmi_patients,
-        'obesity_rate': round(obesity_rate, 1)
-    }
-
-def calculate_age_distribution(patients):
-    """Calculate age distribution"""
-    distribution = {
-        'pediatric': 0,    # 0-17
-        'young_adult': 0,  # 18-39
-        'middle_age': 0,   # 40-64
-        'elderly': 0       # 65+
-    }
-    
-    today = datetime.now().date()
-    
-    for patient in patients:
-        age = (today - patient.fecha_nacimiento).days // 365
-        if age < 18:
-            distribution['pediatric'] += 1
-        elif age < 40:
-            distribution['young_adult'] += 1
-        elif age < 65:
-            distribution['middle_age'] += 1
-        else:
-            distribution['elderly'] += 1
-    
-    return distribution
-
-def analyze_complications(postsurgery_forms):
-    """Analyze complications and outcomes"""
-    total_surgeries = postsurgery_forms.count()
-    
-    if total_surgeries == 0:
-        return {
-            'total_surgeries': 0,
-            'with_complications': 0,
-            'with_morbidity': 0,
-            'with_mortality': 0,
-            'complications_percentage': 0,
-            'morbidity_percentage': 0,
-            'mortality_percentage': 0,
-            'common_complications': []
-        }
-    
-    with_complications = postsurgery_forms.filter(
-        Q(complicaciones__isnull=False) & ~Q(complicaciones='')
-    ).count()
-    
-    with_morbidity = postsurgery_forms.filter(morbilidad=True).count()
-    with_mortality = postsurgery_forms.filter(mortalidad=True).count()
-    
-    # Analyze common complications
-    complications_text = postsurgery_forms.exclude(
-        Q(complicaciones__isnull=True) | Q(complicaciones='')
-    ).values_list('complicaciones', flat=True)
-    
-    # Simple keyword analysis for common complications
-    common_complications = analyze_complication_keywords(complications_text)
-    
-    return {
-        'total_surgeries': total_surgeries,
-        'with_complications': with_complications,
-        'with_morbidity': with_morbidity,
-        'with_mortality': with_mortality,
-        'complications_percentage': round((with_complications / total_surgeries) * 100, 1),
-        'morbidity_percentage': round((with_morbidity / total_surgeries) * 100, 1),
-        'mortality_percentage': round((with_mortality / total_surgeries) * 100, 1),
-        'common_complications': common_complications
-    }
-
-def analyze_complication_keywords(complications_text):
-    """Analyze complications text for common keywords"""
-    keywords = {
-        'intubación difícil': 0,
-        'broncoaspiración': 0,
-        'hipoxemia': 0,
-        'laringoespasmo': 0,
-        'traumatismo dental': 0,
-        'esofágica': 0,
-        'neumotórax': 0
-    }
-    
-    for text in complications_text:
-        text_lower = text.lower()
-        for keyword in keywords:
-            if keyword in text_lower:
-                keywords[keyword] += 1
-    
-    # Return top 5 complications
-    sorted_complications = sorted(keywords.items(), key=lambda x: x[1], reverse=True)
-    return [{'complication': k, 'count': v} for k, v in sorted_complications[:5] if v > 0]
-
-def analyze_intubation_outcomes(postsurgery_forms):
-    """Analyze intubation success rates and attempts"""
-    total_intubations = postsurgery_forms.count()
-    
-    if total_intubations == 0:
-        return {
-            'total_attempts': 0,
-            'first_attempt': 0,
-            'multiple_attempts': 0,
-            'success_rate': 0,
-            'average_attempts': 0,
-            'difficult_intubations': 0
-        }
-    
-    first_attempt = postsurgery_forms.filter(numero_intentos=1).count()
-    multiple_attempts = postsurgery_forms.filter(numero_intentos__gt=1).count()
-    difficult_intubations = postsurgery_forms.filter(numero_intentos__gte=3).count()
-    
-    # Calculate average attempts
-    attempts_data = postsurgery_forms.exclude(
-        numero_intentos__isnull=True
-    ).values_list('numero_intentos', flat=True)
-    
-    average_attempts = sum(attempts_data) / len(attempts_data) if attempts_data else 0
-    
-    return {
-        'total_attempts': total_intubations,
-        'first_attempt': first_attempt,
-        'multiple_attempts': multiple_attempts,
-        'success_rate': round((first_attempt / total_intubations) * 100, 1),
-        'average_attempts': round(average_attempts, 1),
-        'difficult_intubations': difficult_intubations
-    }
-
 def get_recent_activity(user, limit=10):
     """Get recent activity for the user"""
     activities = []
@@ -934,7 +728,7 @@ def get_recent_activity(user, limit=10):
     
     # Recent forms
     recent_forms = PreSurgeryForm.objects.filter(
-        medico=user.get_full_name()
+        medico_user=user
     ).order_by('-fecha_reporte')[:limit//2]
     
     for form in recent_forms:
@@ -951,9 +745,9 @@ def get_recent_activity(user, limit=10):
     activities.sort(key=lambda x: x['timestamp'], reverse=True)
     return activities[:limit]
 
-def calculate_performance_metrics(presurgery_forms, postsurgery_forms, risk_assessments):
+def calculate_performance_metrics(presurgery_stats, postsurgery_stats):
     """Calculate performance metrics for the doctor"""
-    total_cases = len(risk_assessments)
+    total_cases = presurgery_stats['total']
     
     if total_cases == 0:
         return {
@@ -964,63 +758,53 @@ def calculate_performance_metrics(presurgery_forms, postsurgery_forms, risk_asse
             'improvement_suggestions': []
         }
     
-    # Calculate average risk score
-    total_risk = sum(assessment['risk_score'] for assessment in risk_assessments)
-    average_risk_score = total_risk / total_cases
-    
-    # Count high risk cases
-    high_risk_cases = len([a for a in risk_assessments if a['risk_score'] >= 60])
+    # High risk cases are those scoring 60 or more
+    risk_distribution = presurgery_stats['risk_distribution']
+    high_risk_cases = risk_distribution['high'] + risk_distribution['critical']
     
-    # Calculate successful outcomes (completed surgeries without major complications)
-    successful_outcomes = postsurgery_forms.filter(
-        Q(complicaciones__isnull=True) | Q(complicaciones=''),
-        morbilidad=False,
-        mortalidad=False
-    ).count()
+    # Successful outcomes (completed surgeries without major complications)
+    successful_outcomes = postsurgery_stats['successful_outcomes']
     
     # Generate improvement suggestions
     improvement_suggestions = generate_improvement_suggestions(
-        risk_assessments, postsurgery_forms
+        presurgery_stats, postsurgery_stats
     )
     
     return {
         'total_cases': total_cases,
-        'average_risk_score': round(average_risk_score, 1),
+        'average_risk_score': round(presurgery_stats['average_risk_score'], 1),
         'high_risk_cases': high_risk_cases,
         'successful_outcomes': successful_outcomes,
-        'success_rate': round((successful_outcomes / max(postsurgery_forms.count(), 1)) * 100, 1),
+        'success_rate': round((successful_outcomes / max(postsurgery_stats['total'], 1)) * 100, 1),
         'improvement_suggestions': improvement_suggestions
     }
 
-def generate_improvement_suggestions(risk_assessments, postsurgery_forms):
+def generate_improvement_suggestions(presurgery_stats, postsurgery_stats):
     """Generate personalized improvement suggestions"""
     suggestions = []
     
     # Analyze patterns
-    high_mallampati_cases = len([a for a in risk_assessments 
-                                if hasattr(a['form'], 'mallampati') and a['form'].mallampati >= 3])
-    
-    high_asa_cases = len([a for a in risk_assessments 
-                         if hasattr(a['form'], 'estado_fisico_asa') and a['form'].estado_fisico_asa >= 4])
-    
-    multiple_attempts = postsurgery_forms.filter(numero_intentos__gt=1).count()
+    total_cases = presurgery_stats['total']
+    high_mallampati_cases = presurgery_stats['high_mallampati']
+    high_asa_cases = presurgery_stats['high_asa']
+    multiple_attempts = postsurgery_stats['multiple_attempts']
     
     # Generate suggestions based on patterns
-    if high_mallampati_cases > len(risk_assessments) * 0.3:
+    if high_mallampati_cases > total_cases * 0.3:
         suggestions.append({
             'title': 'Evaluación de Vía Aérea',
             'description': 'Considere usar videolaringoscopía más frecuentemente en casos Mallampati III-IV',
             'priority': 'high'
         })
     
-    if high_asa_cases > len(risk_assessments) * 0.2:
+    if high_asa_cases > total_cases * 0.2:
         suggestions.append({
             'title': 'Pacientes ASA Alto Riesgo',
             'description': 'Implemente protocolos de pre-oxigenación extendida para pacientes ASA IV-V',
             'priority': 'medium'
         })
     
-    if multiple_attempts > postsurgery_forms.count() * 0.15:
+    if multiple_attempts > postsurgery_stats['total'] * 0.15:
         suggestions.append({
             'title': 'Tasa de Intubación',
             'description': 'Revise técnicas de intubación - tasa de múltiples intentos superior al promedio',
@@ -1029,154 +813,196 @@ def generate_improvement_suggestions(risk_assessments, postsurgery_forms):
     
     return suggestions[:3]  # Return top 3 suggestions
 
+def dashboard_stats_etag(request):
+    try:
+        date_range = int(request.GET.get('date_range', '30'))
+    except ValueError:
+        return None
+    return dashboard_cache.etag('stats', request.user, date_range)
+
+def alert_page_params(request):
+    """(limit, offset) of an alerts request; no limit returns every alert"""
+    try:
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+        offset = int(request.GET.get('offset', '0'))
+    except ValueError:
+        return None
+    if (limit is not None and limit < 1) or offset < 0:
+        return None
+    return limit, offset
+
+def patient_alerts_etag(request):
+    params = alert_page_params(request)
+    if params is None:
+        return None
+    return dashboard_cache.etag('alerts', request.user, *params)
+
+# Polled endpoints: clients revalidate with If-None-Match and get a bodyless 304
+# while the doctor's data version (stored in the database, shared by every
+# worker) is unchanged
 @login_required
+@analytics_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=dashboard_stats_etag)
 def get_dashboard_stats(request):
     """API endpoint for real-time dashboard statistics"""
     try:
-        date_range = request.GET.get('date_range', '30')
-        start_date = datetime.now() - timedelta(days=int(date_range))
-        
-        # Get filtered data
-        user_patients = Patient.objects.filter(medico=request.user, activo=True)
-        presurgery_forms = PreSurgeryForm.objects.filter(
-            medico=request.user.get_full_name(),
-            fecha_reporte__gte=start_date.date()
-        )
-        postsurgery_forms = PostDuringSurgeryForm.objects.filter(
-            folio_hospitalizacion__in=presurgery_forms.values('folio_hospitalizacion')
-        )
-
-        # Calculate real-time risk assessments
-        current_alerts = []
-        risk_summary = {'low': 0, 'moderate': 0, 'high': 0, 'critical': 0}
-        
-        for form in presurgery_forms:
-            try:
-                risk_score, risk_factors = RiskCalculator.calculate_airway_risk(form)
-                
-                if risk_score >= 80:
-                    risk_summary['critical'] += 1
-                    current_alerts.append({
-                        'severity': 'CRITICAL',
-                        'patient': f"{form.nombres} {form.apellidos}",
-                        'risk_score': risk_score,
-                        'factors': risk_factors[:3]  # Top 3 factors
-                    })
-                elif risk_score >= 60:
-                    risk_summary['high'] += 1
-                elif risk_score >= 40:
-                    risk_summary['moderate'] += 1
-                else:
-                    risk_summary['low'] += 1
-                    
-            except Exception:
-                continue
-
-        stats = {
-            'summary': {
-                'total_patients': user_patients.count(),
-                'active_patients': user_patients.filter(
-                    fecha_registro__gte=start_date
-                ).count(),
-                'surgeries_completed': postsurgery_forms.count(),
-                'pending_surgeries': presurgery_forms.filter(
-                    folio_hospitalizacion__in=presurgery_forms.exclude(
-                        folio_hospitalizacion__in=postsurgery_forms.values(
-                            'folio_hospitalizacion__folio_hospitalizacion'
-                        )
-                    ).values('folio_hospitalizacion')
-                ).count()
-            },
-            
-            'risk_summary': risk_summary,
-            'current_alerts': current_alerts[:5],  # Top 5 alerts
-            
-            'asa_distribution': [
-                {
-                    'estado_fisico_asa': item['estado_fisico_asa'],
-                    'count': item['count']
-                }
-                for item in presurgery_forms.values('estado_fisico_asa')
-                .annotate(count=Count('estado_fisico_asa'))
-                .order_by('estado_fisico_asa')
-            ],
-            
-            'recent_surgeries': [
-                {
-                    'week': item['week'].strftime('%Y-%m-%d') if item['week'] else None,
-                    'count': item['count']
-                }
-                for item in presurgery_forms
-                .annotate(week=TruncWeek('fecha_reporte'))
-                .values('week')
-                .annotate(count=Count('folio_hospitalizacion'))
-                .order_by('week')
-            ],
-            
-            'complications_summary': {
-                'total_completed': postsurgery_forms.count(),
-                'with_complications': postsurgery_forms.filter(
-                    Q(complicaciones__isnull=False) & ~Q(complicaciones='')
-                ).count(),
-                'morbidity_cases': postsurgery_forms.filter(morbilidad=True).count(),
-                'mortality_cases': postsurgery_forms.filter(mortalidad=True).count()
-            },
-            
-            'intubation_metrics': {
-                'first_attempt_success': postsurgery_forms.filter(numero_intentos=1).count(),
-                'multiple_attempts': postsurgery_forms.filter(numero_intentos__gt=1).count(),
-                'difficult_cases': postsurgery_forms.filter(numero_intentos__gte=3).count()
-            }
-        }
-        
+        date_range = int(request.GET.get('date_range', '30'))
+        stats = dashboard_cache.get_or_build('stats', request.user, build_dashboard_stats, date_range)
         return JsonResponse(stats)
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-@login_required
-def get_patient_alerts(request):
-    """API endpoint for getting current patient alerts"""
-    try:
-        presurgery_forms = PreSurgeryForm.objects.filter(
-            medico=request.user.get_full_name()
+def build_dashboard_stats(user, date_range):
+    """Compute the get_dashboard_stats payload for the last ``date_range`` days"""
+    start_date = timezone.now() - timedelta(days=date_range)
+    
+    # Get filtered data
+    presurgery_forms = PreSurgeryForm.objects.filter(
+        medico_user=user,
+        fecha_reporte__gte=start_date.date()
+    )
+
+    # Counters come from the per-day rollup: all-time patients, windowed cases
+    doctor_stats = DoctorStats.objects.filter(medico=user)
+    window_stats = doctor_stats.filter(day__gte=start_date.date())
+    total_patients = doctor_stats.aggregate(total=Sum('patients', default=0))['total']
+    rollup = summarize_doctor_stats(window_stats, DoctorStats.counter_fields())
+    patient_stats = {'total': total_patients, 'registered_since': rollup['patients']['total']}
+    presurgery_stats = rollup['presurgery']
+    postsurgery_stats = rollup['postsurgery']
+    complications = postsurgery_stats['complications']
+    intubation = postsurgery_stats['intubation']
+    
+    current_alerts = [
+        {
+            'severity': 'CRITICAL',
+            'patient': f"{form.nombres} {form.apellidos}",
+            'risk_score': form.risk_score,
+            'factors': form.risk_factors[:3]  # Top 3 factors
+        }
+        for form in with_current_risk(
+            presurgery_forms.with_risk_score().filter(current_risk_score__gte=80).order_by('-current_risk_score')[:5]
         )
+    ]
+
+    stats = {
+        'summary': {
+            'total_patients': patient_stats['total'],
+            'active_patients': patient_stats['registered_since'],
+            'surgeries_completed': postsurgery_stats['total'],
+            'pending_surgeries': presurgery_stats['total'] - postsurgery_stats['total']
+        },
         
-        alerts = []
+        'risk_summary': presurgery_stats['risk_distribution'],
+        'current_alerts': current_alerts,  # Top 5 alerts
         
-        for form in presurgery_forms:
-            try:
-                risk_score, risk_factors = RiskCalculator.calculate_airway_risk(form)
-                
-                if risk_score >= 70:  # High risk threshold
-                    alert = {
-                        'id': f"alert_{form.folio_hospitalizacion}",
-                        'severity': 'CRITICAL' if risk_score >= 80 else 'HIGH',
-                        'patient_name': f"{form.nombres} {form.apellidos}",
-                        'folio': form.folio_hospitalizacion,
-                        'risk_score': risk_score,
-                        'risk_factors': risk_factors,
-                        'timestamp': timezone.now().isoformat(),
-                        'has_post_surgery': hasattr(form, 'post_surgery_form')
-                    }
-                    alerts.append(alert)
-                    
-            except Exception as e:
-                continue
+        'asa_distribution': presurgery_stats['asa_distribution'],
         
-        # Sort by risk score (highest first)
-        alerts.sort(key=lambda x: x['risk_score'], reverse=True)
+        'recent_surgeries': [
+            {
+                'week': item['week'].strftime('%Y-%m-%d') if item['week'] else None,
+                'count': item['count']
+            }
+            for item in window_stats
+            .filter(surgeries__gt=0)
+            .annotate(week=TruncWeek('day'))
+            .values('week')
+            .annotate(count=Sum('surgeries'))
+            .order_by('week')
+        ],
         
-        return JsonResponse({
-            'alerts': alerts,
-            'total_alerts': len(alerts),
-            'critical_count': len([a for a in alerts if a['severity'] == 'CRITICAL']),
-            'high_count': len([a for a in alerts if a['severity'] == 'HIGH'])
-        })
+        'complications_summary': {
+            'total_completed': postsurgery_stats['total'],
+            'with_complications': complications['with_complications'],
+            'morbidity_cases': complications['with_morbidity'],
+            'mortality_cases': complications['with_mortality']
+        },
+        
+        'intubation_metrics': {
+            'first_attempt_success': intubation['first_attempt'],
+            'multiple_attempts': intubation['multiple_attempts'],
+            'difficult_cases': intubation['difficult_intubations']
+        }
+    }
+    
+    return stats
+
+@login_required
+@analytics_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=patient_alerts_etag)
+def get_patient_alerts(request):
+    """
+    API endpoint for getting current patient alerts, highest risk first;
+    ``limit`` and ``offset`` page through them
+    """
+    params = alert_page_params(request)
+    if params is None:
+        return JsonResponse({'error': 'limit y offset deben ser enteros positivos'}, status=400)
+    try:
+        return JsonResponse(dashboard_cache.get_or_build('alerts', request.user, build_patient_alerts, *params))
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+def build_patient_alerts(user, limit=None, offset=0):
+    """Compute the get_patient_alerts payload"""
+    # Read first: the dashboard opens its event stream after this id, so a save
+    # racing the queries below is replayed rather than lost
+    last_event_id = AlertEvent.objects.filter(medico=user).aggregate(last=Max('id'))['last'] or 0
+
+    # Scored by the database, so filtering, ordering and paging need no stale-row refresh
+    alerted = PreSurgeryForm.objects.filter(
+        medico_user=user
+    ).with_risk_score().filter(current_risk_score__gte=HIGH_ALERT_SCORE)
+    counts = alerted.aggregate(
+        total=Count('pk'),
+        critical=Count('pk', filter=Q(current_risk_score__gte=CRITICAL_ALERT_SCORE)),
+    )
+    
+    # High risk threshold, sorted by risk score (highest first)
+    page = alerted.select_related('post_surgery_form').order_by('-current_risk_score', 'pk')
+    page = page[offset:offset + limit] if limit is not None else page[offset:]
+    timestamp = timezone.now().isoformat()
+    alerts = [alert_payload(form, timestamp) for form in with_current_risk(page)]
+    
+    return {
+        'alerts': alerts,
+        'total_alerts': counts['total'],
+        'critical_count': counts['critical'],
+        'high_count': counts['total'] - counts['critical'],
+        'last_event_id': last_event_id,
+    }
+
+@login_required
+async def alert_stream(request):
+    """Server-Sent Events stream of the doctor's alert changes (ASGI only)"""
+    if not isinstance(request, ASGIRequest):
+        # An endless response would hold a WSGI worker; 204 tells EventSource to
+        # stop reconnecting and the dashboard falls back to polling
+        return HttpResponse(status=204)
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.GET['last_event_id'])
+    except (KeyError, ValueError):
+        last_event_id = None
+
+    user = await request.auser()
+    response = StreamingHttpResponse(
+        alert_event_stream(user.pk, last_event_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
+    return response
+
+@staff_member_required
+def get_dashboard_cache_stats(request):
+    """API endpoint exposing the dashboard cache and risk memo hit and miss counters"""
+    return JsonResponse({**dashboard_cache.cache_stats(), 'risk_memo': risk_memo_stats()})
+
 @login_required 
 def dismiss_alert(request, alert_id):
     """API endpoint to dismiss an alert"""
@@ -1191,124 +1017,88 @@ def dismiss_alert(request, alert_id):
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 @login_required
+@analytics_view
 def export_dashboard(request):
-    """Export dashboard data to Excel"""
+    """Export dashboard data to Excel; ``?cases=1`` adds a sheet with every case"""
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Dashboard Export"
-
-        # Styling
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="2B4570", end_color="2B4570", fill_type="solid")
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-
-        # Patient Summary
-        ws.append(["Resumen de Pacientes"])
-        ws.append(["Fecha de Exportación", datetime.now().strftime("%Y-%m-%d %H:%M")])
-        ws.append([])
-
-        # Style headers
-        for cell in ws[1:1]:
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.border = border
-
-        # Add statistics sections
-        sections = [
-            ("Información General", get_general_stats(request.user)),
-            ("Estadísticas ASA", get_asa_stats(request.user)),
-            ("Complicaciones", get_complication_stats(request.user)),
-            ("Métricas de Vía Aérea", get_airway_stats(request.user))
-        ]
-
-        row = 4
-        for section_title, data in sections:
-            ws.append([section_title])
-            ws.merge_cells(f'A{row}:C{row}')
-            ws[f'A{row}'].font = header_font
-            ws[f'A{row}'].fill = header_fill
-            
-            row += 1
-            for key, value in data.items():
-                ws.append([key, value])
-            
-            row += 2
-
-        # Set column widths
-        ws.column_dimensions['A'].width = 35
-        ws.column_dimensions['B'].width = 20
-        ws.column_dimensions['C'].width = 20
+        # Built on disk by the write-only workbook and streamed back in chunks
+        output = tempfile.TemporaryFile()
+        write_dashboard_workbook(request.user, output, include_cases=request.GET.get('cases') == '1')
+        output.seek(0)
 
-        # Save to buffer
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-
-        # Return file
         return FileResponse(
-            buffer,
+            output,
             as_attachment=True,
-            filename=f'dashboard_export_{datetime.now().strftime("%Y%m%d")}.xlsx'
+            filename=f'dashboard_export_{timezone.localdate().strftime("%Y%m%d")}.xlsx'
         )
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-# Helper functions for export
-def get_general_stats(user):
-    return {
-        "Total Pacientes": Patient.objects.filter(medico=user, activo=True).count(),
-        "Cirugías Este Mes": PreSurgeryForm.objects.filter(
-            medico=user.get_full_name(),
-            fecha_reporte__month=datetime.now().month
-        ).count(),
-        "Pacientes de Alto Riesgo": PreSurgeryForm.objects.filter(
-            medico=user.get_full_name(),
-            estado_fisico_asa__gte=4
-        ).count()
-    }
+@login_required
+@require_POST
+def create_export_job(request):
+    """
+    Queue a background export (``format`` xlsx, csv or parquet; ``cases=1`` adds
+    the per-case sheet to xlsx). An identical request still in progress is reused.
+    """
+    try:
+        job, created = request_export(
+            request.user, request.POST.get('format', 'xlsx'), include_cases=request.POST.get('cases') == '1'
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(export_job_payload(job), status=202 if created else 200)
 
-def get_asa_stats(user):
-    return dict(PreSurgeryForm.objects.filter(
-        medico=user.get_full_name()
-    ).values('estado_fisico_asa').annotate(
-        count=Count('estado_fisico_asa')
-    ).values_list('estado_fisico_asa', 'count'))
+@login_required
+def export_job_status(request, pk):
+    """Progress of an export job, polled by the client until it is done or failed"""
+    job = get_object_or_404(ExportJob, pk=pk, medico=request.user)
+    return JsonResponse(export_job_payload(job))
 
-def get_complication_stats(user):
-    postsurgery_forms = PostDuringSurgeryForm.objects.filter(
-        nombre_anestesiologo=user.get_full_name()
-    )
-    total = postsurgery_forms.count() or 1
-    complications = postsurgery_forms.filter(
-        complicaciones__isnull=False
-    ).exclude(complicaciones='').count()
-    
-    return {
-        "Total Cirugías": total,
-        "Cirugías con Complicaciones": complications,
-        "Tasa de Complicaciones": f"{(complications/total)*100:.2f}%"
-    }
+@login_required
+def export_job_download(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, medico=request.user, status=ExportJob.STATUS_DONE)
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
 
-def get_airway_stats(user):
-    presurgery_forms = PreSurgeryForm.objects.filter(
-        medico=user.get_full_name()
+@login_required
+@analytics_view
+def clinical_snapshot(request):
+    """
+    Columnar snapshot of the clinical dataset (``format`` parquet or arrow).
+    Staff get every doctor's cases; ``since`` (ISO datetime) keeps only the rows
+    changed after it, and the response header carries the next high-water mark.
+    Changes younger than snapshot_lag() are left for the next request, as their
+    transactions may not all have committed.
+    """
+    if not parquet_available():
+        return JsonResponse({'error': 'pyarrow no está instalado'}, status=501)
+
+    snapshot_format = request.GET.get('format', 'parquet')
+    if snapshot_format not in FORMAT_EXTENSIONS:
+        return JsonResponse({'error': f'Formato de snapshot no soportado: {snapshot_format}'}, status=400)
+    since = None
+    if request.GET.get('since'):
+        since = parse_datetime(request.GET['since'])
+        if since is None:
+            return JsonResponse({'error': 'since debe ser una fecha ISO 8601'}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    until = timezone.now() - snapshot_lag()
+    forms = snapshot_queryset(medico=None if request.user.is_staff else request.user, since=since, until=until)
+    output = tempfile.TemporaryFile()
+    rows = write_snapshot(output, forms, snapshot_format)
+    output.seek(0)
+
+    response = FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'clinical_snapshot_{timezone.localdate():%Y%m%d}.{FORMAT_EXTENSIONS[snapshot_format]}'
     )
-    return {
-        "Vía Aérea Difícil": presurgery_forms.filter(
-            Q(mallampati__gte=3) |
-            Q(patil_aldrete__gte=3)
-        ).count(),
-        "Mallampati Promedio": presurgery_forms.aggregate(
-            Avg('mallampati')
-        )['mallampati__avg']
-    }
+    response['X-Snapshot-Rows'] = str(rows)
+    response['X-Snapshot-High-Water-Mark'] = max(until, since or until).isoformat()
+    return response
 
 def calculate_average_age(patients):
     total_age = 0
@@ -1325,11 +1115,11 @@ def calculate_average_age(patients):
 
 @login_required
 def presurgery_detail(request, pk):
-    # Get the pre-surgery form
-    form = get_object_or_404(PreSurgeryForm, folio_hospitalizacion=pk)
-    
-    # Get the related patient
-    patient = get_object_or_404(Patient, folio_hospitalizacion=pk.replace('PRE-', ''))
+    # Get the pre-surgery form with its patient
+    form = get_object_or_404(
+        PreSurgeryForm.objects.select_related('patient'), folio_hospitalizacion=pk, patient__isnull=False
+    )
+    patient = form.patient
     
     # Check if user has permission to view this form
     if patient.medico != request.user and not request.user.is_staff:
@@ -1344,6 +1134,50 @@ def presurgery_detail(request, pk):
     return render(request, 'presurgery_detail.html', context)
 
 
+@login_required
+def presurgery_risk(request, pk):
+    """
+    Risk of a pre-surgery form under a registered risk model (``?model=``,
+    default the active one), computed from the form as it is now.
+    ``?detail=comprehensive`` adds the AdvancedRiskCalculator breakdown, memoized
+    on the form's inputs so polling an unchanged form does not recompute it.
+    """
+    form = get_object_or_404(
+        PreSurgeryForm.objects.select_related('patient'), folio_hospitalizacion=pk, patient__isnull=False
+    )
+    if form.patient.medico != request.user and not request.user.is_staff:
+        return JsonResponse({'error': 'No tienes permiso para ver este formulario.'}, status=403)
+
+    try:
+        model = get_risk_model(request.GET.get('model'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    risk_score, risk_factors = model.evaluate(form)
+    payload = {
+        'folio': form.folio_hospitalizacion,
+        'model': model.name,
+        'version': model.version,
+        'risk_score': risk_score,
+        'risk_factors': risk_factors,
+        **model.level(risk_score),
+    }
+    if request.GET.get('detail') == 'comprehensive':
+        _score, payload['comprehensive'] = AdvancedRiskCalculator.calculate_comprehensive_risk(form)
+    return JsonResponse(payload)
+
+
+def metrics(request):
+    """Request metrics in the Prometheus text format, for staff or a scraper holding METRICS_TOKEN"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    authorized = request.user.is_staff or (
+        token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    )
+    if not authorized:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # Add these error handlers to views.py
 def custom_404(request, exception):
     return render(request, 'errors/404.html', status=404)